@@ -0,0 +1,240 @@
+import os
+import numpy as np
+from similarity import normalize_rows
+
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 50000
+ASSIGN_BLOCK = 8192
+
+
+def _nearest_lists(matrix, centroids, count):
+    """Indexes of the `count` most similar centroids for every row, computed in blocks"""
+    count = min(count, len(centroids))
+    out = np.empty((len(matrix), count), dtype=np.int32)
+    for start in range(0, len(matrix), ASSIGN_BLOCK):
+        sims = matrix[start:start + ASSIGN_BLOCK] @ centroids.T
+        if count == 1:
+            out[start:start + ASSIGN_BLOCK, 0] = sims.argmax(axis=1)
+        else:
+            out[start:start + ASSIGN_BLOCK] = np.argpartition(-sims, count - 1, axis=1)[:, :count]
+    return out
+
+
+def train_centroids(matrix, nlist, iterations=KMEANS_ITERATIONS, sample_size=KMEANS_SAMPLE, seed=0):
+    """Spherical k-means on (a sample of) normalized rows"""
+    rng = np.random.default_rng(seed)
+    if len(matrix) > sample_size:
+        matrix = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+    nlist = max(1, min(nlist, len(matrix)))
+    centroids = matrix[rng.choice(len(matrix), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest_lists(matrix, centroids, 1)[:, 0]
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, matrix)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty lists with random points so every list stays useful
+            sums[empty] = matrix[rng.choice(len(matrix), int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file ANN index over L2-normalized embeddings.
+
+    Vectors are partitioned into `nlist` lists by spherical k-means; a query
+    only scans the `nprobe` lists whose centroids are closest to it. Larger
+    nprobe means higher recall and slower queries. Candidates are always
+    scored with the exact dot product, so returned similarities are exact.
+    """
+
+    def __init__(self, centroids, nprobe=DEFAULT_NPROBE):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        self.paths = []
+        self.vectors = np.zeros((0, self.centroids.shape[1]), dtype=np.float32)
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self._lists = None
+
+    @classmethod
+    def build(cls, paths, matrix, nlist=None, nprobe=DEFAULT_NPROBE):
+        """Train centroids on matrix and index every row"""
+        if nlist is None:
+            nlist = int(4 * np.sqrt(max(len(matrix), 1)))
+        index = cls(train_centroids(matrix, nlist), nprobe)
+        index.add(paths, matrix)
+        return index
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, paths, matrix):
+        """Insert new vectors without retraining the centroids"""
+        if not len(paths):
+            return
+        matrix = normalize_rows(matrix)
+        self.paths.extend(paths)
+        self.vectors = np.concatenate([self.vectors, matrix])
+        self.assignments = np.concatenate([self.assignments, _nearest_lists(matrix, self.centroids, 1)[:, 0]])
+        self._lists = None
+
+    def remove(self, paths):
+        """Drop vectors for the given paths"""
+        drop = set(paths)
+        keep = np.array([p not in drop for p in self.paths], dtype=bool)
+        if keep.all():
+            return
+        self.paths = [p for p, k in zip(self.paths, keep) if k]
+        self.vectors = self.vectors[keep]
+        self.assignments = self.assignments[keep]
+        self._lists = None
+
+    def sync(self, paths, matrix):
+        """Make the index hold exactly these paths/vectors, re-adding changed ones"""
+        wanted = dict(zip(paths, range(len(paths))))
+        stale = [p for p in self.paths if p not in wanted]
+        known = {p: i for i, p in enumerate(self.paths)}
+        common = [p for p in paths if p in known]
+        if common:
+            old = self.vectors[[known[p] for p in common]]
+            new = matrix[[wanted[p] for p in common]]
+            changed = np.any(np.abs(old - new) > 1e-6, axis=1)
+            stale.extend(p for p, c in zip(common, changed) if c)
+        self.remove(stale)
+        present = set(self.paths)
+        missing = [p for p in paths if p not in present]
+        if missing:
+            self.add(missing, matrix[[wanted[p] for p in missing]])
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.centroids))]
+        return self._lists
+
+    def radius_query(self, queries, threshold, nprobe=None):
+        """For each query row, return (row indexes, similarities) of indexed vectors above threshold"""
+        queries = normalize_rows(np.atleast_2d(queries))
+        probes = _nearest_lists(queries, self.centroids, nprobe or self.nprobe)
+        lists = self._inverted_lists()
+        results = []
+        for q, probe in zip(queries, probes):
+            rows = np.concatenate([lists[c] for c in probe])
+            sims = self.vectors[rows] @ q
+            hit = sims > threshold
+            results.append((rows[hit], sims[hit]))
+        return results
+
+    def similar_pairs(self, threshold, nprobe=None):
+        """Approximate self-join: pairs i < j of indexed vectors above threshold.
+
+        Queries are grouped by the lists they probe, so each list is scanned
+        with one matrix multiply against all the queries that visit it.
+        """
+        if not len(self):
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.float32)
+        probes = _nearest_lists(self.vectors, self.centroids, nprobe or self.nprobe)
+        lists = self._inverted_lists()
+        query_ids = np.repeat(np.arange(len(self.vectors)), probes.shape[1])
+        probe_ids = probes.reshape(-1)
+        order = np.argsort(probe_ids, kind="stable")
+        bounds = np.searchsorted(probe_ids[order], np.arange(len(self.centroids) + 1))
+
+        rows_out, cols_out, sims_out = [], [], []
+        for c in range(len(self.centroids)):
+            members = lists[c]
+            visitors = query_ids[order[bounds[c]:bounds[c + 1]]]
+            if not len(members) or not len(visitors):
+                continue
+            sims = self.vectors[visitors] @ self.vectors[members].T
+            r, k = np.nonzero(sims > threshold)
+            i, j = visitors[r], members[k]
+            keep = i != j
+            rows_out.append(np.minimum(i, j)[keep])
+            cols_out.append(np.maximum(i, j)[keep])
+            sims_out.append(sims[r, k][keep])
+        if not rows_out:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.float32)
+
+        rows = np.concatenate(rows_out).astype(np.int64)
+        cols = np.concatenate(cols_out).astype(np.int64)
+        sims = np.concatenate(sims_out)
+        # A pair can be found through several lists; keep one copy
+        _, first = np.unique(rows * len(self.vectors) + cols, return_index=True)
+        return rows[first], cols[first], sims[first]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            vectors=self.vectors,
+            assignments=self.assignments,
+            paths=np.array(self.paths, dtype=str),
+            nprobe=self.nprobe,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        index = cls(data["centroids"], int(data["nprobe"]))
+        index.paths = [str(p) for p in data["paths"]]
+        index.vectors = data["vectors"]
+        index.assignments = data["assignments"]
+        return index
+
+
+def load_or_build(index_path, paths, matrix, nprobe=DEFAULT_NPROBE):
+    """Load the saved index and sync it with paths/matrix, or build a new one"""
+    if os.path.exists(index_path):
+        index = IVFIndex.load(index_path)
+        index.nprobe = nprobe
+        if index.centroids.shape[1] == matrix.shape[1]:
+            index.sync(paths, matrix)
+            return index
+    return IVFIndex.build(paths, matrix, nprobe=nprobe)
+
+
+def measure_recall(index, threshold, nprobe=None, sample_size=1000, seed=0):
+    """Compare ANN pairs with exact cosine on a sample of query rows.
+
+    Returns a dict with recall, the number of exact and ANN pairs in the
+    sample, and the largest similarity error of the returned candidates.
+    """
+    n = len(index)
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(n, min(sample_size, n), replace=False)) if n else np.zeros(0, dtype=np.int64)
+    in_sample = np.zeros(n, dtype=bool)
+    in_sample[sample] = True
+
+    exact = set()
+    for start in range(0, len(sample), ASSIGN_BLOCK):
+        rows = sample[start:start + ASSIGN_BLOCK]
+        sims = index.vectors[rows] @ index.vectors.T
+        r, c = np.nonzero(sims > threshold)
+        exact.update((int(a), int(b)) for a, b in zip(rows[r], c) if a != b)
+
+    rows, cols, sims = index.similar_pairs(threshold, nprobe)
+    found = set()
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        for a, b in ((i, j), (j, i)):
+            if in_sample[a]:
+                found.add((a, b))
+    exact_sims = np.einsum("ij,ij->i", index.vectors[rows], index.vectors[cols])
+    max_error = float(np.abs(exact_sims - sims).max()) if len(sims) else 0.0
+
+    recall = len(exact & found) / len(exact) if exact else 1.0
+    return {
+        "recall": recall,
+        "exact_pairs": len(exact),
+        "ann_pairs": len(found),
+        "max_similarity_error": max_error,
+        "nprobe": nprobe or index.nprobe,
+    }
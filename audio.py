@@ -0,0 +1,161 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from subprocess_runner import run_command
+from probe import LazyProbe
+from metrics import Metrics
+
+AUDIO_RATE = 11025  # Hz; everything above ~5 kHz is dropped, as Chromaprint does
+AUDIO_SECONDS = 30  # Length of the excerpt, taken from the middle so shared intros and credits are skipped
+AUDIO_TIMEOUT = 20
+AUDIO_WORKERS = 4
+FINGERPRINT_VERSION = 1  # Bump when the hash changes; cached fingerprints of other versions are recomputed
+
+FRAME = 2048  # Samples per STFT frame
+HOP = FRAME // 3
+BANDS = 33  # Log-spaced bands between BAND_LOW and BAND_HIGH; neighbours give 32 bits per frame
+BAND_LOW = 300.0
+BAND_HIGH = 2000.0
+SILENCE_RMS = 1e-3  # Quieter excerpts carry no evidence either way
+MATCH_AGREEMENT = 0.7  # Bit agreement at which audio neither lifts nor lowers a pair
+MAX_SHIFT = 80  # Frames (~5 s) two excerpts may be offset by, e.g. after a trim
+MIN_OVERLAP = 64  # Frames two excerpts must overlap to be compared
+
+
+def audio_command(video_path, start, seconds=AUDIO_SECONDS, rate=AUDIO_RATE):
+    """ffmpeg decoding `seconds` of mono 16-bit PCM at `rate` from `start`"""
+    return [
+        "ffmpeg",
+        "-v", "error",
+        "-ss", f"{start:.3f}",
+        "-i", video_path,
+        "-t", str(seconds),
+        "-vn",
+        "-ac", "1",
+        "-ar", str(rate),
+        "-f", "s16le",
+        "-",
+    ]
+
+
+def excerpt_start(duration, seconds=AUDIO_SECONDS):
+    if not duration or duration <= seconds:
+        return 0.0
+    return duration / 2 - seconds / 2
+
+
+def decode_audio(video_path, duration=None, run=None):
+    """Mono float32 samples of the middle excerpt, or None when there is no audio"""
+    result = (run or run_command)(audio_command(video_path, excerpt_start(duration)), AUDIO_TIMEOUT)
+    if result.returncode != 0 or not result.stdout:
+        return None
+    return np.frombuffer(result.stdout[:len(result.stdout) // 2 * 2], dtype="<i2").astype(np.float32) / 32768.0
+
+
+def _band_index(rate=AUDIO_RATE):
+    freqs = np.fft.rfftfreq(FRAME, 1.0 / rate)
+    edges = np.geomspace(BAND_LOW, BAND_HIGH, BANDS + 1)
+    return np.searchsorted(edges, freqs, side="right") - 1
+
+
+def fingerprint(samples, rate=AUDIO_RATE):
+    """Chromaprint-style sub-fingerprints: one uint32 per STFT frame, or None for silence.
+
+    Bit m of frame n is the sign of how the energy difference between
+    bands m and m+1 changed since frame n-1. Signs of spectral slopes
+    survive re-encoding, resampling and volume changes, so copies of a
+    soundtrack agree on most bits and unrelated audio on about half.
+    """
+    if samples is None or len(samples) < 2 * FRAME or np.sqrt(np.mean(samples ** 2)) < SILENCE_RMS:
+        return None
+    count = 1 + (len(samples) - FRAME) // HOP
+    frames = np.lib.stride_tricks.as_strided(samples, shape=(count, FRAME),
+                                             strides=(samples.strides[0] * HOP, samples.strides[0]))
+    power = np.abs(np.fft.rfft(frames * np.hanning(FRAME).astype(np.float32), axis=1)) ** 2
+    band = _band_index(rate)
+    energy = np.stack([power[:, band == b].sum(axis=1) for b in range(BANDS)], axis=1)
+    slope = energy[:, :-1] - energy[:, 1:]
+    bits = (slope[1:] - slope[:-1]) > 0
+    return np.packbits(bits, axis=1, bitorder="little").view("<u4").ravel()
+
+
+def agreement(a, b, max_shift=MAX_SHIFT, min_overlap=MIN_OVERLAP):
+    """Best fraction of equal bits over the offsets the excerpts may be shifted by, or None"""
+    best = None
+    for shift in range(-max_shift, max_shift + 1):
+        x = a[shift:] if shift > 0 else a
+        y = b[-shift:] if shift < 0 else b
+        n = min(len(x), len(y))
+        if n < min_overlap:
+            continue
+        errors = np.unpackbits((x[:n] ^ y[:n]).view(np.uint8)).sum()
+        score = 1.0 - errors / (32.0 * n)
+        if best is None or score > best:
+            best = score
+    return best
+
+
+class AudioCheck:
+    """Re-scores visual pairs near the threshold with an audio fingerprint.
+
+    Pairs further than `margin` from the threshold keep their visual
+    similarity. The ones inside the band get
+    visual + weight * (bit agreement - match_agreement), so a shared
+    soundtrack lifts a pair over the threshold and different audio (two
+    episodes with the same intro and set) pushes it under. Fingerprints
+    are cached in the store's metadata next to the probe results.
+    """
+
+    def __init__(self, margin, weight, match_agreement=MATCH_AGREEMENT, store=None, run=None, stats=None,
+                 workers=AUDIO_WORKERS):
+        self.margin = margin
+        self.weight = weight
+        self.match_agreement = match_agreement
+        self.store = store
+        self.run = run
+        self.stats = stats or Metrics()
+        self.workers = workers
+        self.metadata = LazyProbe(store, run, self.stats)
+        self._store_lock = threading.Lock()
+
+    def _fingerprint(self, path):
+        info = self.metadata.get(path) or {}
+        cached = info.get("audio")
+        if cached and cached.get("version") == FINGERPRINT_VERSION:
+            hashes = cached["hashes"]
+            return None if hashes is None else np.array(hashes, dtype=np.uint32)
+        with self.stats.timer("audio"):
+            hashes = fingerprint(decode_audio(path, info.get("duration"), self.run))
+        if info and self.store is not None:
+            info["audio"] = {"version": FINGERPRINT_VERSION, "hashes": None if hashes is None else hashes.tolist()}
+            with self._store_lock:
+                try:
+                    self.store.put_metadata(path, info)
+                except OSError:
+                    pass
+        return hashes
+
+    def fingerprints(self, paths):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            found = dict(zip(paths, pool.map(self._fingerprint, paths)))
+        if self.store is not None:
+            self.store.commit()
+        return found
+
+    def rescore(self, paths, rows, cols, sims, threshold):
+        """Filter (i, j, similarity) pairs found at threshold - margin down to the ones above threshold"""
+        sims = np.array(sims, dtype=np.float32)
+        near = np.nonzero(np.abs(sims - threshold) <= self.margin)[0]
+        if len(near):
+            needed = sorted({paths[i] for i in rows[near]} | {paths[j] for j in cols[near]})
+            hashes = self.fingerprints(needed)
+            for k in near:
+                a, b = hashes.get(paths[rows[k]]), hashes.get(paths[cols[k]])
+                score = agreement(a, b) if a is not None and b is not None else None
+                if score is None:
+                    self.stats.count("audio_no_evidence")
+                    continue
+                self.stats.count("audio_checked")
+                sims[k] = min(1.0, sims[k] + self.weight * (score - self.match_agreement))
+        keep = sims > threshold
+        return rows[keep], cols[keep], sims[keep]
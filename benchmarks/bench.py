@@ -0,0 +1,282 @@
+import os
+import sys
+import json
+import time
+import shutil
+import ctypes
+import argparse
+import platform
+import tempfile
+import subprocess
+from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import config
+import main as vdm
+import mover
+from pipeline import embed_videos
+from metrics import Metrics
+from probe import PROBE_WORKERS, probe_video
+from frames import extract_frames, extract_keyframes
+from benchmarks.corpus import generate, load_manifest
+
+STAGES = ["discover", "probe", "sampling", "embed", "match", "move"]
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of its finished children (ffmpeg), in MB"""
+    if sys.platform == "win32":
+        class Counters(ctypes.Structure):
+            _fields_ = [
+                ("cb", ctypes.c_ulong),
+                ("PageFaultCount", ctypes.c_ulong),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = Counters()
+        counters.cb = ctypes.sizeof(Counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb)
+        return {"self": round(counters.PeakWorkingSetSize / 2**20, 1), "children": None}
+    import resource
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    scale = 2**20 if sys.platform == "darwin" else 2**10
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def latency_summary(samples):
+    if not samples:
+        return None
+    ms = np.asarray(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "mean_ms": round(float(ms.mean()), 2),
+        "max_ms": round(float(ms.max()), 2),
+    }
+
+
+def stage_result(files, seconds, latencies=None, **extra):
+    return dict(
+        files=files,
+        seconds=round(seconds, 3),
+        files_per_second=round(files / seconds, 2) if seconds else None,
+        latency=latency_summary(latencies or []),
+        peak_rss_mb=peak_rss_mb(),
+        **extra,
+    )
+
+
+def timed(fn, latencies):
+    """Wrap fn so every call's wall time is appended to latencies"""
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+    return wrapper
+
+
+def bench_discover(corpus):
+    start = time.perf_counter()
+    files = vdm.find_videos([corpus])
+    return list(files), stage_result(len(files), time.perf_counter() - start)
+
+
+def bench_probe(paths):
+    """probe_videos without a cache, timed per file"""
+    latencies = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+        infos = list(pool.map(timed(probe_video, latencies), paths))
+    metadata = {path: info for path, info in zip(paths, infos) if info is not None}
+    return metadata, stage_result(len(paths), time.perf_counter() - start, latencies,
+                                  failed=len(paths) - len(metadata))
+
+
+def bench_sampling(paths, metadata):
+    """Decode time per file of the fixed-seek and keyframe strategies on the same sampling points"""
+    size = vdm.input_size()
+    per_file = []
+    for path in paths:
+        duration = (metadata.get(path) or {}).get("duration")
+        timings = {}
+        for name, extract in (("seek", extract_frames), ("keyframe", extract_keyframes)):
+            start = time.perf_counter()
+            frames, _ = extract(path, size, config.SIGNATURE_FRAMES, duration)
+            timings[name] = (time.perf_counter() - start, frames is not None)
+        per_file.append({
+            "path": path,
+            "seek_seconds": round(timings["seek"][0], 4),
+            "keyframe_seconds": round(timings["keyframe"][0], 4),
+            "saved_seconds": round(timings["seek"][0] - timings["keyframe"][0], 4),
+            "decoded": {name: ok for name, (_, ok) in timings.items()},
+        })
+    seek = sum(f["seek_seconds"] for f in per_file)
+    keyframe = sum(f["keyframe_seconds"] for f in per_file)
+    return stage_result(len(paths), keyframe, [f["keyframe_seconds"] for f in per_file],
+                        seek_seconds=round(seek, 3), saved_seconds=round(seek - keyframe, 3),
+                        speedup=round(seek / keyframe, 2) if keyframe else None, per_file=per_file)
+
+
+def bench_embed(paths, metadata):
+    """The batched embedding pipeline; latency is per-file frame extraction"""
+    model, _, device = vdm.get_model()
+    latencies = []
+    failures = {}
+    stats = Metrics()
+    load = timed(lambda path: vdm.load_frame(path, metadata=metadata, failures=failures), latencies)
+    embeddings = {}
+    start = time.perf_counter()
+    for path, embedding in embed_videos(paths, load, model, vdm.frame_to_tensor, device,
+                                        batch_size=config.BATCH_SIZE, workers=config.EXTRACT_WORKERS,
+                                        stats=stats):
+        if embedding is not None:
+            embeddings[path] = embedding
+    return embeddings, stage_result(len(paths), time.perf_counter() - start, latencies,
+                                    failed=len(failures), stages=stats.report())
+
+
+def group_pairs(groups):
+    return {
+        tuple(sorted((os.path.abspath(a), os.path.abspath(b))))
+        for group in groups.values() if len(group) > 1
+        for a, b in combinations(group, 2)
+    }
+
+
+def precision_recall(groups, manifest, embedded):
+    """Pairwise precision/recall of the groups against the planted duplicates among embedded files"""
+    embedded = {os.path.abspath(p) for p in embedded}
+    by_group = {}
+    for path, group in manifest.items():
+        if path in embedded:
+            by_group.setdefault(group, []).append(path)
+    truth = {tuple(sorted(pair)) for members in by_group.values() for pair in combinations(members, 2)}
+    found = group_pairs(groups)
+    hits = len(truth & found)
+    return {
+        "true_pairs": len(truth),
+        "found_pairs": len(found),
+        "precision": round(hits / len(found), 4) if found else None,
+        "recall": round(hits / len(truth), 4) if truth else None,
+    }
+
+
+def bench_match(embeddings, manifest, threshold):
+    start = time.perf_counter()
+    groups = vdm.find_duplicates(embeddings, threshold)
+    seconds = time.perf_counter() - start
+    return groups, stage_result(len(embeddings), seconds, threshold=threshold,
+                                **precision_recall(groups, manifest, embeddings))
+
+
+def bench_move(groups, corpus):
+    """process_duplicates on a scratch copy of the corpus, so the corpus itself is kept"""
+    scratch = tempfile.mkdtemp(prefix="vdm-bench-")
+    try:
+        copy = os.path.join(scratch, "corpus")
+        shutil.copytree(corpus, copy)
+        root = os.path.abspath(corpus)
+        remapped = {
+            os.path.join(copy, os.path.relpath(rep, root)): [os.path.join(copy, os.path.relpath(p, root)) for p in group]
+            for rep, group in groups.items() if len(group) > 1
+        }
+        start = time.perf_counter()
+        plan = vdm.plan_duplicates(remapped, os.path.join(scratch, "duplicates"))
+        result = mover.execute(plan, os.path.join(scratch, "moves.jsonl"), config.COPY_WORKERS_PER_DEVICE)
+        methods = {method: sum(move.method == method for move in plan) for method in ("rename", "copy")}
+        return stage_result(result["moved"], time.perf_counter() - start, failed=len(result["failed"]), **methods)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(corpus, stages=STAGES, threshold=None):
+    """Run the selected stages over corpus; returns the results dict"""
+    threshold = threshold or config.SIMILARITY_THRESHOLD
+    manifest = load_manifest(corpus)
+    results = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {k: v for k, v in config.snapshot().items() if isinstance(v, (int, float, str, bool, type(None)))},
+        "corpus": {"path": os.path.abspath(corpus), "files": len(manifest),
+                   "originals": len(set(manifest.values()))},
+        "stages": {},
+    }
+    stages = set(stages)
+    paths, results["stages"]["discover"] = bench_discover(corpus)
+    metadata = {}
+    if stages & {"probe", "sampling", "embed", "match", "move"}:
+        metadata, results["stages"]["probe"] = bench_probe(paths)
+    if "sampling" in stages:
+        results["stages"]["sampling"] = bench_sampling(paths, metadata)
+    if stages & {"embed", "match", "move"}:
+        embeddings, results["stages"]["embed"] = bench_embed(paths, metadata)
+        if stages & {"match", "move"}:
+            groups, results["stages"]["match"] = bench_match(embeddings, manifest, threshold)
+            if "move" in stages:
+                results["stages"]["move"] = bench_move(groups, corpus)
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark discovery, probing, embedding, matching and moving.")
+    parser.add_argument("--corpus", default="bench_corpus", help="Corpus folder (generated if missing)")
+    parser.add_argument("--originals", type=int, default=40, help="Originals when generating the corpus")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES,
+                        help="Stages to run; later stages pull in the ones they need")
+    parser.add_argument("--threshold", type=float, help="Similarity threshold for the match stage")
+    parser.add_argument("--config", help="Config file applied before benchmarking")
+    parser.add_argument("--output", help="Results JSON (default: benchmarks/results/<time>.json)")
+    args = parser.parse_args(argv)
+
+    config.load_config(args.config)
+    if not os.path.exists(os.path.join(args.corpus, "manifest.json")):
+        print(f"Generating corpus in {args.corpus}...")
+        generate(args.corpus, args.originals)
+    results = run(args.corpus, args.stages, args.threshold)
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", time.strftime("%Y%m%d-%H%M%S") + ".json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    for stage, info in results["stages"].items():
+        latency = info["latency"] or {}
+        print(f"{stage:>8}: {info['files']} files @ {info['files_per_second']}/s"
+              f"  p50 {latency.get('p50_ms')}ms  p99 {latency.get('p99_ms')}ms")
+    sampling = results["stages"].get("sampling")
+    if sampling:
+        print(f"sampling: keyframe saved {sampling['saved_seconds']}s of {sampling['seek_seconds']}s fixed-seek decode"
+              f" ({sampling['speedup']}x)")
+    match = results["stages"].get("match")
+    if match:
+        print(f"   match: precision {match['precision']}  recall {match['recall']}")
+    print(f"Peak RSS {results['peak_rss_mb']} MB; results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
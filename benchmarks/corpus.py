@@ -0,0 +1,92 @@
+import os
+import json
+import random
+import argparse
+import subprocess
+
+# Visually distinct generators; {seed} makes each original different from its siblings
+SOURCES = [
+    "testsrc2=size={w}x{h}:rate=25,hue=h={seed}*37",
+    "mandelbrot=size={w}x{h}:rate=25:start_x=-{x}:start_y=0.{seed}",
+    "life=size={w}x{h}:rate=25:seed={seed}:mold=10:ratio=0.{ratio},scale={w}:{h}",
+    "cellauto=size={w}x{h}:rate=25:rule={rule}:seed={seed}",
+    "smptehdbars=size={w}x{h}:rate=25,noise=alls={noise}:allf=t,hue=h={seed}*53",
+    "rgbtestsrc=size={w}x{h}:rate=25,rotate=angle={seed}*0.1:fillcolor=black",
+]
+
+VARIANTS = {
+    "reencode": ["-c:v", "libx264", "-crf", "32", "-preset", "veryfast"],
+    "rescale": ["-vf", "scale=iw/2:-2", "-c:v", "libx264", "-preset", "veryfast"],
+    "trim": ["-ss", "1.5", "-c:v", "libx264", "-preset", "veryfast"],
+    "container": ["-c", "copy", "-f", "mpegts"],
+}
+
+
+def ffmpeg(args):
+    subprocess.run(["ffmpeg", "-v", "error", "-y", *args], check=True)
+
+
+def make_original(path, index, duration, width=640, height=360):
+    source = SOURCES[index % len(SOURCES)].format(
+        w=width, h=height, seed=index, x=0.5 + index % 7 / 10, ratio=2 + index % 7,
+        rule=18 + index % 200, noise=10 + index % 40,
+    )
+    ffmpeg(["-f", "lavfi", "-i", source, "-t", str(duration), "-pix_fmt", "yuv420p",
+            "-c:v", "libx264", "-preset", "veryfast", path])
+
+
+def make_variant(source_path, path, kind):
+    args = VARIANTS[kind]
+    if kind == "trim":
+        # -ss before -i trims the head without decoding it
+        ffmpeg([args[0], args[1], "-i", source_path, *args[2:], path])
+    else:
+        ffmpeg(["-i", source_path, *args, path])
+
+
+def generate(out_dir, originals=40, duration=20, max_copies=3, seed=0):
+    """Write the corpus into out_dir; returns the {relative path: group id} manifest"""
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+    for i in range(originals):
+        folder = os.path.join(out_dir, f"set{i % 4}")
+        os.makedirs(folder, exist_ok=True)
+        original = os.path.join(folder, f"original_{i:04d}.mp4")
+        make_original(original, i, duration)
+        manifest[os.path.relpath(original, out_dir)] = i
+        kinds = rng.sample(sorted(VARIANTS), rng.randint(0, max_copies))
+        for kind in kinds:
+            ext = ".ts" if kind == "container" else ".mp4"
+            # Copies land in another folder so the walker has to find them
+            copy_dir = os.path.join(out_dir, f"set{(i + 1) % 4}")
+            os.makedirs(copy_dir, exist_ok=True)
+            path = os.path.join(copy_dir, f"copy_{i:04d}_{kind}{ext}")
+            make_variant(original, path, kind)
+            manifest[os.path.relpath(path, out_dir)] = i
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def load_manifest(corpus_dir):
+    """Ground truth as {absolute path: group id}"""
+    with open(os.path.join(corpus_dir, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    return {os.path.abspath(os.path.join(corpus_dir, path)): group for path, group in manifest.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the synthetic benchmark corpus.")
+    parser.add_argument("--out", default="bench_corpus", help="Output folder")
+    parser.add_argument("--originals", type=int, default=40, help="Distinct source videos")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per original")
+    parser.add_argument("--max-copies", type=int, default=3, help="Planted duplicates per original, at most")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    manifest = generate(args.out, args.originals, args.duration, args.max_copies, args.seed)
+    print(f"{len(manifest)} files ({args.originals} originals) written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+from collections import defaultdict
+import numpy as np
+
+
+class UnionFind:
+    """Disjoint sets over 0..n-1 with path halving and union by size"""
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri == rj:
+            return ri
+        if self.size[ri] < self.size[rj]:
+            ri, rj = rj, ri
+        self.parent[rj] = ri
+        self.size[ri] += self.size[rj]
+        return ri
+
+
+class DuplicateGroups(dict):
+    """{representative: [members]} like the old groups dict, plus the evidence.
+
+    `edges[representative]` lists the (path_a, path_b, similarity) pairs
+    above the threshold inside that group, so callers can show why files
+    were grouped together.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.edges = {}
+
+    def representatives(self):
+        return list(self.keys())
+
+    def best_match(self, representative, path):
+        """(other path, similarity) of path's strongest edge inside its group, or (None, None)"""
+        best = (None, None)
+        for a, b, sim in self.edges.get(representative, ()):
+            if path in (a, b) and (best[1] is None or sim > best[1]):
+                best = (b if a == path else a, sim)
+        return best
+
+
+def _complete_linkage(members, edge_list):
+    """Split a component so every pair inside a cluster is itself an edge"""
+    adjacency = defaultdict(set)
+    for i, j, _ in edge_list:
+        adjacency[i].add(j)
+        adjacency[j].add(i)
+    cluster_of = {m: frozenset([m]) for m in members}
+    for i, j, _ in sorted(edge_list, key=lambda e: -e[2]):
+        a, b = cluster_of[i], cluster_of[j]
+        if a is b:
+            continue
+        if all(y in adjacency[x] for x in a for y in b):
+            merged = a | b
+            for m in merged:
+                cluster_of[m] = merged
+    return list({id(c): c for c in cluster_of.values()}.values())
+
+
+def _centroid_refine(members, matrix, threshold):
+    """Drop members whose similarity to the group centroid falls below threshold"""
+    # Members past the end of the matrix were linked by the prefilter and have no vector
+    unembedded = [m for m in members if m >= len(matrix)]
+    members = [m for m in members if m < len(matrix)]
+    if len(members) < 2:
+        return [members + unembedded] if members or unembedded else []
+    vectors = matrix[members]
+    if vectors.ndim == 3:
+        vectors = vectors.mean(axis=1)
+    centroid = vectors.mean(axis=0)
+    centroid /= np.linalg.norm(centroid) or 1.0
+    sims = vectors @ centroid
+    norms = np.linalg.norm(vectors, axis=1)
+    sims = sims / np.where(norms == 0, 1.0, norms)
+    keep = [m for m, s in zip(members, sims) if s >= threshold] + unembedded
+    dropped = [[m] for m, s in zip(members, sims) if s < threshold]
+    return ([keep] if keep else []) + dropped
+
+
+def cluster(paths, rows, cols, sims, linkage="single", matrix=None, threshold=None):
+    """Group paths from a thresholded edge list.
+
+    "single" linkage takes connected components with union-find (near-linear
+    in the number of edges, independent of input order). "complete" further
+    splits each component so every pair in a group is above the threshold;
+    "centroid" drops members that are far from their group's mean vector
+    (needs matrix and threshold). Each group's representative is the member
+    with the highest summed edge similarity.
+    """
+    n = len(paths)
+    uf = UnionFind(n)
+    rows = np.asarray(rows).tolist()
+    cols = np.asarray(cols).tolist()
+    sims = np.asarray(sims, dtype=np.float64).tolist()
+    for i, j in zip(rows, cols):
+        uf.union(i, j)
+
+    components = defaultdict(list)
+    for i in range(n):
+        components[uf.find(i)].append(i)
+    component_edges = defaultdict(list)
+    for i, j, s in zip(rows, cols, sims):
+        component_edges[uf.find(i)].append((i, j, s))
+
+    clusters = []
+    for root, members in components.items():
+        if len(members) == 1 or linkage == "single":
+            clusters.append(members)
+        elif linkage == "complete":
+            clusters.extend(sorted(c) for c in _complete_linkage(members, component_edges[root]))
+        elif linkage == "centroid":
+            if matrix is None or threshold is None:
+                raise ValueError("centroid linkage needs the embedding matrix and threshold")
+            clusters.extend(_centroid_refine(members, matrix, threshold))
+        else:
+            raise ValueError(f"Unknown linkage: {linkage}")
+
+    cluster_of = {}
+    for c, members in enumerate(clusters):
+        for m in members:
+            cluster_of[m] = c
+    strength = defaultdict(float)
+    cluster_edges = defaultdict(list)
+    for i, j, s in zip(rows, cols, sims):
+        if cluster_of[i] == cluster_of[j]:
+            strength[i] += s
+            strength[j] += s
+            cluster_edges[cluster_of[i]].append((paths[i], paths[j], s))
+
+    groups = DuplicateGroups()
+    for c, members in sorted(enumerate(clusters), key=lambda item: min(item[1])):
+        members = sorted(members)
+        representative = max(members, key=lambda m: (strength[m], -m))
+        rep_path = paths[representative]
+        groups[rep_path] = [rep_path] + [paths[m] for m in members if m != representative]
+        groups.edges[rep_path] = cluster_edges[c]
+    return groups
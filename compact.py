@@ -0,0 +1,156 @@
+import os
+import json
+import numpy as np
+from similarity import DEFAULT_BLOCK_SIZE, pool_signature, similar_pairs
+
+DTYPES = ("float16", "int8")
+QUANTIZE_BLOCK = 8192  # Rows converted per step when writing int8 codes
+
+
+class CompactEmbeddings:
+    """Mean-pooled embeddings as a memory-mapped float16 or int8 code matrix plus a path table.
+
+    Row i of the code matrix belongs to paths[i]. float16 halves the
+    memory of float32 vectors, int8 (one scale per dimension) quarters it,
+    and neither carries per-path Python objects. max_error bounds how far
+    any decoded row lies from its full-precision vector, which bounds the
+    similarity error of every pair by `margin`: candidates are searched
+    on the codes at threshold - margin, pairs above threshold + margin are
+    accepted as is, and only the pairs in between are re-ranked with the
+    float32 vectors from the embedding store.
+    """
+
+    ndim = 2
+
+    def __init__(self, paths, codes, scale=None, max_error=0.0, store=None):
+        self.paths = paths
+        self.codes = codes
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float32)
+        self.max_error = max_error
+        self.store = store
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, rows):
+        """Decoded float32 rows, so the matrix can stand in for a dense one"""
+        decoded = np.asarray(self.codes[rows], dtype=np.float32)
+        return decoded * self.scale if self.scale is not None else decoded
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    @property
+    def margin(self):
+        # |a.b - a'.b'| <= |a - a'| |b| + |a'| |b - b'| for unit a, b
+        return 2 * self.max_error + self.max_error ** 2
+
+    def similar_pairs(self, threshold, block_size=DEFAULT_BLOCK_SIZE):
+        """(i, j, similarity) arrays of pairs above threshold, re-ranking the ones the codes cannot decide"""
+        margin = self.margin
+        rows, cols, sims = similar_pairs(self, threshold - margin, block_size)
+        borderline = np.nonzero(sims <= threshold + margin)[0]
+        if self.store is not None and len(borderline):
+            needed = sorted({self.paths[i] for i in rows[borderline]} | {self.paths[j] for j in cols[borderline]})
+            vectors = self.store.vectors(needed)
+            for k in borderline:
+                a = vectors.get(self.paths[rows[k]])
+                b = vectors.get(self.paths[cols[k]])
+                if a is not None and b is not None:
+                    sims[k] = float(pool_signature(a) @ pool_signature(b))
+        keep = sims > threshold
+        return rows[keep], cols[keep], sims[keep]
+
+    def save(self, base):
+        """Write the path table and code layout next to the <base>.npy code matrix"""
+        header = {
+            "dtype": str(self.codes.dtype),
+            "count": len(self.paths),
+            "scale": None if self.scale is None else self.scale.tolist(),
+            "max_error": self.max_error,
+            "paths": self.paths,
+        }
+        tmp_path = base + ".json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+        os.replace(tmp_path, base + ".json")
+
+    @classmethod
+    def load(cls, base, store=None):
+        with open(base + ".json", encoding="utf-8") as f:
+            header = json.load(f)
+        codes = np.load(base + ".npy", mmap_mode="r")
+        return cls(header["paths"], codes, header["scale"], header["max_error"], store)
+
+
+def _write_float16(store, roots, path, count, dim):
+    """Stream cached embeddings into a float16 .npy; returns (paths, per-row error)"""
+    codes = np.lib.format.open_memmap(path, mode="w+", dtype=np.float16, shape=(count, dim))
+    paths = []
+    errors = np.zeros(count, dtype=np.float32)
+    for i, (p, embedding) in enumerate(store.iter_under(roots)):
+        if i == count:
+            break
+        vector = pool_signature(embedding)
+        codes[i] = vector
+        errors[i] = np.linalg.norm(vector - codes[i].astype(np.float32))
+        paths.append(p)
+    codes.flush()
+    del codes
+    return paths, errors[:len(paths)]
+
+
+def _quantize_int8(source_path, path, errors):
+    """float16 .npy -> int8 .npy with one symmetric scale per dimension; returns (scale, per-row error)"""
+    source = np.load(source_path, mmap_mode="r")
+    scale = np.zeros(source.shape[1], dtype=np.float32)
+    for start in range(0, len(source), QUANTIZE_BLOCK):
+        block = np.abs(np.asarray(source[start:start + QUANTIZE_BLOCK], dtype=np.float32))
+        scale = np.maximum(scale, block.max(axis=0))
+    scale = np.where(scale > 0, scale / 127.0, 1.0).astype(np.float32)
+
+    codes = np.lib.format.open_memmap(path, mode="w+", dtype=np.int8, shape=source.shape)
+    errors = errors.copy()
+    for start in range(0, len(source), QUANTIZE_BLOCK):
+        block = np.asarray(source[start:start + QUANTIZE_BLOCK], dtype=np.float32)
+        quantized = np.clip(np.rint(block / scale), -127, 127).astype(np.int8)
+        codes[start:start + len(block)] = quantized
+        # Triangle inequality: float32 -> float16 error plus float16 -> int8 error
+        errors[start:start + len(block)] += np.linalg.norm(block - quantized * scale, axis=1)
+    codes.flush()
+    del codes, source
+    return scale, errors
+
+
+def build(store, roots, base, dtype="float16", dim=None):
+    """Write the cached embeddings under roots as <base>.npy + <base>.json and open them.
+
+    Vectors are streamed from the store one at a time, so the full-precision
+    collection never has to fit in memory.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown compact storage type: {dtype}")
+    os.makedirs(os.path.dirname(os.path.abspath(base)), exist_ok=True)
+    count, found_dim = store.count_under(roots)
+    dim = dim or found_dim
+    if not count:
+        return CompactEmbeddings([], np.zeros((0, dim or 1), dtype=np.float16), store=store)
+    half_path = base + ".f16.tmp.npy"
+    paths, errors = _write_float16(store, roots, half_path, count, dim)
+    scale = None
+    if dtype == "int8":
+        scale, errors = _quantize_int8(half_path, base + ".i8.tmp.npy", errors)
+        os.remove(half_path)
+        os.replace(base + ".i8.tmp.npy", base + ".npy")
+    else:
+        os.replace(half_path, base + ".npy")
+    max_error = float(errors.max()) if len(errors) else 0.0
+    codes = np.load(base + ".npy", mmap_mode="r")
+    compact = CompactEmbeddings(paths, codes[:len(paths)], scale, max_error, store)
+    compact.save(base)
+    return compact
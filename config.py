@@ -0,0 +1,128 @@
+import os
+import json
+import time
+
+# --- Settings ---
+# Defaults only; override them from a TOML/YAML config file or command-line flags.
+SOURCE_DIRS = []
+EXTENSIONS = [".mp4", ".ts"]  # Video file extensions picked up under the source folders
+FRAME_DIR = "temp_data"  # Frame dumps, embedding cache, ANN index and match results
+DUPLICATE_DIR = "duplicates"  # Duplicates are moved here
+QUARANTINE_PER_VOLUME = False  # Move duplicates into a DUPLICATE_DIR-named folder on their own drive (instant renames, no copies)
+COPY_WORKERS_PER_DEVICE = 1  # Parallel cross-drive copies per source drive
+CLIP_MODEL = "ViT-B/32"
+SIMILARITY_THRESHOLD = 0.95
+KEEP_BEST = True
+SIMILARITY_BLOCK_SIZE = 2048  # Rows per tile in the blocked similarity search
+MATCH_BACKEND = "exact"  # "exact" all-pairs search or "ann" inverted-file index
+ANN_NPROBE = 8  # Lists scanned per query: higher = better recall, slower
+USE_FINGERPRINT = False  # Also match touched-but-unchanged files by content hash
+BATCH_SIZE = 64  # Frames per encode_image call
+EXTRACT_WORKERS = 4  # Parallel ffmpeg frame extractions (the starting point when ASYNC_SUBPROCESS adapts it)
+ASYNC_SUBPROCESS = True  # Run ffmpeg/ffprobe on an asyncio runner with adaptive concurrency and fast Stop
+MAX_SUBPROCESSES = None  # Upper bound for the adaptive limit (None = 2 x CPU cores)
+TORCH_THREADS = None  # Intra-op threads for CPU inference (None = all cores)
+ENCODER_BACKEND = "eager"  # CPU image encoder: "eager", "int8" quantized, "torchscript" or "onnx" (check with `validate`)
+ENCODER_BATCH = 16  # Fixed batch shape of the non-eager backends; partial batches are zero-padded
+SAVE_FRAMES = False  # Debug: also dump each decoded frame as a JPEG into the frame dir
+SIGNATURE_FRAMES = 1  # Frames per video signature, sampled at even fractions of the duration
+SIGNATURE_MODE = "mean"  # "mean" pools frames into one vector, "max" matches best frame pair
+FRAME_SAMPLING = "seek"  # "keyframe": decode only the I-frame nearest each sampling point (.ts files seek by byte offset)
+PREFILTER = False  # Size/hash, duration/aspect and pHash cascade decides easy cases before CLIP
+EMBED_PROCESSES = 0  # >0: embed in this many worker processes instead of the threaded pipeline
+PROFILE_STAGES = []  # Stages run under cProfile, e.g. ["extract", "inference"]
+COMPACT_STORAGE = None  # "float16" or "int8": `match` searches a memory-mapped code matrix; borderline pairs are re-ranked in float32
+CLUSTER_LINKAGE = "single"  # "single" connected components, "complete" all pairs similar, "centroid" near the group mean
+AUDIO_FINGERPRINT = False  # Re-check pairs within AUDIO_MARGIN of the threshold with an audio fingerprint
+AUDIO_MARGIN = 0.03  # Visual similarity band around the threshold that gets the audio check
+AUDIO_WEIGHT = 0.3  # Combined score = visual + weight * (bit agreement - 0.7)
+WATCH_INTERVAL = 60  # Seconds between folder polls in `watch` mode
+
+_SETTINGS = {name for name in dir() if name.isupper()}
+
+CONFIG_ENV = "VDM_CONFIG"
+DEFAULT_CONFIG_FILE = "config.toml"
+
+
+# --- Derived paths ---
+def embedding_db_path():
+    return os.path.join(FRAME_DIR, "embeddings.sqlite")
+
+
+def ann_index_path():
+    return os.path.join(FRAME_DIR, "ann_index.npz")
+
+
+def compact_embeddings_path():
+    """Base name of the compact code matrix (.npy) and its path table (.json)"""
+    return os.path.join(FRAME_DIR, "embeddings_compact")
+
+
+def results_db_path():
+    return os.path.join(FRAME_DIR, "results.sqlite")
+
+
+def move_plan_path():
+    return os.path.join(FRAME_DIR, "move_plan.json")
+
+
+def move_journal_path():
+    """New undo journal for one apply run"""
+    return os.path.join(FRAME_DIR, "moves", time.strftime("moves-%Y%m%d-%H%M%S.jsonl"))
+
+
+def shard_path(node):
+    return os.path.join(FRAME_DIR, "shards", f"{node}.npz")
+
+
+def groups_path():
+    return os.path.join(FRAME_DIR, "groups.json")
+
+
+def prefilter_edges_path():
+    return os.path.join(FRAME_DIR, "prefilter_edges.json")
+
+
+# --- Loading ---
+def _read(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".toml":
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    if ext in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("YAML config files need PyYAML: pip install pyyaml")
+        with open(path, encoding="utf-8") as f:
+            return yaml.safe_load(f) or {}
+    if ext == ".json":
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    raise ValueError(f"Unsupported config format: {path}")
+
+
+def apply(settings):
+    """Override settings from a {name: value} mapping (names are case-insensitive)"""
+    for key, value in settings.items():
+        name = key.upper()
+        if name not in _SETTINGS:
+            raise ValueError(f"Unknown setting: {key}")
+        globals()[name] = value
+
+
+def snapshot():
+    """Current settings as a plain dict, e.g. to hand to worker processes"""
+    return {name: globals()[name] for name in _SETTINGS}
+
+
+def load_config(path=None):
+    """Apply the config file at path, $VDM_CONFIG or ./config.toml; returns the file used or None"""
+    path = path or os.environ.get(CONFIG_ENV)
+    if not path and os.path.exists(DEFAULT_CONFIG_FILE):
+        path = DEFAULT_CONFIG_FILE
+    if not path:
+        return None
+    apply(_read(path))
+    return path
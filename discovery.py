@@ -0,0 +1,103 @@
+import os
+import queue
+import threading
+from collections import defaultdict
+
+DEFAULT_EXTENSIONS = (".mp4", ".ts")
+
+_DONE = object()
+
+
+def normalize_extensions(extensions):
+    """Lower-case, dot-prefixed extension tuple for suffix matching"""
+    extensions = extensions or DEFAULT_EXTENSIONS
+    return tuple(
+        (ext if ext.startswith(".") else "." + ext).lower()
+        for ext in extensions
+    )
+
+
+def walk(root, extensions):
+    """Single-pass os.scandir walk of root; yields (path, stat_result) for matching files.
+
+    On Windows the stat comes from the directory listing itself, so no extra
+    system call is made per file. Unreadable folders are skipped and
+    symlinked folders are not followed.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith(extensions) and entry.is_file():
+                            yield entry.path, entry.stat()
+                    except OSError:
+                        continue  # Vanished or unreadable while listing
+        except OSError:
+            continue
+
+
+def device_of(path):
+    """Identifier of the drive path lives on; roots on one drive share a walker thread"""
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return os.path.splitdrive(os.path.abspath(path))[0] or path
+
+
+def _walk_roots(roots, extensions, out_queue, stop):
+    try:
+        for root in roots:
+            for item in walk(root, extensions):
+                if stop.is_set():
+                    return
+                out_queue.put(item)
+    finally:
+        out_queue.put(_DONE)
+
+
+def scan(source_dirs, extensions=None, queue_size=1024):
+    """Discover video files under source_dirs; yields (path, stat_result) as they are found.
+
+    Roots are grouped by drive and each drive is walked by its own thread, so
+    separate disks are read in parallel while one disk is never hit by
+    competing walkers. Files reachable from overlapping roots are yielded once.
+    """
+    extensions = normalize_extensions(extensions)
+    by_device = defaultdict(list)
+    for root in source_dirs:
+        by_device[device_of(root)].append(root)
+    if not by_device:
+        return
+
+    out_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    for roots in by_device.values():
+        threading.Thread(target=_walk_roots, args=(roots, extensions, out_queue, stop), daemon=True).start()
+
+    seen = set()
+    running = len(by_device)
+    try:
+        while running:
+            item = out_queue.get()
+            if item is _DONE:
+                running -= 1
+                continue
+            key = os.path.normcase(os.path.abspath(item[0]))
+            if key in seen:
+                continue
+            seen.add(key)
+            yield item
+    finally:
+        # Consumer stopped early: let the walkers finish without blocking on a full queue
+        stop.set()
+        while running:
+            try:
+                if out_queue.get_nowait() is _DONE:
+                    running -= 1
+            except queue.Empty:
+                break
@@ -0,0 +1,227 @@
+import os
+import json
+import sqlite3
+import hashlib
+import numpy as np
+
+FINGERPRINT_CHUNK = 1024 * 1024
+
+
+def file_fingerprint(path, chunk_size=FINGERPRINT_CHUNK):
+    """Cheap content fingerprint: size plus the first and last chunk of the file"""
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(chunk_size))
+        if size > 2 * chunk_size:
+            f.seek(size - chunk_size)
+            digest.update(f.read(chunk_size))
+    return digest.hexdigest()
+
+
+def file_identity(path):
+    """Return (size, mtime_ns) used to decide whether a cached entry is stale"""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _decode(blob, dim):
+    """A stored signature: (dim,) for one vector, (frames, dim) for a multi-frame signature"""
+    vectors = np.frombuffer(blob, dtype=np.float32).reshape(-1, dim)
+    return vectors[0] if len(vectors) == 1 else vectors
+
+
+def _path_under(path, roots):
+    path = os.path.normcase(os.path.abspath(path))
+    for root in roots:
+        root = os.path.normcase(os.path.abspath(root))
+        if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+            return True
+    return False
+
+
+class EmbeddingStore:
+    """SQLite-backed embedding and ffprobe metadata cache keyed by path + size + mtime"""
+
+    def __init__(self, db_path, model_id, use_fingerprint=False):
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self.db_path = db_path
+        self.model_id = model_id
+        self.use_fingerprint = use_fingerprint
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                fingerprint TEXT,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL
+            )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS metadata (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                data TEXT NOT NULL
+            )"""
+        )
+        self._check_model()
+        self.conn.commit()
+
+    def _check_model(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'model_id'").fetchone()
+        if row is None or row[0] != self.model_id:
+            # Embeddings from a different model are not comparable, start over
+            self.conn.execute("DELETE FROM embeddings")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('model_id', ?)",
+                (self.model_id,),
+            )
+
+    def get(self, path, size=None, mtime=None):
+        """Return the cached embedding for path, or None if missing or stale"""
+        if size is None or mtime is None:
+            try:
+                size, mtime = file_identity(path)
+            except OSError:
+                return None
+        row = self.conn.execute(
+            "SELECT size, mtime, fingerprint, dim, vector FROM embeddings WHERE path = ?",
+            (path,),
+        ).fetchone()
+        if row is None:
+            return None
+        cached_size, cached_mtime, fingerprint, dim, blob = row
+        if cached_size != size:
+            return None
+        if cached_mtime != mtime:
+            # Touched but maybe not modified: fall back to the content fingerprint
+            if not (self.use_fingerprint and fingerprint):
+                return None
+            try:
+                if file_fingerprint(path) != fingerprint:
+                    return None
+            except OSError:
+                return None
+            self.conn.execute("UPDATE embeddings SET mtime = ? WHERE path = ?", (mtime, path))
+        return _decode(blob, dim)
+
+    def put(self, path, embedding, size=None, mtime=None):
+        """Insert or replace the embedding for path"""
+        if size is None or mtime is None:
+            size, mtime = file_identity(path)
+        vector = np.ascontiguousarray(embedding, dtype=np.float32)
+        fingerprint = file_fingerprint(path) if self.use_fingerprint else None
+        self.conn.execute(
+            "INSERT OR REPLACE INTO embeddings (path, size, mtime, fingerprint, dim, vector) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (path, size, mtime, fingerprint, vector.shape[-1], vector.tobytes()),
+        )
+
+    def get_metadata(self, path, size=None, mtime=None):
+        """Return the cached ffprobe metadata dict for path, or None if missing or stale"""
+        if size is None or mtime is None:
+            try:
+                size, mtime = file_identity(path)
+            except OSError:
+                return None
+        row = self.conn.execute(
+            "SELECT data FROM metadata WHERE path = ? AND size = ? AND mtime = ?",
+            (path, size, mtime),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_metadata(self, path, info, size=None, mtime=None):
+        """Insert or replace the metadata dict for path"""
+        if size is None or mtime is None:
+            size, mtime = file_identity(path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO metadata (path, size, mtime, data) VALUES (?, ?, ?, ?)",
+            (path, size, mtime, json.dumps(info)),
+        )
+
+    def split_cached(self, video_files):
+        """Split video_files into ({path: cached embedding}, [paths needing embedding]).
+
+        video_files may be a {path: os.stat_result} mapping from discovery,
+        in which case the captured stats are used instead of stat-ing again.
+        """
+        stats = video_files if isinstance(video_files, dict) else {}
+        cached = {}
+        pending = []
+        for path in video_files:
+            st = stats.get(path)
+            embedding = self.get(path, st.st_size, st.st_mtime_ns) if st is not None else self.get(path)
+            if embedding is None:
+                pending.append(path)
+            else:
+                cached[path] = embedding
+        self.commit()
+        return cached, pending
+
+    def iter_under(self, roots):
+        """Yield (path, embedding) for cached files under roots, in path order"""
+        for path, dim, blob in self.conn.execute("SELECT path, dim, vector FROM embeddings ORDER BY path"):
+            if _path_under(path, roots):
+                yield path, _decode(blob, dim)
+
+    def count_under(self, roots):
+        """(number of cached files under roots, their embedding width or None)"""
+        count = 0
+        width = None
+        for path, dim in self.conn.execute("SELECT path, dim FROM embeddings"):
+            if _path_under(path, roots):
+                count += 1
+                width = dim
+        return count, width
+
+    def load_under(self, roots):
+        """All cached embeddings for files under roots, as {path: embedding}"""
+        return dict(self.iter_under(roots))
+
+    def paths_under(self, roots):
+        """Paths of all cached embeddings under roots"""
+        return [path for (path,) in self.conn.execute("SELECT path FROM embeddings") if _path_under(path, roots)]
+
+    def vectors(self, paths, batch_size=500):
+        """Cached embeddings for paths as {path: embedding}, without staleness checks"""
+        paths = list(paths)
+        vectors = {}
+        for start in range(0, len(paths), batch_size):
+            chunk = paths[start:start + batch_size]
+            placeholders = ",".join("?" * len(chunk))
+            for path, dim, blob in self.conn.execute(
+                f"SELECT path, dim, vector FROM embeddings WHERE path IN ({placeholders})", chunk,
+            ):
+                vectors[path] = _decode(blob, dim)
+        return vectors
+
+    def prune(self, existing_paths, roots):
+        """Drop entries under roots whose files are no longer present"""
+        existing = set(existing_paths)
+        removed = 0
+        for table in ("embeddings", "metadata"):
+            stale = [
+                path for (path,) in self.conn.execute(f"SELECT path FROM {table}")
+                if path not in existing and _path_under(path, roots)
+            ]
+            self.conn.executemany(f"DELETE FROM {table} WHERE path = ?", ((p,) for p in stale))
+            removed += len(stale)
+        self.commit()
+        return removed
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,168 @@
+import os
+import time
+
+BACKENDS = ("eager", "int8", "torchscript", "onnx")
+QUANTIZATION = {"int8": "dynamic-qint8"}  # How each quantized backend stores its weights; part of the model ID
+DRIFT_TOLERANCE = 0.005  # Max 1 - cosine(reference, backend) per frame
+ONNX_OPSET = 17
+
+
+class ImageEncoder:
+    """encode_image() front for an optimized CLIP image tower with a fixed batch shape.
+
+    Batches are cut into chunks of exactly batch_size frames (the last one
+    zero-padded), so traced and ONNX graphs always see the shape they were
+    built for. Chunks are laid out channels-last for the torch backends,
+    which is what oneDNN's convolution kernels prefer on CPU.
+    """
+
+    def __init__(self, forward, batch_size, channels_last=True, name=""):
+        self.forward = forward
+        self.batch_size = batch_size
+        self.channels_last = channels_last
+        self.name = name
+
+    def encode_image(self, images):
+        import torch
+
+        outputs = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            real = len(chunk)
+            if real < self.batch_size:
+                padding = chunk.new_zeros((self.batch_size - real,) + tuple(chunk.shape[1:]))
+                chunk = torch.cat([chunk, padding])
+            if self.channels_last:
+                chunk = chunk.contiguous(memory_format=torch.channels_last)
+            with torch.inference_mode():
+                outputs.append(self.forward(chunk)[:real].float())
+        return torch.cat(outputs)
+
+
+def _example(batch_size, size):
+    import torch
+    return torch.zeros(batch_size, 3, size, size).contiguous(memory_format=torch.channels_last)
+
+
+def _int8(model, batch_size, size):
+    import torch
+
+    # Linear layers carry almost all of a ViT's FLOPs; weights go int8, activations stay float
+    visual = torch.ao.quantization.quantize_dynamic(model.visual, {torch.nn.Linear}, dtype=torch.qint8)
+    visual = visual.to(memory_format=torch.channels_last)
+    return ImageEncoder(lambda x: visual(x.type(model.dtype)), batch_size, name="int8")
+
+
+def _torchscript(model, batch_size, size):
+    import torch
+
+    visual = model.visual.eval().to(memory_format=torch.channels_last)
+    with torch.inference_mode():
+        traced = torch.jit.trace(visual, _example(batch_size, size).type(model.dtype), check_trace=False)
+    traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    return ImageEncoder(lambda x: traced(x.type(model.dtype)), batch_size, name="torchscript")
+
+
+def onnx_path(model_name, batch_size, cache_dir):
+    safe = "".join(c if c.isalnum() else "-" for c in model_name)
+    return os.path.join(cache_dir, f"clip-visual-{safe}-b{batch_size}.onnx")
+
+
+def _onnx(model, batch_size, size, model_name="", cache_dir=".", threads=None):
+    import torch
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        raise RuntimeError("The onnx encoder backend needs ONNX Runtime: pip install onnxruntime")
+
+    path = onnx_path(model_name, batch_size, cache_dir)
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        example = torch.zeros(batch_size, 3, size, size).type(model.dtype)
+        torch.onnx.export(model.visual.eval(), example, tmp_path, input_names=["images"],
+                          output_names=["embeddings"], opset_version=ONNX_OPSET)
+        os.replace(tmp_path, path)
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = threads or os.cpu_count() or 1
+    session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def forward(x):
+        return torch.from_numpy(session.run(None, {"images": x.numpy()})[0])
+
+    return ImageEncoder(forward, batch_size, channels_last=False, name="onnx")
+
+
+def build_encoder(model, backend, batch_size, size, model_name="", cache_dir=".", threads=None):
+    """Wrap a loaded CLIP model's image tower in the requested CPU backend.
+
+    "eager" returns the model unchanged; the others return an ImageEncoder
+    whose encode_image() can be used in its place.
+    """
+    if backend == "eager":
+        return model
+    if backend == "int8":
+        return _int8(model, batch_size, size)
+    if backend == "torchscript":
+        return _torchscript(model, batch_size, size)
+    if backend == "onnx":
+        return _onnx(model, batch_size, size, model_name, cache_dir, threads)
+    raise ValueError(f"Unknown encoder backend: {backend}")
+
+
+def _timed_encode(encoder, images, batch_size):
+    """(embeddings, seconds) for images encoded batch_size frames at a time, after one warm-up batch"""
+    import torch
+
+    with torch.inference_mode():
+        encoder.encode_image(images[:batch_size])
+        start = time.perf_counter()
+        embeddings = torch.cat([
+            encoder.encode_image(images[i:i + batch_size]).float()
+            for i in range(0, len(images), batch_size)
+        ])
+    return embeddings, time.perf_counter() - start
+
+
+def validate(model, images, backends, batch_size, size, tolerance=DRIFT_TOLERANCE, **build_args):
+    """Compare backends against the eager fp32 model on the same frames.
+
+    Returns {"reference": {...}, "backends": {name: {mean_drift, max_drift,
+    frames_per_second, speedup, within_tolerance}}, "recommended": name},
+    where drift is 1 - cosine similarity per frame and the recommendation is
+    the fastest backend within tolerance.
+    """
+    reference, reference_seconds = _timed_encode(model, images, batch_size)
+    reference = reference / reference.norm(dim=-1, keepdim=True)
+    report = {
+        "frames": len(images),
+        "tolerance": tolerance,
+        "reference": {"frames_per_second": round(len(images) / reference_seconds, 2)},
+        "backends": {},
+    }
+    fastest = ("eager", reference_seconds)
+    for backend in backends:
+        if backend == "eager":
+            continue
+        try:
+            encoder = build_encoder(model, backend, batch_size, size, **build_args)
+        except Exception as e:
+            report["backends"][backend] = {"error": str(e)}
+            continue
+        embeddings, seconds = _timed_encode(encoder, images, batch_size)
+        embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
+        drift = 1.0 - (reference * embeddings).sum(dim=-1)
+        ok = float(drift.max()) <= tolerance
+        report["backends"][backend] = {
+            "mean_drift": round(float(drift.mean()), 6),
+            "max_drift": round(float(drift.max()), 6),
+            "frames_per_second": round(len(images) / seconds, 2),
+            "speedup": round(reference_seconds / seconds, 2),
+            "within_tolerance": ok,
+        }
+        if ok and seconds < fastest[1]:
+            fastest = (backend, seconds)
+    report["recommended"] = fastest[0]
+    return report
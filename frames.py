@@ -0,0 +1,360 @@
+import os
+import numpy as np
+from subprocess_runner import run_command
+
+SEEK_TIMES = ["00:05:00", "00:02:00", "00:10:00"]
+FFMPEG_TIMEOUT = 10
+
+SAMPLING_STRATEGIES = ("seek", "keyframe")
+KEYFRAME_WINDOW = 8.0  # Seconds of packets read around each sampling point to find its nearest I-frame
+TS_PACKET_SIZE = 188
+
+# Bump when frame decoding, scaling or normalization changes what the model sees
+PREPROCESS_VERSION = 1
+
+# Normalization used by CLIP's preprocess transform
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+# ffmpeg errors that no other seek point or longer timeout will fix
+PERMANENT_ERRORS = (
+    "No such file or directory",
+    "Permission denied",
+    "Invalid data found",
+    "moov atom not found",
+    "does not contain any stream",
+    "Output file #0 does not contain any stream",
+)
+
+
+def scale_filter(size):
+    """ffmpeg filter equivalent to CLIP's resize-short-side + center-crop"""
+    return (
+        f"scale={size}:{size}:force_original_aspect_ratio=increase:flags=bicubic,"
+        f"crop={size}:{size}"
+    )
+
+
+def failure_reason(result, timeout=None):
+    """Short human-readable reason a command produced no frames"""
+    if result.cancelled:
+        return "cancelled"
+    if result.timed_out:
+        return f"timed out after {timeout}s" if timeout else "timed out"
+    lines = result.stderr.decode("utf-8", "replace").strip().splitlines()
+    if lines:
+        return lines[-1][:200]
+    if result.returncode:
+        return f"exit code {result.returncode}"
+    return "no frame decoded"
+
+
+def is_permanent(result):
+    """True when retrying the same file cannot help"""
+    if result.cancelled:
+        return True
+    stderr = result.stderr.decode("utf-8", "replace")
+    return any(message in stderr for message in PERMANENT_ERRORS)
+
+
+def _frames_from(result, size, max_frames):
+    frame_bytes = size * size * 3
+    n = min(len(result.stdout) // frame_bytes, max_frames)
+    if result.timed_out or result.cancelled or n == 0:
+        return None
+    return np.frombuffer(result.stdout, dtype=np.uint8, count=n * frame_bytes).reshape(n, size, size, 3).copy()
+
+
+def decode_command(video_path, seek_time, size):
+    return [
+        "ffmpeg",
+        "-v", "error",
+        "-ss", str(seek_time),
+        "-i", video_path,
+        "-frames:v", "1",
+        "-vf", scale_filter(size),
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb24",
+        "-",
+    ]
+
+
+def decode_frame(video_path, seek_time, size, timeout=FFMPEG_TIMEOUT, run=None):
+    """Decode one frame at seek_time straight into a (size, size, 3) uint8 RGB array"""
+    result = (run or run_command)(decode_command(video_path, seek_time, size), timeout)
+    frames = _frames_from(result, size, 1) if result.returncode == 0 else None
+    return frames[0] if frames is not None else None
+
+
+def seek_times_for(duration):
+    """Seek points inside the video: the usual 5:00/2:00/10:00 when they fit, else the middle"""
+    if not duration:
+        return SEEK_TIMES
+    fitting = [t for t in (300, 120, 600) if t < duration - 1]
+    return fitting or [duration / 2]
+
+
+def read_frame(video_path, size, seek_times=SEEK_TIMES, run=None):
+    """Try each seek time in turn; return the first decoded frame or None"""
+    for seek_time in seek_times:
+        frame = decode_frame(video_path, seek_time, size, run=run)
+        if frame is not None:
+            return frame
+    return None
+
+
+def duration_command(video_path):
+    return ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1", video_path]
+
+
+def _duration_from(result):
+    try:
+        duration = float(result.stdout.decode().strip())
+    except ValueError:
+        return None
+    return duration if duration > 0 else None
+
+
+def probe_duration(video_path, timeout=FFMPEG_TIMEOUT, run=None):
+    """Container duration in seconds, or None if ffprobe cannot tell"""
+    return _duration_from((run or run_command)(duration_command(video_path), timeout))
+
+
+def signature_fractions(count):
+    """Evenly spaced sampling points that avoid the very start and end"""
+    return [(k + 1) / (count + 1) for k in range(count)]
+
+
+def select_filter(offsets):
+    """select expression taking the first frame at or after each offset, in order"""
+    terms = [f"gte(t,{offset:.3f})*eq(selected_n,{k})" for k, offset in enumerate(offsets)]
+    return "select='" + "+".join(terms) + "'"
+
+
+def frames_command(video_path, size, times):
+    """One ffmpeg run that seeks to times[0] and selects the first frame at or after every time"""
+    start = times[0]
+    return [
+        "ffmpeg",
+        "-v", "error",
+        "-ss", f"{start:.3f}",
+        "-i", video_path,
+        "-vf", select_filter([t - start for t in times]) + "," + scale_filter(size),
+        "-vsync", "vfr",
+        "-frames:v", str(len(times)),
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb24",
+        "-",
+    ]
+
+
+def read_frames(video_path, size, count, duration=None, fractions=None, timeout=None, run=None):
+    """Decode `count` frames at fractions of the duration in a single ffmpeg run.
+
+    ffmpeg seeks to the first sampling point, then a select filter picks the
+    first frame at or after every later point. Returns a (n, size, size, 3)
+    uint8 array with 1 <= n <= count, or None.
+    """
+    duration = duration or probe_duration(video_path, run=run)
+    if not duration:
+        return None
+    times = [f * duration for f in (fractions or signature_fractions(count))]
+    result = (run or run_command)(frames_command(video_path, size, times), timeout or FFMPEG_TIMEOUT * len(times))
+    return _frames_from(result, size, len(times))
+
+
+def extract_frames(video_path, size, count=1, duration=None, run=None):
+    """Decode the signature frames with a retry policy; returns (frames or None, failure reason or None).
+
+    Without a known duration the file is probed first, so seek points that
+    lie past the end are never tried. A timed-out attempt is retried once
+    with twice the timeout (a busy disk, not a broken file); errors that no
+    other seek point can fix end the attempts right away. Single-frame
+    signatures fall back to the middle of the video when no fixed seek point
+    decodes.
+    """
+    run = run or run_command
+    if not duration:
+        result = run(duration_command(video_path), FFMPEG_TIMEOUT)
+        if is_permanent(result):
+            return None, failure_reason(result, FFMPEG_TIMEOUT)
+        duration = _duration_from(result)
+
+    if count > 1:
+        if not duration:
+            return None, "unknown duration"
+        times = [f * duration for f in signature_fractions(count)]
+        attempts = [(frames_command(video_path, size, times), len(times), FFMPEG_TIMEOUT * len(times))]
+    else:
+        attempts = [(decode_command(video_path, t, size), 1, FFMPEG_TIMEOUT) for t in seek_times_for(duration)]
+        if duration and duration / 2 not in seek_times_for(duration):
+            attempts.append((frames_command(video_path, size, [duration / 2]), 1, FFMPEG_TIMEOUT))
+
+    reason = "no frame decoded"
+    for cmd, max_frames, timeout in attempts:
+        for attempt_timeout in (timeout, 2 * timeout):
+            result = run(cmd, attempt_timeout)
+            frames = _frames_from(result, size, max_frames)
+            if frames is not None:
+                return frames, None
+            reason = failure_reason(result, attempt_timeout)
+            if not result.timed_out:
+                break
+        if is_permanent(result):
+            break
+    return None, reason
+
+
+def keyframe_index_command(video_path, times, window=KEYFRAME_WINDOW):
+    """ffprobe listing video packet times and flags only in a window around each time (no decoding)"""
+    intervals = ",".join(f"{max(0.0, t - window / 2):.3f}%+{window:.3f}" for t in times)
+    return ["ffprobe", "-v", "error", "-select_streams", "v:0", "-read_intervals", intervals,
+            "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path]
+
+
+def _keyframes_from(result):
+    """Sorted I-frame times from keyframe_index_command output"""
+    times = set()
+    for line in result.stdout.decode("utf-8", "replace").splitlines():
+        parts = line.strip().split(",")
+        if len(parts) >= 2 and "K" in parts[1]:
+            try:
+                times.add(float(parts[0]))
+            except ValueError:
+                continue
+    return sorted(times)
+
+
+def nearest_keyframes(times, keyframes):
+    """The I-frame time closest to each time, or the time itself when none was found near it"""
+    if not keyframes:
+        return list(times)
+    return [min(keyframes, key=lambda k: abs(k - t)) for t in times]
+
+
+def keyframe_command(video_path, size, keyframe_time=None, skip_bytes=None):
+    """Decode the first I-frame at keyframe_time, or after byte offset skip_bytes; nothing else is decoded"""
+    cmd = ["ffmpeg", "-v", "error", "-skip_frame", "nokey"]
+    if skip_bytes is not None:
+        cmd += ["-skip_initial_bytes", str(skip_bytes)]
+    else:
+        # Without accurate seek ffmpeg starts at the I-frame at or before -ss; round up so that is this one
+        cmd += ["-noaccurate_seek", "-ss", f"{keyframe_time + 0.0005:.3f}"]
+    return cmd + [
+        "-i", video_path,
+        "-frames:v", "1",
+        "-vf", scale_filter(size),
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb24",
+        "-",
+    ]
+
+
+def ts_pts_command(video_path, offset):
+    """ffprobe reading the first video packet's timestamp at a byte offset of a transport stream"""
+    return ["ffprobe", "-v", "error", "-skip_initial_bytes", str(offset), "-select_streams", "v:0",
+            "-read_intervals", "%+#1", "-show_entries", "packet=pts_time", "-of", "csv=p=0", video_path]
+
+
+def _pts_from(result):
+    for line in result.stdout.decode("utf-8", "replace").splitlines():
+        try:
+            return float(line.strip().split(",")[0])
+        except ValueError:
+            continue
+    return None
+
+
+def ts_offsets(video_path, times, duration, run=None):
+    """Byte offsets of times in a transport stream, which has no index for -ss to use.
+
+    The first guess assumes a constant bitrate; the timestamp found there
+    corrects it once. Each probe reads a single packet, so the cost does
+    not grow with the file's length.
+    """
+    run = run or run_command
+    size = os.path.getsize(video_path)
+    bytes_per_second = size / duration
+    start = _pts_from(run(ts_pts_command(video_path, 0), FFMPEG_TIMEOUT)) or 0.0
+    last = max(0, size - 64 * TS_PACKET_SIZE)
+
+    def aligned(offset):
+        offset = int(min(max(offset, 0), last))
+        return offset - offset % TS_PACKET_SIZE
+
+    offsets = []
+    for t in times:
+        offset = aligned(t * bytes_per_second)
+        pts = _pts_from(run(ts_pts_command(video_path, offset), FFMPEG_TIMEOUT))
+        if pts is not None:
+            offset = aligned(offset + (t - (pts - start)) * bytes_per_second)
+        offsets.append(offset)
+    return offsets
+
+
+def is_transport_stream(video_path):
+    return os.path.splitext(video_path)[1].lower() in (".ts", ".m2ts", ".mts")
+
+
+def extract_keyframes(video_path, size, count=1, duration=None, run=None):
+    """Decode only the I-frame nearest each sampling point; returns (frames or None, failure reason or None).
+
+    The keyframe index is read once, only around the sampling points, from
+    ffprobe packet flags; each frame is then a single-I-frame decode with
+    -skip_frame nokey. Transport streams skip the index and seek by byte
+    offset instead. The sampling points are the ones extract_frames uses;
+    files this cannot decode fall back to extract_frames.
+    """
+    run = run or run_command
+    if not duration:
+        result = run(duration_command(video_path), FFMPEG_TIMEOUT)
+        if is_permanent(result):
+            return None, failure_reason(result, FFMPEG_TIMEOUT)
+        duration = _duration_from(result)
+    if not duration:
+        return extract_frames(video_path, size, count, duration, run=run)
+
+    times = [f * duration for f in signature_fractions(count)] if count > 1 else seek_times_for(duration)[:1]
+    if is_transport_stream(video_path):
+        commands = [keyframe_command(video_path, size, skip_bytes=offset)
+                    for offset in ts_offsets(video_path, times, duration, run)]
+    else:
+        index = run(keyframe_index_command(video_path, times), FFMPEG_TIMEOUT)
+        if is_permanent(index):
+            return None, failure_reason(index, FFMPEG_TIMEOUT)
+        commands = [keyframe_command(video_path, size, t)
+                    for t in nearest_keyframes(times, _keyframes_from(index))]
+
+    frames = []
+    for cmd in commands:
+        result = run(cmd, FFMPEG_TIMEOUT)
+        decoded = _frames_from(result, size, 1)
+        if decoded is not None:
+            frames.append(decoded[0])
+        elif is_permanent(result):
+            return None, failure_reason(result, FFMPEG_TIMEOUT)
+    if not frames:
+        return extract_frames(video_path, size, count, duration, run=run)
+    return np.stack(frames), None
+
+
+def sample_frames(video_path, size, count=1, duration=None, run=None, strategy="seek"):
+    """extract_frames or extract_keyframes, by strategy name"""
+    if strategy == "keyframe":
+        return extract_keyframes(video_path, size, count, duration, run=run)
+    if strategy != "seek":
+        raise ValueError(f"Unknown frame sampling strategy: {strategy}")
+    return extract_frames(video_path, size, count, duration, run=run)
+
+
+def frame_to_tensor(frames):
+    """(H, W, 3) or (n, H, W, 3) uint8 RGB -> normalized (n, 3, H, W) float tensor for CLIP"""
+    import torch
+
+    if frames.ndim == 3:
+        frames = frames[None]
+    tensor = torch.from_numpy(frames).permute(0, 3, 1, 2).float().div_(255.0)
+    mean = torch.tensor(CLIP_MEAN).view(1, 3, 1, 1)
+    std = torch.tensor(CLIP_STD).view(1, 3, 1, 1)
+    return tensor.sub_(mean).div_(std)
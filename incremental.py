@@ -0,0 +1,124 @@
+import numpy as np
+from ann_index import IVFIndex
+from clustering import DuplicateGroups, cluster
+from similarity import similar_pairs, stack_embeddings
+
+
+class IncrementalMatcher:
+    """Duplicate groups kept up to date as files arrive, without re-matching the library.
+
+    New vectors are radius-queried against the persisted IVF index (every
+    list when nprobe is None, so no pair is missed), matched among
+    themselves and then added to it. Only the groups the new edges touch
+    are re-clustered from their saved edges; with single linkage the
+    result equals a full find_duplicates run. Only multi-file groups are
+    kept, in the shape save_groups writes.
+    """
+
+    def __init__(self, index, groups, threshold, linkage="single", nprobe=None):
+        self.index = index
+        self.groups = DuplicateGroups()
+        for rep, members in (groups or {}).items():
+            if len(members) > 1:
+                self.groups[rep] = members
+                self.groups.edges[rep] = getattr(groups, "edges", {}).get(rep, [])
+        self.threshold = threshold
+        self.linkage = linkage
+        self.nprobe = nprobe
+        self.indexed = set(index.paths) if index is not None else set()
+        self._group_of = {m: rep for rep, members in self.groups.items() for m in members}
+
+    def __contains__(self, path):
+        return path in self.indexed
+
+    def __len__(self):
+        return len(self.indexed)
+
+    def _vectors(self, paths):
+        row = {p: i for i, p in enumerate(self.index.paths)}
+        return self.index.vectors[[row[p] for p in paths]]
+
+    def _regroup(self, reps, paths, edges, drop=frozenset()):
+        """Re-cluster the groups `reps` together with `paths` over their saved edges plus `edges`"""
+        members = set(paths)
+        edges = list(edges)
+        for rep in reps:
+            members.update(self.groups.pop(rep, ()))
+            edges.extend(self.groups.edges.pop(rep, ()))
+        for m in members:
+            self._group_of.pop(m, None)
+        members = members - drop
+        # Prefilter-linked members have no vector; cluster() expects them after the matrix rows
+        embedded = sorted(m for m in members if m in self.indexed)
+        members = embedded + sorted(m for m in members if m not in self.indexed)
+        position = {p: i for i, p in enumerate(members)}
+        edges = [(a, b, s) for a, b, s in edges if a in position and b in position]
+        matrix = self._vectors(embedded) if self.linkage == "centroid" else None
+        regrouped = cluster(members, [position[a] for a, _, _ in edges], [position[b] for _, b, _ in edges],
+                            [s for _, _, s in edges], self.linkage, matrix=matrix, threshold=self.threshold)
+        changed = []
+        for rep, group in regrouped.items():
+            if len(group) < 2:
+                continue
+            self.groups[rep] = group
+            self.groups.edges[rep] = regrouped.edges[rep]
+            for m in group:
+                self._group_of[m] = rep
+            changed.append(rep)
+        return changed
+
+    def stale(self, video_embeddings):
+        """Indexed paths whose embedding in {path: embedding} differs from the indexed one, e.g. re-scanned files"""
+        paths = [p for p in video_embeddings if p in self.indexed]
+        if not paths:
+            return []
+        paths, matrix = stack_embeddings({p: video_embeddings[p] for p in paths}, "mean")
+        changed = np.any(np.abs(self._vectors(paths) - matrix) > 1e-6, axis=1)
+        return [p for p, c in zip(paths, changed) if c]
+
+    def remove(self, paths):
+        """Forget deleted or re-embedded files; returns the representatives of groups that changed"""
+        paths = [p for p in paths if p in self.indexed]
+        if not paths:
+            return []
+        self.index.remove(paths)
+        self.indexed.difference_update(paths)
+        reps = {self._group_of[p] for p in paths if p in self._group_of}
+        return self._regroup(reps, (), (), drop=frozenset(paths))
+
+    def add(self, video_embeddings):
+        """Match {path: embedding} against everything seen so far and insert it.
+
+        Returns the representatives of the groups that were created or changed.
+        """
+        paths, matrix = stack_embeddings(video_embeddings, "mean")
+        if not paths:
+            return []
+        changed = self.remove(paths)
+
+        edges = []
+        if self.index is not None and len(self.index):
+            nprobe = self.nprobe or len(self.index.centroids)
+            for path, (rows, sims) in zip(paths, self.index.radius_query(matrix, self.threshold, nprobe)):
+                edges.extend((self.index.paths[r], path, s) for r, s in zip(rows.tolist(), sims.tolist()))
+        rows, cols, sims = similar_pairs(matrix, self.threshold)
+        edges.extend((paths[i], paths[j], s) for i, j, s in zip(rows.tolist(), cols.tolist(), sims.tolist()))
+
+        if self.index is None:
+            self.index = IVFIndex.build(paths, matrix)
+        else:
+            self.index.add(paths, matrix)
+        self.indexed.update(paths)
+
+        touched = {p for a, b, _ in edges for p in (a, b)}
+        reps = {self._group_of[p] for p in touched if p in self._group_of}
+        changed = set(changed) | set(self._regroup(reps, touched, edges))
+        return [rep for rep in self.groups if rep in changed]
+
+    def subset(self, reps):
+        """DuplicateGroups holding only the given groups, e.g. to apply just the new ones"""
+        groups = DuplicateGroups()
+        for rep in reps:
+            groups[rep] = self.groups[rep]
+            groups.edges[rep] = self.groups.edges.get(rep, [])
+        return groups
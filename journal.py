@@ -0,0 +1,181 @@
+import os
+import json
+import time
+
+FLUSH_EVERY = 50  # Completed files between commits
+FLUSH_SECONDS = 30.0  # ...or at most this long between commits
+
+
+class ScanJournal:
+    """Checkpointed record of a scan job, kept in the embedding store's database.
+
+    Completed embeddings go straight into the store and are committed every
+    FLUSH_EVERY files or FLUSH_SECONDS, so a crash or Stop loses at most one
+    checkpoint. Files that could not be embedded are recorded with a reason,
+    keyed by size + mtime like the cache, and skipped on the next run until
+    they change. An unfinished job for the same roots is resumed, keeping its
+    counters, so progress covers work done before the interruption.
+    """
+
+    def __init__(self, store, flush_every=FLUSH_EVERY, flush_seconds=FLUSH_SECONDS):
+        self.store = store
+        self.conn = store.conn
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                roots TEXT NOT NULL,
+                status TEXT NOT NULL,
+                started REAL NOT NULL,
+                updated REAL NOT NULL,
+                total INTEGER,
+                done INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS failures (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                reason TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                last_attempt REAL NOT NULL
+            )"""
+        )
+        self.conn.commit()
+        self.job_id = None
+        self.resumed = False
+        self.total = None
+        self.cached = 0
+        self.done = 0
+        self.failed = 0
+        self._carried = 0  # done + failed when the job was resumed
+        self._failures = {}
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    @staticmethod
+    def _roots_key(roots):
+        return json.dumps(sorted(os.path.normcase(os.path.abspath(root)) for root in roots))
+
+    def start(self, roots, retry_failed=False):
+        """Resume the latest unfinished job over the same roots, or open a new one"""
+        key = self._roots_key(roots)
+        row = self.conn.execute(
+            "SELECT id, done, failed FROM jobs WHERE roots = ? AND status != 'done' ORDER BY id DESC LIMIT 1",
+            (key,),
+        ).fetchone()
+        now = time.time()
+        if row is not None:
+            self.job_id, self.done, self.failed = row
+            self.resumed = True
+            self._carried = self.done + self.failed
+            self.conn.execute("UPDATE jobs SET status = 'running', updated = ? WHERE id = ?", (now, self.job_id))
+        else:
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (roots, status, started, updated) VALUES (?, 'running', ?, ?)",
+                (key, now, now),
+            )
+            self.job_id = cursor.lastrowid
+        self.conn.commit()
+        if not retry_failed:
+            self._failures = {
+                path: (size, mtime)
+                for path, size, mtime in self.conn.execute("SELECT path, size, mtime FROM failures")
+            }
+        return self
+
+    def set_total(self, total, cached=0, skipped=0):
+        """Files in this scan, how many were already embedded and how many are skipped as known failures.
+
+        On a resumed job the files finished before the interruption are in
+        the cache (or the failure table) by now, so they are counted once.
+        Files finished in this session are not, so a streaming scan may call
+        this after embedding has started.
+        """
+        self.total = total
+        self.cached = max(0, cached + skipped - self._carried)
+
+    def completed(self):
+        """Files accounted for so far: cached, skipped, embedded or failed"""
+        return self.cached + self.done + self.failed
+
+    def progress(self):
+        """Completed fraction in [0, 1], or None while the total is unknown"""
+        if not self.total:
+            return None
+        return min(1.0, self.completed() / self.total)
+
+    def is_failed(self, path, st=None):
+        """True if path already failed with its current size and mtime"""
+        if path not in self._failures:
+            return False
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return True
+        return (st.st_size, st.st_mtime_ns) == self._failures[path]
+
+    def skip_failed(self, video_files):
+        """Drop files that already failed and have not changed since.
+
+        video_files is a list of paths or a {path: os.stat_result} mapping;
+        the same type is returned.
+        """
+        if isinstance(video_files, dict):
+            return {path: st for path, st in video_files.items() if not self.is_failed(path, st)}
+        return [path for path in video_files if not self.is_failed(path)]
+
+    def record(self, path, embedding, st=None):
+        """Store a finished embedding and checkpoint when due"""
+        if st is not None:
+            self.store.put(path, embedding, st.st_size, st.st_mtime_ns)
+        else:
+            self.store.put(path, embedding)
+        self.conn.execute("DELETE FROM failures WHERE path = ?", (path,))
+        self.done += 1
+        self._tick()
+
+    def fail(self, path, reason, st=None):
+        """Remember that path could not be embedded, and why"""
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return
+        self.conn.execute(
+            """INSERT INTO failures (path, size, mtime, reason, attempts, last_attempt)
+               VALUES (?, ?, ?, ?, 1, ?)
+               ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime,
+                   reason = excluded.reason, attempts = attempts + 1, last_attempt = excluded.last_attempt""",
+            (path, st.st_size, st.st_mtime_ns, reason, time.time()),
+        )
+        self.failed += 1
+        self._tick()
+
+    def failures(self):
+        """[(path, reason, attempts)] of all recorded failures"""
+        return self.conn.execute("SELECT path, reason, attempts FROM failures ORDER BY path").fetchall()
+
+    def _tick(self):
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self, status=None):
+        """Checkpoint counters and everything stored since the last flush"""
+        self.conn.execute(
+            "UPDATE jobs SET status = COALESCE(?, status), updated = ?, total = ?, done = ?, failed = ? WHERE id = ?",
+            (status, time.time(), self.total, self.done, self.failed, self.job_id),
+        )
+        self.store.commit()
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def stop(self):
+        """Checkpoint an interrupted job; the next start() over the same roots resumes it"""
+        self.flush("stopped")
+
+    def finish(self):
+        self.flush("done")
@@ -1,166 +1,871 @@
 import os
-import subprocess
-import shutil
-import torch
+import sys
+import json
+import time
+import socket
+import argparse
+import itertools
+import threading
+import multiprocessing
 from PIL import Image
-import clip
-import glob
 from tqdm import tqdm
-from collections import defaultdict
-import io
-
-# --- Settings ---
-SOURCE_DIRS = [
-    r"C:\Users\Noie\Downloads\Video",
-    r"D:\new",
-    r"D:\new-2",
-    r"D:\new-3",
-    r"D:\new-4",
-    r"D:\new-5",
-    r"D:\new-6",
-    r"D:\new-7",
-    r"D:\new-8",
-    r"D:\new-9",
-    r"D:\new-10",
-    r"D:\big-fav",
-    r"D:\video",
-]
-
-FRAME_DIR = r"D:\vid-frame"
-DUPLICATE_DIR = r"D:\vid-duplicated"  # New folder for duplicates
-CLIP_MODEL = "ViT-B/32"
-SIMILARITY_THRESHOLD = 0.95
-KEEP_BEST = True
-
-# --- Setup ---
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model, preprocess = clip.load(CLIP_MODEL, device=device)
-
-# Create necessary directories
-os.makedirs(FRAME_DIR, exist_ok=True)
-os.makedirs(DUPLICATE_DIR, exist_ok=True)  # Create duplicates folder
+import hashlib
+from functools import partial
+import numpy as np
+import config
+from embedding_store import EmbeddingStore
+from similarity import stack_embeddings, similar_pairs
+import ann_index
+from pipeline import configure_torch_threads, embed_videos
+from metrics import Metrics
+from frames import PREPROCESS_VERSION, frame_to_tensor, sample_frames
+from probe import PROBE_WORKERS, LazyProbe, probe_videos, video_score
+from subprocess_runner import AsyncRunner
+from prefilter import Cascade
+from audio import AudioCheck
+from discovery import scan
+from journal import ScanJournal
+from clustering import DuplicateGroups, cluster
+import compact
+import mover
+import shards
+import reports
+from results import ResultsDB
+from incremental import IncrementalMatcher
+from encoders import BACKENDS, DRIFT_TOLERANCE, QUANTIZATION, build_encoder, validate
+
+# Input resolution of CLIP models that do not use the default 224px
+INPUT_SIZES = {"RN50x4": 288, "RN50x16": 384, "RN50x64": 448, "ViT-L/14@336px": 336}
+# Image embedding width of CLIP models that do not use the default 512
+EMBED_DIMS = {"RN50": 1024, "RN50x4": 640, "RN50x16": 768, "RN50x64": 1024,
+              "ViT-L/14": 768, "ViT-L/14@336px": 768}
+
+# --- Model ---
+_model = None
+_model_lock = threading.Lock()
+
+def load_clip():
+    """Load the reference CLIP model; returns (model, preprocess, device)"""
+    import torch
+    import clip
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if device == "cpu":
+        configure_torch_threads(config.TORCH_THREADS)
+    model, preprocess = clip.load(config.CLIP_MODEL, device=device)
+    return model.eval(), preprocess, device
+
+def get_model():
+    """Load the CLIP model on first use; returns (model, preprocess, device).
+
+    On CPU the image encoder is swapped for config.ENCODER_BACKEND; anything
+    exposing encode_image() works in its place.
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            model, preprocess, device = load_clip()
+            if device == "cpu":
+                model = build_encoder(model, config.ENCODER_BACKEND, config.ENCODER_BATCH, input_size(),
+                                      model_name=config.CLIP_MODEL, cache_dir=config.FRAME_DIR,
+                                      threads=config.TORCH_THREADS)
+            _model = (model, preprocess, device)
+    return _model
+
+def input_size():
+    """Model input resolution, known without loading the model"""
+    return INPUT_SIZES.get(config.CLIP_MODEL, 224)
+
+def embedding_dim():
+    """Model embedding width, known without loading the model"""
+    return EMBED_DIMS.get(config.CLIP_MODEL, 512)
 
 # --- Backend Functions ---
-def extract_frame(video_path, output_path):
-    """Robust frame extraction with multiple fallback methods"""
-    for seek_time in ["00:05:00", "00:02:00", "00:10:00"]:
-        try:
-            cmd = [
-                "ffmpeg",
-                "-ss", seek_time,
-                "-i", video_path,
-                "-vframes", "1",
-                "-q:v", "2",
-                "-f", "image2",
-                "-y",
-                output_path
-            ]
-            subprocess.run(cmd, check=True, stderr=subprocess.PIPE, stdout=subprocess.PIPE, timeout=10)
-            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                return True
-        except:
-            continue
-    
+def frame_path_for(video_path, frame_dir=None, index=0):
+    """Frame file for video_path; the path hash keeps equal basenames in different folders apart"""
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    digest = hashlib.sha1(os.path.abspath(video_path).encode("utf-8")).hexdigest()[:10]
+    suffix = f"-{index}" if index else ""
+    return os.path.join(frame_dir or config.FRAME_DIR, f"{stem}-{digest}{suffix}.jpg")
+
+def load_frame(video_path, frame_dir=None, save_frames=None, frame_count=None, metadata=None,
+               run=None, failures=None):
+    """Decode the signature frames in memory at the model's input size: (n, H, W, 3) or None.
+
+    run is the command runner (an AsyncRunner's run, or blocking subprocess
+    by default); when decoding fails the reason is stored in failures[video_path].
+    """
+    frame_count = frame_count or config.SIGNATURE_FRAMES
+    info = (metadata or {}).get(video_path) or {}
+    frames, reason = sample_frames(video_path, input_size(), frame_count, info.get("duration"), run=run,
+                                   strategy=config.FRAME_SAMPLING)
+    if frames is None:
+        if failures is not None:
+            failures[video_path] = reason
+        return None
+    if config.SAVE_FRAMES if save_frames is None else save_frames:
+        frame_dir = frame_dir or config.FRAME_DIR
+        os.makedirs(frame_dir, exist_ok=True)
+        for i, frame in enumerate(frames):
+            Image.fromarray(frame).save(frame_path_for(video_path, frame_dir, i), "JPEG", quality=90)
+    return frames
+
+def embed_video(video_path, frame_dir=None, metadata=None, failures=None):
+    """Embed a single video without batching; returns the embedding or None"""
+    import torch
+
+    frames = load_frame(video_path, frame_dir, metadata=metadata, failures=failures)
+    if frames is None:
+        return None
+    model, _, device = get_model()
+    images = frame_to_tensor(frames).to(device)
+    with torch.inference_mode():
+        signature = model.encode_image(images).float().cpu().numpy()
+    return signature[0] if len(signature) == 1 else signature
+
+def embed_pending(video_files, frame_dir=None, stats=None, should_stop=None, store=None, failures=None):
+    """Run the batched embedding pipeline, or the process pool when EMBED_PROCESSES > 0;
+    yields (path, embedding or None).
+
+    video_files may be a generator, e.g. fed by discovery; the extraction
+    threads then probe each file as it arrives instead of all of them upfront.
+    With ASYNC_SUBPROCESS, ffprobe and ffmpeg run on an AsyncRunner whose
+    concurrency adapts to decode latency and which kills them on should_stop.
+    Reasons for files that could not be decoded land in failures.
+    """
+    if not isinstance(video_files, (list, tuple)) and config.EMBED_PROCESSES:
+        video_files = list(video_files)  # The pool sizes its shared array upfront
+    if config.EMBED_PROCESSES:
+        from process_pool import embed_in_processes
+        return embed_in_processes(
+            video_files, embedding_dim(), config.SIGNATURE_FRAMES, workers=config.EMBED_PROCESSES,
+            metadata=probe_videos(video_files, store), should_stop=should_stop, failures=failures,
+        )
+
+    runner = None
+    workers = config.EXTRACT_WORKERS
+    if config.ASYNC_SUBPROCESS:
+        runner = AsyncRunner(config.EXTRACT_WORKERS, maximum=config.MAX_SUBPROCESSES)
+        if should_stop is not None:
+            runner.watch(should_stop)
+        # Threads only wait on the runner; its limit decides how many processes run
+        workers = runner.limit.maximum
+    run = runner.run if runner is not None else None
+    # Probed durations pick seek points inside each video instead of guessing
+    if isinstance(video_files, (list, tuple)):
+        metadata = probe_videos(video_files, store, workers=max(workers, PROBE_WORKERS), run=run, stats=stats)
+    else:
+        metadata = LazyProbe(store, run=run, stats=stats)
+    model, _, device = get_model()
+    load = partial(load_frame, frame_dir=frame_dir, metadata=metadata, run=run, failures=failures)
+    results = embed_videos(
+        video_files, load, model, frame_to_tensor, device,
+        batch_size=config.BATCH_SIZE, workers=workers, stats=stats, should_stop=should_stop,
+    )
+    return results if runner is None else _closing(results, runner)
+
+def _closing(results, runner):
     try:
-        cmd = [
-            "ffmpeg",
-            "-ss", "00:05:00",
-            "-i", video_path,
-            "-vframes", "1",
-            "-f", "rawvideo",
-            "-pix_fmt", "rgb24",
-            "-s", "1920x1080",
-            "-y",
-            "-"
-        ]
-        result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10)
-        if result.stdout:
-            img = Image.frombytes('RGB', (1920, 1080), result.stdout)
-            img.save(output_path, "JPEG", quality=90)
-            return True
-    except:
-        return False
-
-def process_videos(source_dirs):
-    """Process all videos and extract embeddings"""
-    video_files = []
-    for dir_path in source_dirs:
-        video_files.extend(glob.glob(os.path.join(dir_path, "**", "*.mp4"), recursive=True))
-        video_files.extend(glob.glob(os.path.join(dir_path, "**", "*.ts"), recursive=True))
+        yield from results
+    finally:
+        results.close()
+        runner.close()
 
-    video_embeddings = {}
+def find_videos(source_dirs, extensions=None, stats=None):
+    """All video files under source_dirs as {path: os.stat_result}, in discovery order"""
+    stats = stats or Metrics()
+    with stats.timer("discover") as timing:
+        files = dict(scan(source_dirs, extensions or config.EXTENSIONS))
+        timing.items = len(files)
+    return files
+
+def model_id():
+    """What makes two cached embeddings comparable"""
+    # Signatures with a different frame count, input size or decoding are not comparable either
+    model_id = (f"{config.CLIP_MODEL}|frames={config.SIGNATURE_FRAMES}|size={input_size()}"
+                f"|preprocess={PREPROCESS_VERSION}")
+    if config.FRAME_SAMPLING != "seek":
+        # I-frames sit near, not at, the sampling points; keep their embeddings apart
+        model_id += f"|sampling={config.FRAME_SAMPLING}"
+    if config.ENCODER_BACKEND != "eager":
+        # Within DRIFT_TOLERANCE of eager, but not the same vectors; quantized ones drift the most
+        backend = config.ENCODER_BACKEND
+        if backend in QUANTIZATION:
+            backend += f"-{QUANTIZATION[backend]}"
+        model_id += f"|encoder={backend}"
+    return model_id
 
-    for video_path in tqdm(video_files):
-        filename = os.path.basename(video_path)
-        frame_path = os.path.join(FRAME_DIR, os.path.splitext(filename)[0] + ".jpg")
-        
-        if extract_frame(video_path, frame_path):
+def preprocess_info():
+    return {"version": PREPROCESS_VERSION, "input_size": input_size()}
+
+def open_store(db_path=None):
+    """Open the on-disk embedding cache for the current model"""
+    return EmbeddingStore(db_path or config.embedding_db_path(), model_id(), use_fingerprint=config.USE_FINGERPRINT)
+
+def run_prefilter(video_files, pending, cascade, store=None, stats=None):
+    """Run the cheap dedup cascade; returns the pending files CLIP still has to embed"""
+    metadata = probe_videos(video_files, store, stats=stats)
+    if isinstance(video_files, dict):
+        sizes = {path: st.st_size for path, st in video_files.items()}
+    else:
+        sizes = {}
+        for path in video_files:
             try:
-                image = preprocess(Image.open(frame_path)).unsqueeze(0).to(device)
-                with torch.no_grad():
-                    embedding = model.encode_image(image).cpu().numpy()
-                video_embeddings[video_path] = embedding[0]
-            except:
+                sizes[path] = os.path.getsize(path)
+            except OSError:
                 continue
+    cascade.run(video_files, sizes, metadata, partial(load_frame, metadata=metadata), pending)
+    if store is not None:
+        # Keep the perceptual hashes so the next scan does not decode again
+        for path, info in metadata.items():
+            if info.get("phash") is not None:
+                store.put_metadata(path, info)
+        store.commit()
+    print(f"Prefilter: {dict(cascade.stats)}")
+    return [path for path in pending if path in cascade.needs_embedding]
+
+def process_videos(source_dirs, store=None, cascade=None, journal=None, should_stop=None, on_progress=None,
+                   stats=None):
+    """Process all videos and extract embeddings, reusing cached ones from store.
+
+    Without a prefilter, discovered files stream straight into extraction
+    while the walk is still running. When a prefilter Cascade is given,
+    discovery finishes first, only files it cannot decide are embedded and
+    its decided pairs are left in cascade.edges.
+
+    With a store, progress is checkpointed through a ScanJournal (one is
+    started if not given): an interrupted scan resumes where it stopped and
+    files that failed before are skipped until they change.
+    on_progress(journal) is called after every file; stats (a Metrics)
+    collects per-stage timings and the "files" progress counter.
+    """
+    stats = stats or Metrics()
+    if store is not None and journal is None:
+        journal = ScanJournal(store).start(source_dirs)
+    video_embeddings = {}
+    discovered = {}
+    counts = {"cached": 0, "skipped": 0}
+
+    if cascade is None and not config.EMBED_PROCESSES:
+        def pending_files():
+            # Runs on the extraction threads, one file at a time under the pipeline's lock
+            for path, st in scan(source_dirs, config.EXTENSIONS):
+                discovered[path] = st
+                stats.count("discovered")
+                if journal is not None and journal.is_failed(path, st):
+                    counts["skipped"] += 1
+                    continue
+                cached = store.get(path, st.st_size, st.st_mtime_ns) if store is not None else None
+                if cached is None:
+                    yield path
+                else:
+                    counts["cached"] += 1
+                    video_embeddings[path] = cached
+            stats.set_total("files", len(discovered) - counts["cached"] - counts["skipped"])
+            if journal is not None:
+                journal.set_total(len(discovered), counts["cached"], counts["skipped"])
+        video_files = pending_files()
+        # Walk until the first uncached file so a fully cached tree never loads the model
+        first = next(video_files, None)
+        video_files = itertools.chain([first], video_files) if first is not None else []
+        total = None
+    else:
+        discovered = find_videos(source_dirs, stats=stats)
+        candidates = journal.skip_failed(discovered) if journal is not None else discovered
+        video_files = list(candidates)
+        if store is not None:
+            video_embeddings, video_files = store.split_cached(candidates)
+        if cascade is not None:
+            video_files = run_prefilter(discovered, video_files, cascade, store, stats)
+        if journal is not None:
+            # Cached and prefilter-decided files are settled; known failures are skipped
+            journal.set_total(len(discovered), len(candidates) - len(video_files), len(discovered) - len(candidates))
+        total = len(video_files)
+        stats.set_total("files", total)
+
+    try:
+        if video_files:
+            failures = {}
+            results = embed_pending(video_files, stats=stats, should_stop=should_stop, store=store, failures=failures)
+            for video_path, embedding in tqdm(results, total=total):
+                if embedding is None:
+                    reason = failures.get(video_path, "no frame decoded")
+                    if journal is not None and reason != "cancelled":
+                        journal.fail(video_path, reason, discovered.get(video_path))
+                elif journal is not None:
+                    video_embeddings[video_path] = embedding
+                    journal.record(video_path, embedding, discovered[video_path])
+                else:
+                    video_embeddings[video_path] = embedding
+                stats.count("files")
+                if on_progress is not None:
+                    on_progress(journal)
+            print(f"Pipeline throughput: {stats.summary()}")
+    except BaseException:
+        # Crash, Ctrl+C: keep what is done so far for the next run
+        if journal is not None:
+            journal.stop()
+        raise
 
+    if journal is not None:
+        if should_stop is not None and should_stop():
+            journal.stop()
+            return video_embeddings
+        store.prune(discovered, source_dirs)
+        journal.finish()
     return video_embeddings
 
-def find_duplicates(video_embeddings, similarity_threshold):
-    """Group videos by similarity"""
-    groups = defaultdict(list)
-    processed = set()
+def find_similar_pairs(paths, matrix, similarity_threshold, backend=None, block_size=None, index_path=None):
+    """Return (i, j, similarity) arrays indexing into paths for pairs above the threshold"""
+    backend = backend or config.MATCH_BACKEND
+    if backend == "exact" or len(paths) < 2:
+        return similar_pairs(matrix, similarity_threshold, block_size or config.SIMILARITY_BLOCK_SIZE)
+    if backend != "ann":
+        raise ValueError(f"Unknown match backend: {backend}")
+    if matrix.ndim != 2:
+        raise ValueError("The ann backend needs one vector per video; use SIGNATURE_MODE = 'mean'")
 
-    for path1, emb1 in video_embeddings.items():
-        if path1 in processed:
-            continue
-        group = [path1]
-        for path2, emb2 in video_embeddings.items():
-            if path2 not in processed and path2 != path1:
-                sim = float(torch.nn.functional.cosine_similarity(
-                    torch.tensor(emb1), torch.tensor(emb2), dim=0
-                ))
-                if sim > similarity_threshold:
-                    group.append(path2)
-                    processed.add(path2)
-        groups[path1] = group
+    index_path = index_path or config.ann_index_path()
+    index = ann_index.load_or_build(index_path, paths, matrix, nprobe=config.ANN_NPROBE)
+    index.save(index_path)
+    rows, cols, sims = index.similar_pairs(similarity_threshold)
+    # Index rows are in insertion order; map them back onto paths
+    position = {path: i for i, path in enumerate(paths)}
+    lookup = np.array([position[path] for path in index.paths], dtype=np.int64)
+    return lookup[rows], lookup[cols], sims
 
-    return groups
+def audio_check(store=None, stats=None):
+    """AudioCheck for near-threshold pairs when config.AUDIO_FINGERPRINT is on, else None"""
+    if not config.AUDIO_FINGERPRINT:
+        return None
+    return AudioCheck(config.AUDIO_MARGIN, config.AUDIO_WEIGHT, store=store, stats=stats)
+
+def find_duplicates(video_embeddings, similarity_threshold, block_size=None,
+                    backend=None, signature_mode=None, extra_edges=None, linkage=None, stats=None, audio=None):
+    """Cluster videos over the edges above the threshold, plus (path_a, path_b, similarity) pairs decided elsewhere.
+
+    video_embeddings may also be a compact.CompactEmbeddings code matrix.
+    With an AudioCheck, pairs are searched down to threshold - margin and
+    the ones near the threshold are decided by visual and audio together.
+    Returns a DuplicateGroups dict {representative: [members]} whose
+    `edges` explain each group.
+    """
+    search_threshold = similarity_threshold - audio.margin if audio is not None else similarity_threshold
+    with (stats or Metrics()).timer("match", len(video_embeddings)):
+        if isinstance(video_embeddings, compact.CompactEmbeddings):
+            # Searched on the codes with its own blocked scan; match_backend does not apply
+            paths, matrix = list(video_embeddings.paths), video_embeddings
+            rows, cols, sims = matrix.similar_pairs(search_threshold, block_size or config.SIMILARITY_BLOCK_SIZE)
+        else:
+            paths, matrix = stack_embeddings(video_embeddings, signature_mode or config.SIGNATURE_MODE)
+            rows, cols, sims = find_similar_pairs(paths, matrix, search_threshold, backend, block_size)
+    if audio is not None:
+        rows, cols, sims = audio.rescore(paths, rows, cols, sims, similarity_threshold)
+    rows, cols, sims = rows.tolist(), cols.tolist(), sims.tolist()
+
+    position = {path: i for i, path in enumerate(paths)}
+    for path_a, path_b, similarity in extra_edges or ():
+        for path in (path_a, path_b):
+            if path not in position:
+                position[path] = len(paths)
+                paths.append(path)
+        rows.append(position[path_a])
+        cols.append(position[path_b])
+        sims.append(similarity)
 
-def process_duplicates(groups, keep_best, duplicate_dir):
-    """Move duplicates to a separate folder"""
-    def get_video_score(filepath):
-        """Score based on duration, resolution and bitrate"""
-        try:
-            cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0",
-                   "-show_entries", "stream=width,height,bit_rate", "-of", "csv=p=0", filepath]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            width, height, bitrate = map(int, result.stdout.strip().split(","))
-            
-            cmd = ["ffprobe", "-v", "error", "-show_entries",
-                   "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", filepath]
-            duration = float(subprocess.run(cmd, capture_output=True, text=True).stdout.strip())
-            
-            return width * height * duration * (bitrate if bitrate > 0 else 1)
-        except:
-            return 0
+    return cluster(paths, rows, cols, sims, linkage or config.CLUSTER_LINKAGE,
+                   matrix=matrix, threshold=similarity_threshold)
 
+def explain_match(groups, representative, path):
+    """(other path, similarity) of the strongest edge that put path in its group"""
+    if isinstance(groups, DuplicateGroups):
+        return groups.best_match(representative, path)
+    return None, None
+
+def rank_group(group, metadata):
+    """Group members as (score, path), best first"""
+    return sorted([(video_score(metadata.get(path)), path) for path in group], reverse=True)
+
+def plan_duplicates(groups, duplicate_dir, store=None, stats=None, metadata=None):
+    """Move plan for all but the best file of each group: a list of mover.Move"""
+    if metadata is None:
+        metadata = probe_videos(group_members(groups), store, stats=stats)
+    duplicates = []
     for group in groups.values():
         if len(group) <= 1:
             continue
-        
-        scored = sorted([(get_video_score(path), path) for path in group], reverse=True)
-        best = scored[0][1]
-        
-        if keep_best:
-            for score, path in scored[1:]:
-                try:
-                    dest_path = os.path.join(duplicate_dir, os.path.basename(path))
-                    shutil.move(path, dest_path)
-                except Exception as e:
-                    print(f"Failed to move {os.path.basename(path)}: {str(e)}")
+        scored = rank_group(group, metadata)
+        keeper = scored[0][1]
+        for score, path in scored[1:]:
+            match, similarity = explain_match(groups, group[0], path)
+            duplicates.append((path, keeper, match, similarity))
+    return mover.plan_moves(duplicates, duplicate_dir, per_volume=config.QUARANTINE_PER_VOLUME)
+
+def group_members(groups):
+    return [path for group in groups.values() if len(group) > 1 for path in group]
+
+def print_plan(plan):
+    for move in plan:
+        reason = f" (matches {os.path.basename(move.match)} at {move.similarity:.3f})" if move.match else ""
+        print(f"Would {move.method} {move.source} -> {move.dest}{reason}")
+
+def execute_plan(plan, stats=None, should_stop=None, results=None, run_id=None):
+    """Carry out a move plan, journaling every move (and recording it in results); returns mover.execute's result"""
+    journal_path = config.move_journal_path()
+    result = mover.execute(plan, journal_path, config.COPY_WORKERS_PER_DEVICE, stats=stats, should_stop=should_stop)
+    if results is not None:
+        results.record_moves(run_id, plan, result["done"], result["failed"])
+    for path, error in result["failed"]:
+        print(f"Failed to move {os.path.basename(path)}: {error}")
+    print(f"Moved {result['moved']} of {len(plan)} duplicates; undo with `main.py undo --journal {journal_path}`")
+    return result
+
+def record_run(results, groups, metadata, status, threshold=None):
+    """Store groups with their scores, keepers and best edges as a new run; returns its id.
+
+    threshold is the one the groups were matched at, when a GUI overrides config.SIMILARITY_THRESHOLD.
+    """
+    threshold = config.SIMILARITY_THRESHOLD if threshold is None else threshold
+    run_id = results.start_run(threshold, dict(config.snapshot(), SIMILARITY_THRESHOLD=threshold), status)
+    results.record_groups(run_id, groups, lambda group: rank_group(group, metadata), metadata,
+                          lambda rep, path: explain_match(groups, rep, path))
+    return run_id
+
+def plan_reviewed(results, run_id, duplicate_dir, accepted_only=False):
+    """Move plan for a recorded run, with the keepers picked and the groups skipped in review"""
+    return mover.plan_moves(results.planned_duplicates(run_id, accepted_only), duplicate_dir,
+                            per_volume=config.QUARANTINE_PER_VOLUME)
+
+def process_duplicates(groups, keep_best, duplicate_dir, store=None, dry_run=False, stats=None, results=None,
+                       threshold=None):
+    """Move duplicates to a separate folder: plan the moves, then print them (dry run) or carry them out.
+
+    With a ResultsDB the groups, keepers and move outcomes are recorded as a
+    run, under threshold if the groups were not matched at the configured one.
+    """
+    if not keep_best:
+        return []
+    metadata = probe_videos(group_members(groups), store, stats=stats)
+    run_id = record_run(results, groups, metadata, "planned", threshold) if results is not None else None
+    plan = plan_duplicates(groups, duplicate_dir, metadata=metadata)
+    if dry_run:
+        print_plan(plan)
+        print(f"Plan written to {mover.save_plan(plan, config.move_plan_path())}")
+    elif plan:
+        execute_plan(plan, stats, results=results, run_id=run_id)
+    if results is not None:
+        results.finish_run(run_id, "dry-run" if dry_run else "applied")
+    return plan
+
+# --- Saved results ---
+def save_groups(groups, path=None):
+    """Write the multi-file groups as JSON for the apply/report steps"""
+    path = path or config.groups_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    multi = [(rep, group) for rep, group in groups.items() if len(group) > 1]
+    edges = getattr(groups, "edges", {})
+    data = {
+        "similarity_threshold": config.SIMILARITY_THRESHOLD,
+        "groups": [group for _, group in multi],
+        "edges": [[list(edge) for edge in edges.get(rep, ())] for rep, _ in multi],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    return path
+
+def load_groups(path=None):
+    """Read groups saved by save_groups, keyed by their first member (the representative)"""
+    with open(path or config.groups_path(), encoding="utf-8") as f:
+        data = json.load(f)
+    groups = DuplicateGroups()
+    edges = data.get("edges") or [[] for _ in data["groups"]]
+    for group, group_edges in zip(data["groups"], edges):
+        groups[group[0]] = group
+        groups.edges[group[0]] = [tuple(edge) for edge in group_edges]
+    return groups
+
+def save_edges(edges, path=None):
+    with open(path or config.prefilter_edges_path(), "w", encoding="utf-8") as f:
+        json.dump(edges, f)
+
+def load_edges(path=None):
+    path = path or config.prefilter_edges_path()
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [tuple(edge) for edge in json.load(f)]
+
+def _saved_threshold(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("similarity_threshold")
+
+def open_matcher(store, stats=None):
+    """IncrementalMatcher over the saved index and groups, built from the whole cache the first time"""
+    if config.SIGNATURE_MODE != "mean":
+        raise ValueError("Incremental matching needs one vector per video; use SIGNATURE_MODE = 'mean'")
+    index_path, groups_file = config.ann_index_path(), config.groups_path()
+    if (os.path.exists(index_path) and os.path.exists(groups_file)
+            and _saved_threshold(groups_file) == config.SIMILARITY_THRESHOLD):
+        index = ann_index.IVFIndex.load(index_path)
+        index.nprobe = config.ANN_NPROBE
+        groups = load_groups(groups_file)
+    else:
+        print("No saved index and groups for this threshold; matching the whole cache once")
+        video_embeddings = store.load_under(config.SOURCE_DIRS)
+        groups = find_duplicates(video_embeddings, config.SIMILARITY_THRESHOLD, stats=stats)
+        paths, matrix = stack_embeddings(video_embeddings, "mean")
+        index = ann_index.IVFIndex.build(paths, matrix, nprobe=config.ANN_NPROBE) if paths else None
+    # The exact backend probes every list, so incremental results match a full run
+    nprobe = config.ANN_NPROBE if config.MATCH_BACKEND == "ann" else None
+    return IncrementalMatcher(index, groups, config.SIMILARITY_THRESHOLD, config.CLUSTER_LINKAGE, nprobe)
+
+def save_matcher(matcher, groups_file=None):
+    if matcher.index is not None:
+        matcher.index.save(config.ann_index_path())
+    return save_groups(matcher.groups, groups_file)
+
+# --- Command line ---
+def start_journal(store, retry_failed=False):
+    journal = ScanJournal(store).start(config.SOURCE_DIRS, retry_failed=retry_failed)
+    if journal.resumed:
+        print(f"Resuming scan job {journal.job_id}: {journal.done} embedded, {journal.failed} failed so far")
+    return journal
+
+def cmd_scan(args):
+    store = open_store()
+    journal = start_journal(store, args.retry_failed)
+    cascade = Cascade() if config.PREFILTER else None
+    video_embeddings = process_videos(config.SOURCE_DIRS, store, cascade, journal, stats=args.stats)
+    store.close()
+    if cascade is not None:
+        save_edges(cascade.edges)
+    print(f"{len(video_embeddings)} videos embedded, {journal.failed} failed")
+
+def cmd_shard(args):
+    """Scan this node's source folders and export their embeddings as one shard"""
+    node = args.node or socket.gethostname()
+    store = open_store()
+    process_videos(config.SOURCE_DIRS, store, None, start_journal(store), stats=args.stats)
+    paths = store.paths_under(config.SOURCE_DIRS)
+    # Probed here, where the files are; the merging node may not reach them
+    metadata = probe_videos(paths, store, stats=args.stats)
+    header = shards.describe(model_id(), preprocess_info(), config.SOURCE_DIRS, node)
+    path = args.output or config.shard_path(node)
+    header = shards.write(path, header, store.iter_under(config.SOURCE_DIRS), metadata)
+    store.close()
+    print(f"Shard {path}: {header['count']} videos from node {node}")
+
+def cmd_merge(args):
+    """Match the embeddings of shards from several nodes against each other"""
+    video_embeddings, metadata, headers = shards.merge(args.shards)
+    for path, header in headers.items():
+        print(f"{path}: {header['count']} videos from {header['node']} ({', '.join(header['roots'])})")
+    # No local store: fingerprints are taken where the files are reachable from here
+    groups = find_duplicates(video_embeddings, config.SIMILARITY_THRESHOLD, stats=args.stats,
+                             audio=audio_check(stats=args.stats))
+    results = ResultsDB(config.results_db_path())
+    run_id = record_run(results, groups, metadata, "matched")
+    results.close()
+    path = save_groups(groups, args.output)
+    duplicates = sum(len(group) - 1 for group in groups.values() if len(group) > 1)
+    print(f"{duplicates} duplicates in {len(video_embeddings)} videos from {len(headers)} shards; "
+          f"run {run_id}, groups written to {path}")
+
+def cmd_index(args):
+    store = open_store()
+    paths, matrix = stack_embeddings(store.load_under(config.SOURCE_DIRS), "mean")
+    store.close()
+    if len(paths) < 2:
+        print("Not enough embeddings to index; run scan first")
+        return
+    index = ann_index.load_or_build(config.ann_index_path(), paths, matrix, nprobe=config.ANN_NPROBE)
+    index.save(config.ann_index_path())
+    print(f"Indexed {len(index)} videos in {len(index.centroids)} lists")
+    if args.check_recall:
+        print(json.dumps(ann_index.measure_recall(index, config.SIMILARITY_THRESHOLD, args.nprobe), indent=2))
+
+def match_incremental(args):
+    """Match cached files the saved index has not seen or has an older embedding of, and forget ones no longer cached"""
+    store = open_store()
+    matcher = open_matcher(store, args.stats)
+    cached = store.paths_under(config.SOURCE_DIRS)
+    present = set(cached)
+    with args.stats.timer("match") as timing:
+        changed = set(matcher.remove([p for p in matcher.indexed if p not in present]))
+        # A file re-embedded since the last match (new size or mtime) is removed and re-added, as watch does
+        updated = matcher.stale(store.vectors([p for p in cached if p in matcher]))
+        new = [p for p in cached if p not in matcher]
+        changed.update(matcher.add(store.vectors(new + updated)))
+        timing.items = len(new) + len(updated)
+    store.close()
+    path = save_matcher(matcher, args.output)
+    changed = [rep for rep in changed if rep in matcher.groups]
+    print(f"{len(new)} new and {len(updated)} changed videos matched against {len(matcher) - len(new) - len(updated)}; "
+          f"{len(changed)} groups changed; groups written to {path}")
+
+def cmd_match(args):
+    if args.incremental:
+        return match_incremental(args)
+    store = open_store()
+    if config.COMPACT_STORAGE:
+        video_embeddings = compact.build(store, config.SOURCE_DIRS, config.compact_embeddings_path(),
+                                         config.COMPACT_STORAGE)
+        print(f"Compact {config.COMPACT_STORAGE} matrix: {video_embeddings.nbytes / 2**20:.1f} MB, "
+              f"similarity error <= {video_embeddings.margin:.4f}")
+    else:
+        video_embeddings = store.load_under(config.SOURCE_DIRS)
+    groups = find_duplicates(video_embeddings, config.SIMILARITY_THRESHOLD, extra_edges=load_edges(), stats=args.stats,
+                             audio=audio_check(store, args.stats))
+    results = ResultsDB(config.results_db_path())
+    record_run(results, groups, probe_videos(group_members(groups), store, stats=args.stats), "matched")
+    results.close()
+    store.close()
+    path = save_groups(groups, args.output)
+    duplicates = sum(len(group) - 1 for group in groups.values() if len(group) > 1)
+    print(f"{duplicates} duplicates in {len(video_embeddings)} videos; groups written to {path}")
+
+def cmd_apply(args):
+    results = ResultsDB(config.results_db_path())
+    if args.plan:
+        plan = mover.load_plan(args.plan)
+        if args.dry_run:
+            print_plan(plan)
+        else:
+            run_id = results.start_run(config.SIMILARITY_THRESHOLD, config.snapshot(), "planned")
+            execute_plan(plan, args.stats, results=results, run_id=run_id)
+            results.finish_run(run_id, "applied")
+        results.close()
+        return
+    if args.run:
+        # A recorded run, possibly reviewed: skipped groups stay, picked keepers are kept
+        plan = plan_reviewed(results, args.run, config.DUPLICATE_DIR, args.accepted_only)
+        if args.dry_run:
+            print_plan(plan)
+        else:
+            execute_plan(plan, args.stats, results=results, run_id=args.run)
+            results.finish_run(args.run, "applied")
+        results.close()
+        return
+    store = open_store()
+    process_duplicates(load_groups(args.groups), config.KEEP_BEST, config.DUPLICATE_DIR, store,
+                       dry_run=args.dry_run, stats=args.stats, results=results)
+    store.close()
+    results.close()
+
+def cmd_undo(args):
+    journal_path = args.journal or mover.latest_journal(os.path.dirname(config.move_journal_path()))
+    if not journal_path:
+        print("No move journal to undo")
+        return
+    result = mover.undo(journal_path)
+    for path, error in result["failed"]:
+        print(f"Failed to restore {path}: {error}")
+    print(f"Restored {result['restored']} files from {journal_path}")
+
+def cmd_report(args):
+    """Stream a run's groups from the results database into a CSV, JSON or HTML report"""
+    results = ResultsDB(config.results_db_path())
+    run_id = args.run or (None if args.groups else results.latest_run())
+    if run_id is None:
+        # Groups saved before any run was recorded, or an explicit groups file
+        store = open_store()
+        groups = load_groups(args.groups)
+        run_id = record_run(results, groups, probe_videos(group_members(groups), store), "matched")
+        store.close()
+    output = args.output or os.path.join(config.FRAME_DIR, "duplicate_report.csv")
+    reports.write(results.iter_members(run_id), output, thumbnails=not args.no_thumbnails)
+    results.close()
+    print(f"Report for run {run_id} written to {output}")
+
+def cmd_lookup(args):
+    """Print the group a file (or the quarantined copy of it) is in"""
+    results = ResultsDB(config.results_db_path())
+    for path in args.paths:
+        group = results.group_of(os.path.abspath(path), args.run) or results.group_of(path, args.run)
+        print(json.dumps({"path": path, "group": group}, indent=2))
+    results.close()
+
+def cmd_run(args):
+    store = open_store()
+    cascade = Cascade() if config.PREFILTER else None
+    video_embeddings = process_videos(config.SOURCE_DIRS, store, cascade, start_journal(store), stats=args.stats)
+    groups = find_duplicates(video_embeddings, config.SIMILARITY_THRESHOLD,
+                             extra_edges=cascade.edges if cascade else None, stats=args.stats,
+                             audio=audio_check(store, args.stats))
+    results = ResultsDB(config.results_db_path())
+    process_duplicates(groups, config.KEEP_BEST, config.DUPLICATE_DIR, store, stats=args.stats, results=results)
+    results.close()
+    store.close()
+
+def cmd_watch(args):
+    """Poll folders and match files as they land, at a cost proportional to the new files"""
+    store = open_store()
+    matcher = open_matcher(store, args.stats)
+    save_matcher(matcher)
+    folders = args.folders or config.SOURCE_DIRS
+    interval = args.interval or config.WATCH_INTERVAL
+    print(f"Watching {', '.join(folders)} every {interval}s; Ctrl+C to stop")
+    previous = {}
+    known = {}  # path -> (size, mtime) of the version that was matched
+    failed = {}  # path -> (size, mtime) of a version that could not be decoded
+    try:
+        while True:
+            found = find_videos(folders, stats=args.stats)
+            ready = {}
+            for path, st in found.items():
+                identity = (st.st_size, st.st_mtime_ns)
+                last = previous.get(path)
+                # New or still being written: wait until it is unchanged for a whole poll
+                if last is None or (last.st_size, last.st_mtime_ns) != identity:
+                    continue
+                if (known.setdefault(path, identity) == identity and path in matcher) or failed.get(path) == identity:
+                    continue
+                ready[path] = st
+
+            removed = [path for path in previous if path not in found]
+            changed = set(matcher.remove(removed))
+            if ready:
+                embeddings, pending = store.split_cached(ready)
+                if pending:
+                    for path, embedding in embed_pending(pending, store=store, stats=args.stats):
+                        st = ready[path]
+                        if embedding is None:
+                            failed[path] = (st.st_size, st.st_mtime_ns)
+                            continue
+                        store.put(path, embedding, st.st_size, st.st_mtime_ns)
+                        embeddings[path] = embedding
+                    store.commit()
+                changed.update(matcher.add(embeddings))
+                for path in embeddings:
+                    known[path] = (ready[path].st_size, ready[path].st_mtime_ns)
+
+            changed = [rep for rep in matcher.groups if rep in changed]
+            if ready or removed:
+                save_matcher(matcher)
+            for rep in changed:
+                print(f"Duplicates: {' | '.join(matcher.groups[rep])}")
+            if changed and args.apply:
+                process_duplicates(matcher.subset(changed), config.KEEP_BEST, config.DUPLICATE_DIR, store,
+                                   stats=args.stats)
+            previous = found
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    finally:
+        save_matcher(matcher)
+        store.close()
+
+def cmd_validate(args):
+    """Embed a sample of frames with the eager model and each backend and report cosine drift"""
+    import random
+    import torch
+    paths = sorted(find_videos(config.SOURCE_DIRS, stats=args.stats))
+    sample = random.Random(args.seed).sample(paths, min(args.samples, len(paths)))
+    frames = [f for f in (load_frame(path) for path in tqdm(sample, desc="Decoding sample")) if f is not None]
+    if not frames:
+        print("No frames decoded; check source_dirs")
+        return
+    images = torch.cat([frame_to_tensor(f) for f in frames])
+    model, _, _ = load_clip()
+    report = validate(model, images, args.backends, config.ENCODER_BATCH, input_size(), args.tolerance,
+                      model_name=config.CLIP_MODEL, cache_dir=config.FRAME_DIR, threads=config.TORCH_THREADS)
+    print(json.dumps(report, indent=2))
+    print(f"Fastest backend within tolerance: {report['recommended']}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Find and move duplicate videos.")
+    parser.add_argument("--config", help="TOML/YAML config file (default: $VDM_CONFIG or ./config.toml)")
+    parser.add_argument("--source", action="append", dest="source_dirs", help="Source folder; repeatable, replaces the config list")
+    parser.add_argument("--frame-dir", help="Folder for the cache, index and results")
+    parser.add_argument("--duplicate-dir", help="Folder duplicates are moved to")
+    parser.add_argument("--threshold", type=float, dest="similarity_threshold", help="Cosine similarity threshold")
+    parser.add_argument("--backend", choices=["exact", "ann"], dest="match_backend", help="Match backend")
+    parser.add_argument("--metrics", help="Write per-stage counters, timings and latency histograms to this JSON file")
+    parser.add_argument("--profile", action="append", dest="profile_stages", metavar="STAGE",
+                        help="Run a stage (discover, probe, extract, preprocess, inference, match, audio, move) "
+                             "under cProfile; .prof files go to <frame dir>/profiles")
+
+    sub = parser.add_subparsers(dest="command")
+    scan = sub.add_parser("scan", help="Embed new or changed videos into the cache")
+    scan.add_argument("--retry-failed", action="store_true", help="Retry files that failed in earlier scans")
+    scan.set_defaults(func=cmd_scan)
+    shard = sub.add_parser("shard", help="Scan this node's source folders and write an embedding shard")
+    shard.add_argument("--node", help="Node name recorded in the shard (default: the host name)")
+    shard.add_argument("--output", help="Shard file (default: <frame dir>/shards/<node>.npz)")
+    shard.set_defaults(func=cmd_shard)
+    merge = sub.add_parser("merge", help="Combine shards from several nodes and match across all of them")
+    merge.add_argument("shards", nargs="+", help="Shard files written by `shard`")
+    merge.add_argument("--output", help="Groups JSON to write")
+    merge.set_defaults(func=cmd_merge)
+    index = sub.add_parser("index", help="Build or update the ANN index from the cache")
+    index.add_argument("--check-recall", action="store_true", help="Compare ANN pairs with exact cosine")
+    index.add_argument("--nprobe", type=int, help="Lists probed for the recall check")
+    index.set_defaults(func=cmd_index)
+    match = sub.add_parser("match", help="Group cached embeddings into duplicate groups")
+    match.add_argument("--output", help="Groups JSON to write")
+    match.add_argument("--incremental", action="store_true",
+                       help="Only match files the saved index has not seen and update the saved groups in place")
+    match.set_defaults(func=cmd_match)
+    apply = sub.add_parser("apply", help="Move all but the best file of each group")
+    apply.add_argument("--groups", help="Groups JSON written by match")
+    apply.add_argument("--dry-run", action="store_true", help="Only print the moves and save the plan")
+    apply.add_argument("--plan", help="Carry out a plan saved by --dry-run instead of re-planning")
+    apply.add_argument("--run", type=int, help="Apply a recorded run, honouring keepers and skips chosen in review")
+    apply.add_argument("--accepted-only", action="store_true", help="With --run, only move groups accepted in review")
+    apply.set_defaults(func=cmd_apply)
+    undo = sub.add_parser("undo", help="Move files from an apply run back where they came from")
+    undo.add_argument("--journal", help="Move journal to undo (default: the newest)")
+    undo.set_defaults(func=cmd_undo)
+    report = sub.add_parser("report", help="Write a CSV, JSON or HTML report of a run's duplicate groups")
+    report.add_argument("--groups", help="Record and report this groups JSON instead of a stored run")
+    report.add_argument("--run", type=int, help="Run to report (default: the latest)")
+    report.add_argument("--output", help="Report file; .csv, .json or .html")
+    report.add_argument("--no-thumbnails", action="store_true", help="Skip decoding thumbnails for HTML reports")
+    report.set_defaults(func=cmd_report)
+    lookup = sub.add_parser("lookup", help="Show the duplicate group a file is in")
+    lookup.add_argument("paths", nargs="+", help="Files, at their original or quarantine location")
+    lookup.add_argument("--run", type=int, help="Run to look in (default: the latest that has the file)")
+    lookup.set_defaults(func=cmd_lookup)
+    watch = sub.add_parser("watch", help="Embed and match new files as they land in the source folders")
+    watch.add_argument("--folders", nargs="+", help="Folders to poll (default: the source folders)")
+    watch.add_argument("--interval", type=float, help="Seconds between polls")
+    watch.add_argument("--apply", action="store_true", help="Move new duplicates right away")
+    watch.set_defaults(func=cmd_watch)
+    validate = sub.add_parser("validate", help="Check CPU encoder backends against the reference model")
+    validate.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS[1:]),
+                          help="Backends to compare with eager fp32")
+    validate.add_argument("--samples", type=int, default=64, help="Videos sampled from the source folders")
+    validate.add_argument("--tolerance", type=float, default=DRIFT_TOLERANCE,
+                          help="Max 1 - cosine between reference and backend embeddings")
+    validate.add_argument("--seed", type=int, default=0)
+    validate.set_defaults(func=cmd_validate)
+    sub.add_parser("run", help="scan + match + apply in one go (default)").set_defaults(func=cmd_run)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config.load_config(args.config)
+    overrides = {
+        name: getattr(args, name)
+        for name in ("source_dirs", "frame_dir", "duplicate_dir", "similarity_threshold", "match_backend",
+                     "profile_stages")
+        if getattr(args, name) is not None
+    }
+    config.apply(overrides)
+    if args.command in (None, "scan", "run", "match", "index", "validate", "watch", "shard") and not config.SOURCE_DIRS:
+        print("No source folders: set source_dirs in the config file or pass --source")
+        return 2
+    os.makedirs(config.FRAME_DIR, exist_ok=True)
+    args.stats = Metrics(profile_stages=config.PROFILE_STAGES)
+    try:
+        getattr(args, "func", cmd_run)(args)
+    finally:
+        if args.metrics:
+            print(f"Metrics written to {args.stats.dump(args.metrics)}")
+        for path in args.stats.dump_profiles(os.path.join(config.FRAME_DIR, "profiles")):
+            print(f"Profile written to {path}")
+    return 0
 
 # --- Main Execution ---
 if __name__ == "__main__":
-    video_embeddings = process_videos(SOURCE_DIRS)
-    groups = find_duplicates(video_embeddings, SIMILARITY_THRESHOLD)
-    process_duplicates(groups, KEEP_BEST, DUPLICATE_DIR)
\ No newline at end of file
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,225 @@
+import os
+import json
+import math
+import time
+import pstats
+import cProfile
+import threading
+from types import SimpleNamespace
+from contextlib import contextmanager
+
+HISTOGRAM_BUCKETS = 24  # Powers of two from 1 ms up to ~2.3 hours
+NOTIFY_SECONDS = 0.25  # Minimum interval between listener calls
+
+
+class Histogram:
+    """Log2-bucketed latency histogram (seconds) with approximate percentiles"""
+
+    def __init__(self):
+        self.counts = [0] * (HISTOGRAM_BUCKETS + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds, times=1):
+        ms = seconds * 1000.0
+        bucket = 0 if ms <= 1.0 else min(HISTOGRAM_BUCKETS, int(math.ceil(math.log2(ms))))
+        self.counts[bucket] += times
+        self.count += times
+        self.total += seconds * times
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, q):
+        """Upper edge of the bucket holding the q-th percentile, in seconds"""
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(2.0 ** bucket / 1000.0, self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return None
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 2),
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p99_ms": round(self.percentile(99) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+class Metrics:
+    """Thread-safe counters, timers, gauges and latency histograms per stage.
+
+    Stages are discover, probe, extract, preprocess, inference, match,
+    audio and move. add(stage, items, seconds) is what the pipeline calls;
+    timer() wraps a block and, for stages listed in profile_stages, runs it
+    under cProfile so hot spots can be inspected per stage. A listener,
+    e.g. a Qt signal's emit, gets a progress dict at most every
+    NOTIFY_SECONDS.
+    """
+
+    def __init__(self, listener=None, profile_stages=()):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.totals = {}
+        self.listener = listener
+        self.profile_stages = set(profile_stages or ())
+        self._profiles = {}
+        self._last_notify = 0.0
+        self.started = time.perf_counter()
+
+    # --- Recording ---
+    def add(self, stage, items, seconds):
+        with self._lock:
+            count, busy = self._stages.get(stage, (0, 0.0))
+            self._stages[stage] = (count + items, busy + seconds)
+            if items:
+                self._histograms.setdefault(stage, Histogram()).observe(seconds / items, items)
+        self._notify()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+        self._notify()
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def set_total(self, name, total):
+        """Expected final value of counter `name`, for ETAs"""
+        with self._lock:
+            self.totals[name] = total
+
+    @contextmanager
+    def timer(self, stage, items=1):
+        """Time a block as `items` items of stage; set .items on the yielded object if only known at the end"""
+        timing = SimpleNamespace(items=items)
+        profile = self._start_profile(stage)
+        start = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            self.add(stage, timing.items, time.perf_counter() - start)
+            if profile is not None:
+                self._stop_profile(stage, profile)
+
+    # --- Profiling ---
+    def _start_profile(self, stage):
+        if stage not in self.profile_stages:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return None  # Another profiler is already active on this thread (nested stage)
+        return profile
+
+    def _stop_profile(self, stage, profile):
+        profile.disable()
+        with self._lock:
+            if stage in self._profiles:
+                self._profiles[stage].add(profile)
+            else:
+                self._profiles[stage] = pstats.Stats(profile)
+
+    def dump_profiles(self, directory):
+        """Write <stage>.prof files (pstats format, e.g. for snakeviz); returns their paths"""
+        paths = []
+        with self._lock:
+            if self._profiles:
+                os.makedirs(directory, exist_ok=True)
+            for stage, stats in self._profiles.items():
+                path = os.path.join(directory, f"{stage}.prof")
+                stats.dump_stats(path)
+                paths.append(path)
+        return paths
+
+    # --- Reading ---
+    def report(self):
+        """Return {stage: {items, busy_seconds, items_per_busy_second, items_per_second, latency}}"""
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        with self._lock:
+            stages = dict(self._stages)
+            latency = {stage: h.summary() for stage, h in self._histograms.items()}
+        return {
+            stage: {
+                "items": count,
+                "busy_seconds": round(busy, 3),
+                "items_per_busy_second": round(count / busy, 2) if busy else None,
+                "items_per_second": round(count / elapsed, 2),
+                "latency": latency.get(stage),
+            }
+            for stage, (count, busy) in stages.items()
+        }
+
+    def summary(self):
+        return ", ".join(
+            f"{stage}: {info['items']} @ {info['items_per_second']}/s"
+            for stage, info in self.report().items()
+        )
+
+    def progress(self, name="files"):
+        """{done, total, rate, eta_seconds, queue_depth} for counter `name`"""
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        with self._lock:
+            done = self.counters.get(name, 0)
+            total = self.totals.get(name)
+            queue_depth = self.gauges.get("queue_depth")
+        rate = done / elapsed
+        eta = (total - done) / rate if total and rate else None
+        return {"done": done, "total": total, "rate": round(rate, 2),
+                "eta_seconds": round(eta, 1) if eta is not None else None, "queue_depth": queue_depth}
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        return {
+            "elapsed_seconds": round(time.perf_counter() - self.started, 3),
+            "stages": self.report(),
+            "counters": counters,
+            "gauges": gauges,
+            "progress": self.progress(),
+        }
+
+    def dump(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        return path
+
+    def _notify(self):
+        if self.listener is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_notify < NOTIFY_SECONDS:
+                return
+            self._last_notify = now
+        self.listener(self.progress())
+
+
+def format_progress(progress, label="Embedding"):
+    """One-line status text: counts, throughput, ETA and queue depth"""
+    text = f"{label} {progress['done']}"
+    if progress["total"]:
+        text += f"/{progress['total']}"
+    text += f" | {progress['rate']:.1f} files/s"
+    if progress["eta_seconds"] is not None:
+        minutes, seconds = divmod(int(progress["eta_seconds"]), 60)
+        text += f" | ETA {minutes}:{seconds:02d}"
+    if progress["queue_depth"] is not None:
+        text += f" | queue {progress['queue_depth']}"
+    return text
@@ -0,0 +1,235 @@
+import os
+import json
+import errno
+import time
+import shutil
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from metrics import Metrics
+
+COPY_SUFFIX = ".partial"
+ERROR_NOT_SAME_DEVICE = 17  # Windows' EXDEV
+MAX_LANES = 16
+
+# One planned move; method is "rename" (same volume) or "copy" (copy, verify, delete)
+Move = namedtuple("Move", "source dest method keeper match similarity")
+
+
+def existing_ancestor(path):
+    """path itself or its closest parent that exists"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def drive_of(path):
+    """Drive identifier for path, or for the folder it would be created in"""
+    try:
+        return os.stat(existing_ancestor(path)).st_dev
+    except OSError:
+        return os.path.splitdrive(os.path.abspath(path))[0] or None
+
+
+def volume_root(path):
+    """Mount point (or drive root) that path lives under"""
+    path = existing_ancestor(path)
+    while not os.path.ismount(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def quarantine_dir(source, duplicate_dir, per_volume=False):
+    """Folder a duplicate goes to: duplicate_dir, or with per_volume a folder of that name on the source's own drive"""
+    if not per_volume or drive_of(source) == drive_of(duplicate_dir):
+        return duplicate_dir
+    return os.path.join(volume_root(source), os.path.basename(os.path.normpath(duplicate_dir)))
+
+
+def unique_destination(folder, name, taken):
+    """folder/name, or folder/'stem (n)ext' when that is on disk or already planned"""
+    stem, ext = os.path.splitext(name)
+    candidate = os.path.join(folder, name)
+    n = 1
+    while os.path.normcase(candidate) in taken or os.path.lexists(candidate):
+        n += 1
+        candidate = os.path.join(folder, f"{stem} ({n}){ext}")
+    taken.add(os.path.normcase(candidate))
+    return candidate
+
+
+def plan_moves(duplicates, duplicate_dir, per_volume=False):
+    """Destinations for (path, keeper, match, similarity) tuples; returns a list of Move.
+
+    No two moves share a destination and no destination exists yet, so
+    files with the same basename from different folders never overwrite
+    each other.
+    """
+    taken = set()
+    plan = []
+    for path, keeper, match, similarity in duplicates:
+        folder = quarantine_dir(path, duplicate_dir, per_volume)
+        dest = unique_destination(folder, os.path.basename(path), taken)
+        method = "rename" if drive_of(path) == drive_of(folder) else "copy"
+        plan.append(Move(path, dest, method, keeper, match, similarity))
+    return plan
+
+
+def save_plan(plan, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([move._asdict() for move in plan], f, indent=1)
+    return path
+
+
+def load_plan(path):
+    with open(path, encoding="utf-8") as f:
+        return [Move(**move) for move in json.load(f)]
+
+
+def move_file(source, dest, method):
+    """Move one file without ever replacing an existing dest; returns the method used"""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    if os.path.lexists(dest):
+        raise FileExistsError(f"{dest} already exists")
+    if method == "rename":
+        try:
+            os.rename(source, dest)
+            return "rename"
+        except OSError as e:
+            if not os.path.exists(source):
+                raise
+            # EXDEV: the planned volumes were wrong (e.g. a junction); copy instead
+            if e.errno != errno.EXDEV and getattr(e, "winerror", None) != ERROR_NOT_SAME_DEVICE:
+                raise
+    partial = dest + COPY_SUFFIX
+    try:
+        shutil.copy2(source, partial)
+        if os.path.getsize(partial) != os.path.getsize(source):
+            raise OSError(f"Short copy of {source}")
+        os.rename(partial, dest)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    try:
+        os.remove(source)
+    except OSError:
+        # A copy left in quarantine would not be journaled, so undo could never see it
+        os.remove(dest)
+        raise
+    return "copy"
+
+
+class MoveJournal:
+    """Append-only JSON-lines record of completed moves, for undo"""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, source, dest, method):
+        line = json.dumps({"source": source, "dest": dest, "method": method, "time": time.time()})
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _lanes(plan, per_device):
+    """Split moves into sequential lanes: renames share one, copies get per_device lanes per source drive"""
+    renames = [move for move in plan if move.method == "rename"]
+    by_device = {}
+    for move in plan:
+        if move.method != "rename":
+            by_device.setdefault(drive_of(move.source), []).append(move)
+    lanes = [renames] if renames else []
+    for moves in by_device.values():
+        count = max(1, min(per_device, len(moves)))
+        lanes.extend(moves[k::count] for k in range(count))
+    return lanes
+
+
+def execute(plan, journal_path, per_device=1, stats=None, should_stop=None):
+    """Carry out a plan; returns {"moved": n, "done": [(source, dest, method)], "failed": [(path, error)]}.
+
+    Same-volume moves are renames and run in one lane; cross-volume copies
+    run in parallel, at most per_device at a time per source drive, since
+    concurrent reads on one spinning disk are slower than sequential ones.
+    Every completed move is appended to the journal at journal_path.
+    """
+    stats = stats or Metrics()
+    journal = MoveJournal(journal_path)
+    failed = []
+    done = []
+    lock = threading.Lock()
+
+    def run_lane(moves):
+        for move in moves:
+            if should_stop is not None and should_stop():
+                return
+            try:
+                with stats.timer("move"):
+                    method = move_file(move.source, move.dest, move.method)
+            except Exception as e:
+                stats.count("move_failed")
+                with lock:
+                    failed.append((move.source, str(e)))
+                continue
+            journal.record(move.source, move.dest, method)
+            with lock:
+                done.append((move.source, move.dest, method))
+
+    lanes = _lanes(plan, per_device)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_LANES, len(lanes))), thread_name_prefix="move") as pool:
+            list(pool.map(run_lane, lanes))
+    finally:
+        journal.close()
+    return {"moved": len(done), "done": done, "failed": failed}
+
+
+def latest_journal(folder):
+    """Newest moves-*.jsonl journal in folder, or None"""
+    try:
+        names = sorted(n for n in os.listdir(folder) if n.startswith("moves-") and n.endswith(".jsonl"))
+    except OSError:
+        return None
+    return os.path.join(folder, names[-1]) if names else None
+
+
+def undo(journal_path):
+    """Move every journaled file back, newest first; returns {"restored": n, "failed": [(path, error)]}"""
+    with open(journal_path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    restored = 0
+    failed = []
+    remaining = []
+    for entry in reversed(entries):
+        try:
+            method = "rename" if drive_of(entry["dest"]) == drive_of(entry["source"]) else "copy"
+            move_file(entry["dest"], entry["source"], method)
+            restored += 1
+        except Exception as e:
+            failed.append((entry["source"], str(e)))
+            remaining.append(entry)
+    if remaining:
+        # Keep only what is still in quarantine, so undo can be retried
+        tmp_path = journal_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in reversed(remaining))
+        os.replace(tmp_path, journal_path)
+    else:
+        os.replace(journal_path, journal_path + ".undone")
+    return {"restored": restored, "failed": failed}
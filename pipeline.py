@@ -0,0 +1,127 @@
+import os
+import queue
+import threading
+from metrics import Metrics
+
+_DONE = object()
+
+
+def configure_torch_threads(num_threads=None):
+    """Size torch's intra-op pool for CPU inference (defaults to all cores)"""
+    import torch
+
+    num_threads = num_threads or os.cpu_count() or 1
+    torch.set_num_threads(num_threads)
+    try:
+        # Batches are already large; extra inter-op threads only add contention
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Can only be set once, before any parallel work has started
+    return num_threads
+
+
+def _producer(paths, path_lock, load_image, preprocess, out_queue, stats, should_stop):
+    while not should_stop():
+        with path_lock:
+            path = next(paths, None)
+        if path is None:
+            return
+        tensor = None
+        with stats.timer("extract"):
+            try:
+                image = load_image(path)
+            except Exception:
+                image = None  # One unreadable file must not take the thread, and its share of the queue, down
+        if image is not None:
+            with stats.timer("preprocess"):
+                try:
+                    tensor = preprocess(image)
+                except Exception:
+                    tensor = None
+        out_queue.put((path, tensor))
+        stats.gauge("queue_depth", out_queue.qsize())
+
+
+def embed_videos(video_paths, load_image, model, preprocess, device, batch_size=64,
+                 workers=4, queue_size=None, stats=None, should_stop=None):
+    """Staged extract -> preprocess -> batched encode_image pipeline.
+
+    `workers` threads call load_image(path) and preprocess the result into a
+    bounded queue of (frames, 3, H, W) tensors; the calling thread drains it
+    in batches of about batch_size frames and runs the model once per batch.
+    Yields (path, embedding) for every input: a (D,) vector for single-frame
+    signatures, (frames, D) otherwise, and None when extraction failed.
+    """
+    import torch
+
+    stats = stats or Metrics()
+    abandoned = threading.Event()
+    external_stop = should_stop or (lambda: False)
+    should_stop = lambda: abandoned.is_set() or external_stop()
+    out_queue = queue.Queue(maxsize=queue_size or 2 * batch_size)
+    paths = iter(video_paths)
+    path_lock = threading.Lock()
+
+    def run_producers():
+        threads = [
+            # Named so py-spy dumps and profilers show which stage a thread belongs to
+            threading.Thread(
+                target=_producer,
+                args=(paths, path_lock, load_image, preprocess, out_queue, stats, should_stop),
+                name=f"extract-{i}",
+                daemon=True,
+            )
+            for i in range(max(1, workers))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        out_queue.put(_DONE)
+
+    threading.Thread(target=run_producers, daemon=True).start()
+
+    def encode(batch):
+        # Each item holds (frames, 3, H, W); multi-frame signatures are split back per video
+        frames = sum(len(tensor) for _, tensor in batch)
+        with stats.timer("inference", frames):
+            images = torch.cat([tensor for _, tensor in batch]).to(device)
+            with torch.inference_mode():
+                embeddings = model.encode_image(images).float().cpu().numpy()
+        results = []
+        offset = 0
+        for path, tensor in batch:
+            signature = embeddings[offset:offset + len(tensor)]
+            offset += len(tensor)
+            results.append((path, signature[0] if len(signature) == 1 else signature))
+        return results
+
+    batch = []
+    batch_frames = 0
+    try:
+        while True:
+            item = out_queue.get()
+            if item is _DONE:
+                break
+            if should_stop():
+                continue  # Keep draining so blocked producers can exit
+            path, tensor = item
+            if tensor is None:
+                yield path, None
+                continue
+            batch.append(item)
+            batch_frames += len(tensor)
+            if batch_frames >= batch_size:
+                yield from encode(batch)
+                batch = []
+                batch_frames = 0
+        if batch and not should_stop():
+            yield from encode(batch)
+    finally:
+        # Consumer closed early: tell producers to stop and unblock any waiting put()
+        abandoned.set()
+        while True:
+            try:
+                out_queue.get_nowait()
+            except queue.Empty:
+                break
@@ -0,0 +1,188 @@
+import hashlib
+from collections import defaultdict
+from PIL import Image
+import imagehash
+from embedding_store import file_fingerprint
+
+DURATION_TOLERANCE = 2.0  # Seconds; re-encodes keep the duration within this
+ASPECT_DECIMALS = 2
+PHASH_SAME = 4  # Hamming distance (of 64 bits) treated as the same picture
+PHASH_DIFFERENT = 20  # Hamming distance beyond which frames are clearly different
+FULL_HASH_CHUNK = 8 * 1024 * 1024
+
+
+def full_hash(path):
+    """Hash of the whole file, used to confirm exact duplicates when asked to"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(FULL_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def exact_duplicate_sets(sizes, verify=False):
+    """Byte-identical file sets from {path: size}, without decoding anything.
+
+    Only files whose size collides are read, and only their head and tail
+    (plus the whole file when verify is set).
+    """
+    by_size = defaultdict(list)
+    for path, size in sizes.items():
+        by_size[size].append(path)
+
+    sets = []
+    for size, paths in by_size.items():
+        if len(paths) < 2 or size == 0:
+            continue
+        by_hash = defaultdict(list)
+        for path in paths:
+            try:
+                key = full_hash(path) if verify else file_fingerprint(path)
+            except OSError:
+                continue
+            by_hash[key].append(path)
+        sets.extend(group for group in by_hash.values() if len(group) > 1)
+    return sets
+
+
+def bucket_key(info):
+    """(aspect ratio, duration slot) for a metadata dict, or None when unknown"""
+    if not info or not info.get("duration") or not info.get("width") or not info.get("height"):
+        return None
+    aspect = round(info["width"] / info["height"], ASPECT_DECIMALS)
+    return aspect, int(info["duration"] // DURATION_TOLERANCE)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes for Hamming-radius queries"""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        node = [value, item, {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def query(self, value, radius):
+        """All (distance, item) within radius of value"""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.append((distance, node[1]))
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+def frame_phash(frames):
+    """64-bit perceptual hash of the first decoded frame, as an int"""
+    return int(str(imagehash.phash(Image.fromarray(frames[0]))), 16)
+
+
+class Cascade:
+    """Tiered dedup: exact copies -> duration/aspect buckets -> pHash -> CLIP.
+
+    After run(), `edges` holds (path_a, path_b, similarity) pairs the cheap
+    stages already decided are duplicates, and `needs_embedding` holds the
+    pending files CLIP still has to look at.
+    """
+
+    def __init__(self, verify_exact=False):
+        self.verify_exact = verify_exact
+        self.edges = []
+        self.needs_embedding = set()
+        self.stats = defaultdict(int)
+
+    def run(self, video_paths, sizes, metadata, load_image, pending):
+        pending = set(pending)
+
+        # Stage 1: byte-identical copies collapse onto one representative
+        copy_of = {}
+        for group in exact_duplicate_sets(sizes, self.verify_exact):
+            representative = next((p for p in group if p not in pending), group[0])
+            for path in group:
+                if path != representative:
+                    copy_of[path] = representative
+                    self.edges.append((representative, path, 1.0))
+        self.stats["exact_copies"] = len(copy_of)
+        representatives = [p for p in video_paths if p not in copy_of]
+
+        # Stage 2: only videos with a similar duration and the same aspect can match
+        buckets = defaultdict(list)
+        unknown = set()
+        for path in representatives:
+            key = bucket_key(metadata.get(path))
+            if key is None:
+                unknown.add(path)
+            else:
+                buckets[key].append(path)
+
+        def neighbours(path):
+            aspect, slot = bucket_key(metadata[path])
+            return [
+                other
+                for s in (slot - 1, slot, slot + 1)
+                for other in buckets.get((aspect, s), ())
+                if other != path
+            ]
+
+        contested = [p for p in representatives if p not in unknown and neighbours(p)]
+        self.stats["isolated"] = len(representatives) - len(unknown) - len(contested)
+
+        # Stage 3: perceptual hashes decide the clear cases inside each bucket
+        hashes = {}
+        for path in contested:
+            info = metadata[path]
+            if "phash" not in info:
+                frames = load_image(path)
+                info["phash"] = frame_phash(frames) if frames is not None else None
+            if info["phash"] is not None:
+                hashes[path] = info["phash"]
+        tree = BKTree()
+        for path, value in hashes.items():
+            tree.add(value, path)
+
+        ambiguous = set(unknown)
+        for path in contested:
+            if path not in hashes:
+                ambiguous.add(path)
+                continue
+            nearby = set(neighbours(path))
+            for distance, other in tree.query(hashes[path], PHASH_DIFFERENT):
+                if other == path or other not in nearby:
+                    continue
+                if distance <= PHASH_SAME:
+                    if path < other:
+                        self.edges.append((path, other, 1.0 - distance / 64.0))
+                        self.stats["phash_matches"] += 1
+                else:
+                    ambiguous.update((path, other))
+            # Neighbours whose hash could not be computed need CLIP on both sides
+            if any(other not in hashes for other in nearby):
+                ambiguous.add(path)
+
+        # Stage 4: CLIP only where the cheap stages could not decide
+        self.needs_embedding = ambiguous & pending
+        self.stats["clip"] = len(self.needs_embedding)
+        self.stats["skipped"] = len(pending) - len(self.needs_embedding)
+        return self
@@ -0,0 +1,135 @@
+import json
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from subprocess_runner import run_command
+
+FFPROBE_TIMEOUT = 15
+PROBE_WORKERS = 8
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _frame_rate(rate):
+    num, _, den = str(rate or "0/1").partition("/")
+    return _to_float(num) / _to_float(den) if _to_float(den) else 0.0
+
+
+def parse_probe(data):
+    """Reduce ffprobe's -show_format -show_streams JSON to the fields we use"""
+    streams = data.get("streams", [])
+    fmt = data.get("format", {})
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    return {
+        "width": _to_int(video.get("width")),
+        "height": _to_int(video.get("height")),
+        # .ts streams rarely carry a per-stream bit rate; fall back to the container's
+        "bit_rate": _to_int(video.get("bit_rate")) or _to_int(fmt.get("bit_rate")),
+        "duration": _to_float(fmt.get("duration")) or _to_float(video.get("duration")),
+        "codec": video.get("codec_name"),
+        "format": fmt.get("format_name"),
+        "frame_rate": _frame_rate(video.get("avg_frame_rate") or video.get("r_frame_rate")),
+        "has_audio": any(s.get("codec_type") == "audio" for s in streams),
+    }
+
+
+def probe_video(video_path, timeout=FFPROBE_TIMEOUT, run=None):
+    """All metadata for one file from a single ffprobe call, or None on failure"""
+    cmd = ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", video_path]
+    result = (run or run_command)(cmd, timeout)
+    if result.returncode != 0:
+        return None
+    try:
+        return parse_probe(json.loads(result.stdout))
+    except ValueError:
+        return None
+
+
+def _probe_timed(video_path, run=None, stats=None):
+    if stats is None:
+        return probe_video(video_path, run=run)
+    with stats.timer("probe"):
+        return probe_video(video_path, run=run)
+
+
+def probe_videos(video_paths, store=None, workers=PROBE_WORKERS, run=None, stats=None):
+    """Return {path: metadata}, reading the store's metadata table and probing the rest concurrently.
+
+    With an AsyncRunner's run, the runner decides how many ffprobes are
+    actually alive; workers only bounds the waiting threads.
+    """
+    metadata = {}
+    missing = []
+    for path in video_paths:
+        cached = store.get_metadata(path) if store is not None else None
+        if cached is None:
+            missing.append(path)
+        else:
+            metadata[path] = cached
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for path, info in zip(missing, pool.map(partial(_probe_timed, run=run, stats=stats), missing)):
+            if info is None:
+                continue
+            metadata[path] = info
+            if store is not None:
+                try:
+                    store.put_metadata(path, info)
+                except OSError:
+                    pass  # File vanished between probe and stat
+    if store is not None:
+        store.commit()
+    return metadata
+
+
+class LazyProbe:
+    """Thread-safe {path: metadata} lookup that probes on first access.
+
+    Used when files stream in from discovery, so each extraction thread
+    probes its own file instead of waiting for a bulk probe_videos() pass.
+    """
+
+    def __init__(self, store=None, run=None, stats=None):
+        self.store = store
+        self.run = run
+        self.stats = stats
+        self._lock = threading.Lock()
+        self._metadata = {}
+
+    def get(self, path, default=None):
+        with self._lock:
+            if path in self._metadata:
+                info = self._metadata[path]
+                return default if info is None else info
+            info = self.store.get_metadata(path) if self.store is not None else None
+        if info is None:
+            info = _probe_timed(path, self.run, self.stats)
+            if info is not None and self.store is not None:
+                with self._lock:
+                    try:
+                        self.store.put_metadata(path, info)
+                    except OSError:
+                        pass
+        with self._lock:
+            self._metadata[path] = info
+        return default if info is None else info
+
+
+def video_score(info):
+    """Score based on duration, resolution and bitrate"""
+    if not info:
+        return 0
+    bit_rate = info.get("bit_rate") or 0
+    return info["width"] * info["height"] * info["duration"] * (bit_rate if bit_rate > 0 else 1)
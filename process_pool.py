@@ -0,0 +1,130 @@
+import os
+import sys
+import ctypes
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import config
+
+WORKER_MEMORY_MB = 1500  # Rough resident size of one worker with a ViT-B/32 model loaded
+CHUNK_SIZE = 8  # Videos handed to a worker per task
+
+_worker = {}
+
+
+def available_memory():
+    """Available physical memory in bytes, or None if it cannot be determined"""
+    if sys.platform == "win32":
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+        return None
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def worker_count(requested=None, memory_per_worker_mb=WORKER_MEMORY_MB):
+    """Number of worker processes, capped so every worker's model fits in free RAM"""
+    count = requested or max(1, (os.cpu_count() or 2) // 2)
+    memory = available_memory()
+    if memory:
+        count = min(count, max(1, memory // (memory_per_worker_mb * 1024 * 1024)))
+    return int(count)
+
+
+def _init_worker(settings, threads, shm_name, shape):
+    """Runs once per worker: apply settings, pin torch threads, load the model, map the output array"""
+    # Every worker gets its share of the cores instead of all of them
+    config.apply(dict(settings, TORCH_THREADS=threads, EMBED_PROCESSES=0))
+    import main
+    main.get_model()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker["shm"] = shm
+    _worker["out"] = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    _worker["main"] = main
+
+
+def _embed_chunk(chunk):
+    """Embed (row, path, duration) items into the shared array; returns [(row, frames written, reason)]"""
+    out = _worker["out"]
+    embed_video = _worker["main"].embed_video
+    done = []
+    for row, path, duration in chunk:
+        failures = {}
+        embedding = embed_video(path, metadata={path: {"duration": duration}}, failures=failures)
+        if embedding is None:
+            done.append((row, 0, failures.get(path)))
+            continue
+        signature = np.asarray(embedding, dtype=np.float32).reshape(-1, out.shape[-1])
+        frames = min(len(signature), out.shape[1])
+        out[row, :frames] = signature[:frames]
+        done.append((row, frames, None))
+    return done
+
+
+def embed_in_processes(video_files, dim, frames=1, workers=None, metadata=None, should_stop=None,
+                       chunk_size=CHUNK_SIZE, failures=None):
+    """Embed videos in a process pool; yields (path, embedding or None) as chunks complete.
+
+    Each worker loads the model once in its initializer and writes results
+    straight into a shared-memory (videos, frames, dim) float32 array, so
+    only row numbers and failure reasons travel back through the pool's
+    pipes. Reasons for files that could not be decoded land in failures;
+    any other error in a worker is raised here.
+    """
+    if not video_files:
+        return
+    should_stop = should_stop or (lambda: False)
+    metadata = metadata or {}
+    workers = min(worker_count(workers), len(video_files))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    shape = (len(video_files), frames, dim)
+
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 4)
+    out = None
+    try:
+        out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        items = [
+            (row, path, (metadata.get(path) or {}).get("duration"))
+            for row, path in enumerate(video_files)
+        ]
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        pool = multiprocessing.Pool(
+            workers, initializer=_init_worker,
+            initargs=(config.snapshot(), threads, shm.name, shape),
+        )
+        try:
+            for done in pool.imap_unordered(_embed_chunk, chunks):
+                for row, written, reason in done:
+                    if not written:
+                        if failures is not None and reason:
+                            failures[video_files[row]] = reason
+                        yield video_files[row], None
+                        continue
+                    signature = out[row, :written].copy()
+                    yield video_files[row], signature[0] if written == 1 else signature
+                if should_stop():
+                    break
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        out = None  # Release the view before closing the mapping
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,131 @@
+import os
+import csv
+import html
+import json
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from frames import extract_frames
+from results import MEMBER_COLUMNS
+
+THUMB_SIZE = 160
+THUMB_WORKERS = 4
+THUMB_BACKLOG = 64  # Thumbnails queued at most before the writer waits
+
+HTML_HEAD = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Duplicate report</title>
+<style>
+body {{ font-family: sans-serif; margin: 1em 2em; }}
+table {{ border-collapse: collapse; margin-bottom: 1.5em; }}
+td, th {{ border: 1px solid #ccc; padding: 4px 8px; text-align: left; font-size: 13px; }}
+tr.keep {{ background: #e8f5e9; }}
+img {{ width: {size}px; height: {size}px; object-fit: cover; background: #eee; }}
+</style></head><body>
+<h1>Duplicate report</h1>
+"""
+HTML_COLUMNS = ["", "Action", "File", "Score", "Resolution", "Duration", "Matched With", "Similarity", "Moved To"]
+
+
+def _groups(rows):
+    """Group consecutive member rows by group number, without buffering more than one group"""
+    group, number = [], None
+    for row in rows:
+        if row["number"] != number and group:
+            yield number, group
+            group = []
+        number = row["number"]
+        group.append(row)
+    if group:
+        yield number, group
+
+
+def write_csv(rows, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(MEMBER_COLUMNS)
+        for row in rows:
+            writer.writerow([row[column] for column in MEMBER_COLUMNS])
+    return path
+
+
+def write_json(rows, path):
+    """A JSON list of groups, each {"group", "representative", "members"}, written group by group"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for k, (number, members) in enumerate(_groups(rows)):
+            group = {"group": number, "representative": members[0]["representative"],
+                     "members": [{c: m[c] for c in MEMBER_COLUMNS[2:]} for m in members]}
+            f.write((",\n" if k else "") + json.dumps(group))
+        f.write("\n]\n")
+    return path
+
+
+def thumbnail_name(path):
+    return hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16] + ".jpg"
+
+
+def make_thumbnail(video_path, out_path, duration=None, size=THUMB_SIZE):
+    """Decode one frame into a JPEG thumbnail; returns out_path or None"""
+    if os.path.exists(out_path):
+        return out_path
+    frames, _ = extract_frames(video_path, size, 1, duration)
+    if frames is None:
+        return None
+    Image.fromarray(frames[0]).save(out_path, quality=80)
+    return out_path
+
+
+def write_html(rows, path, thumbnails=True):
+    """Static HTML page with one table per group and thumbnails in <name>_files/.
+
+    Rows are written as they arrive; thumbnails are decoded by a small pool
+    with a bounded backlog, for the file's current location (its quarantine
+    path once moved).
+    """
+    thumb_dir = os.path.splitext(path)[0] + "_files"
+    thumb_link = os.path.basename(thumb_dir)
+    if thumbnails:
+        os.makedirs(thumb_dir, exist_ok=True)
+    pending = deque()
+    with open(path, "w", encoding="utf-8") as f, ThreadPoolExecutor(max_workers=THUMB_WORKERS) as pool:
+        f.write(HTML_HEAD.format(size=THUMB_SIZE))
+        groups = 0
+        for number, members in _groups(rows):
+            groups += 1
+            f.write(f"<h2>Group {number}</h2>\n<table><tr>")
+            f.write("".join(f"<th>{c}</th>" for c in HTML_COLUMNS) + "</tr>\n")
+            for m in members:
+                current = m["moved_to"] if m["move_status"] == "moved" else m["path"]
+                image = ""
+                if thumbnails:
+                    name = thumbnail_name(m["path"])
+                    pending.append(pool.submit(make_thumbnail, current, os.path.join(thumb_dir, name), m["duration"]))
+                    image = f'<img src="{html.escape(thumb_link)}/{name}" alt="" loading="lazy">'
+                    while len(pending) > THUMB_BACKLOG:
+                        pending.popleft().result()
+                resolution = f"{m['width']}x{m['height']}" if m["width"] else ""
+                similarity = "" if m["similarity"] is None else f"{m['similarity']:.4f}"
+                cells = [image, m["action"], html.escape(m["path"]), m["score"], resolution,
+                         "" if m["duration"] is None else f"{m['duration']:.1f}s",
+                         html.escape(m["matched_with"] or ""), similarity,
+                         html.escape(m["moved_to"] if m["move_status"] == "moved" else m["move_status"] or "")]
+                f.write(f'<tr class="{m["action"]}">' + "".join(f"<td>{c}</td>" for c in cells) + "</tr>\n")
+            f.write("</table>\n")
+        f.write(f"<p>{groups} groups</p></body></html>\n")
+        for future in pending:
+            future.result()
+    return path
+
+
+WRITERS = {".csv": write_csv, ".json": write_json, ".html": write_html, ".htm": write_html}
+
+
+def write(rows, path, thumbnails=True):
+    """Pick the writer from path's extension; thumbnails only apply to HTML"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError(f"Unknown report format {ext}; use .csv, .json or .html")
+    if WRITERS[ext] is write_html:
+        return write_html(rows, path, thumbnails)
+    return WRITERS[ext](rows, path)
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import sqlite3
+
+INSERT_BATCH = 1000  # Rows per executemany when recording a run
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started REAL NOT NULL,
+        finished REAL,
+        status TEXT NOT NULL,
+        threshold REAL,
+        settings TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS groups (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id INTEGER NOT NULL,
+        number INTEGER NOT NULL,
+        representative TEXT NOT NULL,
+        keeper TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        review TEXT NOT NULL DEFAULT 'pending'
+    )""",
+    """CREATE TABLE IF NOT EXISTS members (
+        group_id INTEGER NOT NULL,
+        run_id INTEGER NOT NULL,
+        path TEXT NOT NULL,
+        rank INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        score REAL,
+        width INTEGER,
+        height INTEGER,
+        duration REAL,
+        bit_rate INTEGER,
+        matched_with TEXT,
+        similarity REAL
+    )""",
+    """CREATE TABLE IF NOT EXISTS edges (
+        group_id INTEGER NOT NULL,
+        path_a TEXT NOT NULL,
+        path_b TEXT NOT NULL,
+        similarity REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS moves (
+        run_id INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        dest TEXT NOT NULL,
+        method TEXT NOT NULL,
+        status TEXT NOT NULL,
+        error TEXT,
+        time REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS groups_run ON groups (run_id, number)",
+    "CREATE INDEX IF NOT EXISTS members_path ON members (path, run_id)",
+    "CREATE INDEX IF NOT EXISTS members_group ON members (group_id, rank)",
+    "CREATE INDEX IF NOT EXISTS edges_group ON edges (group_id)",
+    "CREATE INDEX IF NOT EXISTS moves_source ON moves (source, run_id)",
+    "CREATE INDEX IF NOT EXISTS moves_dest ON moves (dest)",
+]
+
+REVIEW_COLUMNS = ["group_id", "number", "review", "path", "rank", "action", "score", "width", "height",
+                  "duration", "matched_with", "similarity", "moved_to", "move_status"]
+MEMBER_COLUMNS = ["number", "representative", "path", "rank", "action", "score", "width", "height",
+                  "duration", "bit_rate", "matched_with", "similarity", "moved_to", "move_status"]
+
+
+class ResultsDB:
+    """Indexed SQLite record of every match/apply run: groups, edges, scores, keepers and moves.
+
+    Kept apart from the embedding cache, which is wiped when the model
+    changes; results stay queryable after the files have been moved.
+    Readers stream rows from cursors, so reports never hold a whole run.
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+    # --- Recording ---
+    def start_run(self, threshold=None, settings=None, status="matched"):
+        cursor = self.conn.execute(
+            "INSERT INTO runs (started, status, threshold, settings) VALUES (?, ?, ?, ?)",
+            (time.time(), status, threshold, json.dumps(settings or {}, default=str)),
+        )
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def record_groups(self, run_id, groups, ranked, metadata, explain):
+        """Store multi-file groups; ranked(group) gives [(score, path)] best first, explain(rep, path) its best edge"""
+        members = []
+        number = 0
+        for rep, group in groups.items():
+            if len(group) < 2:
+                continue
+            number += 1
+            scored = ranked(group)
+            group_id = self.conn.execute(
+                "INSERT INTO groups (run_id, number, representative, keeper, size) VALUES (?, ?, ?, ?, ?)",
+                (run_id, number, rep, scored[0][1], len(group)),
+            ).lastrowid
+            for rank, (score, path) in enumerate(scored):
+                info = metadata.get(path) or {}
+                match, similarity = explain(rep, path)
+                members.append((group_id, run_id, path, rank, "keep" if rank == 0 else "move", score,
+                                info.get("width"), info.get("height"), info.get("duration"), info.get("bit_rate"),
+                                match, similarity))
+            self.conn.executemany(
+                "INSERT INTO edges (group_id, path_a, path_b, similarity) VALUES (?, ?, ?, ?)",
+                ((group_id, a, b, s) for a, b, s in getattr(groups, "edges", {}).get(rep, ())),
+            )
+            if len(members) >= INSERT_BATCH:
+                self._insert_members(members)
+                members = []
+        self._insert_members(members)
+        self.conn.commit()
+        return number
+
+    def _insert_members(self, rows):
+        self.conn.executemany(
+            "INSERT INTO members (group_id, run_id, path, rank, action, score, width, height, duration, bit_rate, "
+            "matched_with, similarity) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def record_moves(self, run_id, plan, done, failed):
+        """Store a plan's outcome: done is [(source, dest, method)], failed is [(source, error)]"""
+        now = time.time()
+        errors = dict(failed)
+        moved = {source: (dest, method) for source, dest, method in done}
+        rows = []
+        for move in plan:
+            if move.source in moved:
+                dest, method = moved[move.source]
+                rows.append((run_id, move.source, dest, method, "moved", None, now))
+            elif move.source in errors:
+                rows.append((run_id, move.source, move.dest, move.method, "failed", errors[move.source], now))
+            else:
+                rows.append((run_id, move.source, move.dest, move.method, "skipped", None, now))
+        self.conn.executemany(
+            "INSERT INTO moves (run_id, source, dest, method, status, error, time) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        self.conn.commit()
+
+    def finish_run(self, run_id, status):
+        self.conn.execute("UPDATE runs SET finished = ?, status = ? WHERE id = ?", (time.time(), status, run_id))
+        self.conn.commit()
+
+    # --- Review ---
+    def set_keeper(self, group_id, path):
+        """Keep path instead of the ranked keeper; the rest of the group is moved"""
+        self.conn.execute("UPDATE members SET action = CASE WHEN path = ? THEN 'keep' ELSE 'move' END "
+                          "WHERE group_id = ?", (path, group_id))
+        self.conn.execute("UPDATE groups SET keeper = ?, review = 'accepted' WHERE id = ?", (path, group_id))
+        self.conn.commit()
+
+    def set_review(self, group_id, review):
+        """Mark a group pending, accepted or skipped; skipped groups are left out of the move plan"""
+        self.conn.execute("UPDATE groups SET review = ? WHERE id = ?", (review, group_id))
+        self.conn.commit()
+
+    def accept_pending(self, run_id):
+        self.conn.execute("UPDATE groups SET review = 'accepted' WHERE run_id = ? AND review = 'pending'", (run_id,))
+        self.conn.commit()
+
+    def planned_duplicates(self, run_id, accepted_only=False):
+        """(path, keeper, matched_with, similarity) for every file of run_id still to be moved.
+
+        Skipped groups and files already moved are left out; with
+        accepted_only, so are groups nobody reviewed.
+        """
+        reviews = ("accepted",) if accepted_only else ("accepted", "pending")
+        return self.conn.execute(
+            "SELECT m.path, g.keeper, m.matched_with, m.similarity FROM groups g "
+            "JOIN members m ON m.group_id = g.id "
+            f"WHERE g.run_id = ? AND m.action = 'move' AND g.review IN ({','.join('?' * len(reviews))}) "
+            "AND NOT EXISTS (SELECT 1 FROM moves mv WHERE mv.source = m.path AND mv.run_id = g.run_id "
+            "AND mv.status = 'moved') ORDER BY g.number, m.rank",
+            (run_id,) + reviews,
+        ).fetchall()
+
+    # --- Queries ---
+    def latest_run(self):
+        row = self.conn.execute("SELECT id FROM runs ORDER BY id DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def runs(self):
+        cursor = self.conn.execute(
+            "SELECT r.id, r.started, r.finished, r.status, r.threshold, COUNT(g.id) "
+            "FROM runs r LEFT JOIN groups g ON g.run_id = r.id GROUP BY r.id ORDER BY r.id"
+        )
+        return [dict(zip(("id", "started", "finished", "status", "threshold", "groups"), row)) for row in cursor]
+
+    def group_of(self, path, run_id=None):
+        """The group path (or the file it was moved to) belongs to in run_id or the latest run that has it"""
+        row = self.conn.execute("SELECT source, run_id FROM moves WHERE dest = ? ORDER BY run_id DESC LIMIT 1",
+                                (path,)).fetchone()
+        if row is not None and (run_id is None or row[1] == run_id):
+            path = row[0]
+        query = "SELECT group_id, run_id FROM members WHERE path = ?"
+        params = [path]
+        if run_id is not None:
+            query += " AND run_id = ?"
+            params.append(run_id)
+        row = self.conn.execute(query + " ORDER BY run_id DESC LIMIT 1", params).fetchone()
+        if row is None:
+            return None
+        group_id, found_run = row
+        number, representative, keeper = self.conn.execute(
+            "SELECT number, representative, keeper FROM groups WHERE id = ?", (group_id,)).fetchone()
+        members = [dict(zip(MEMBER_COLUMNS, (number, representative) + member))
+                   for member in self._member_rows("m.group_id = ?", (group_id,), found_run)]
+        edges = self.conn.execute("SELECT path_a, path_b, similarity FROM edges WHERE group_id = ?",
+                                  (group_id,)).fetchall()
+        return {"run_id": found_run, "group": number, "representative": representative, "keeper": keeper,
+                "members": members, "edges": edges}
+
+    def _member_rows(self, where, params, run_id):
+        return self.conn.execute(
+            "SELECT m.path, m.rank, m.action, m.score, m.width, m.height, m.duration, m.bit_rate, "
+            "m.matched_with, m.similarity, mv.dest, mv.status FROM members m "
+            "LEFT JOIN moves mv ON mv.rowid = "
+            "(SELECT MAX(rowid) FROM moves WHERE source = m.path AND run_id = ?) "
+            f"WHERE {where} ORDER BY m.rank",
+            (run_id,) + tuple(params),
+        )
+
+    def group_count(self, run_id):
+        return self.conn.execute("SELECT COUNT(*) FROM groups WHERE run_id = ?", (run_id,)).fetchone()[0]
+
+    def member_page(self, run_id, after_number, groups):
+        """Rows (REVIEW_COLUMNS) of the `groups` groups numbered after after_number, keeper first"""
+        return self.conn.execute(
+            "SELECT g.id, g.number, g.review, m.path, m.rank, m.action, m.score, m.width, m.height, m.duration, "
+            "m.matched_with, m.similarity, mv.dest, mv.status FROM groups g JOIN members m ON m.group_id = g.id "
+            "LEFT JOIN moves mv ON mv.rowid = "
+            "(SELECT MAX(rowid) FROM moves WHERE source = m.path AND run_id = g.run_id) "
+            "WHERE g.run_id = ? AND g.number > ? AND g.number <= ? ORDER BY g.number, m.action != 'keep', m.rank",
+            (run_id, after_number, after_number + groups),
+        ).fetchall()
+
+    def iter_members(self, run_id):
+        """Yield one dict per file of run_id (MEMBER_COLUMNS), group by group, keeper first"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT g.number, g.representative, m.path, m.rank, m.action, m.score, m.width, m.height, m.duration, "
+            "m.bit_rate, m.matched_with, m.similarity, mv.dest, mv.status FROM groups g "
+            "JOIN members m ON m.group_id = g.id "
+            # Only the latest attempt per file: re-applying a run adds more move records
+            "LEFT JOIN moves mv ON mv.rowid = "
+            "(SELECT MAX(rowid) FROM moves WHERE source = m.path AND run_id = g.run_id) "
+            "WHERE g.run_id = ? ORDER BY g.number, m.rank",
+            (run_id,),
+        )
+        for row in cursor:
+            yield dict(zip(MEMBER_COLUMNS, row))
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,380 @@
+import sys
+import os
+import argparse
+import threading
+from collections import OrderedDict
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QWidget,
+                             QTableView, QAbstractItemView, QHeaderView)
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QObject, QRunnable, QThreadPool, QSize, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap, QColor
+from main import plan_reviewed, execute_plan
+from results import REVIEW_COLUMNS, ResultsDB
+from reports import THUMB_SIZE, make_thumbnail, thumbnail_name
+from metrics import Metrics
+import config
+
+PAGE_GROUPS = 50  # Groups read from the results database per fetchMore
+PIXMAP_CACHE = 512  # Thumbnails kept as QPixmaps, least recently shown dropped first
+THUMB_THREADS = 4
+ICON_SIZE = THUMB_SIZE // 2
+
+COLUMNS = ["", "Group", "Keep", "File", "Score", "Resolution", "Duration", "Matched With", "Similarity", "Status"]
+KEEP_COLUMN = 2
+KEEP_COLOR = QColor("#e8f5e9")
+SKIPPED_COLOR = QColor("#eeeeee")
+
+
+class _ThumbnailTask(QRunnable):
+    def __init__(self, loader, path, location, duration):
+        super().__init__()
+        self.loader = loader
+        self.path = path
+        self.location = location
+        self.duration = duration
+
+    def run(self):
+        image = QImage()
+        try:
+            out = make_thumbnail(self.location, os.path.join(self.loader.thumb_dir, thumbnail_name(self.path)),
+                                 self.duration)
+            if out:
+                image = QImage(out)
+        except Exception:
+            pass
+        # Queued to the GUI thread, where the pixmap is made
+        self.loader.loaded.emit(self.path, image)
+
+
+class ThumbnailLoader(QObject):
+    """Thumbnails decoded on a QThreadPool and kept in an LRU cache of QPixmaps.
+
+    pixmap() never blocks: it returns None and queues a decode when the
+    thumbnail is not cached, and `ready` fires once it is. QImages are
+    made on the pool; only the QPixmap conversion runs on the GUI thread.
+    """
+
+    loaded = pyqtSignal(str, QImage)
+    ready = pyqtSignal(str)
+
+    def __init__(self, thumb_dir, capacity=PIXMAP_CACHE, threads=THUMB_THREADS):
+        super().__init__()
+        os.makedirs(thumb_dir, exist_ok=True)
+        self.thumb_dir = thumb_dir
+        self.capacity = capacity
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(threads)
+        self._cache = OrderedDict()
+        self._pending = set()
+        self._failed = set()
+        self.loaded.connect(self._store)
+
+    def pixmap(self, path, duration=None, location=None):
+        """Thumbnail of the file recorded as path, decoded from location (its quarantine path once moved)"""
+        if path in self._cache:
+            self._cache.move_to_end(path)
+            return self._cache[path]
+        if path not in self._pending and path not in self._failed:
+            self._pending.add(path)
+            self.pool.start(_ThumbnailTask(self, path, location or path, duration))
+        return None
+
+    def _store(self, path, image):
+        self._pending.discard(path)
+        if image.isNull():
+            self._failed.add(path)
+            return
+        self._cache[path] = QPixmap.fromImage(image).scaled(ICON_SIZE, ICON_SIZE, Qt.KeepAspectRatio,
+                                                              Qt.SmoothTransformation)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+        self.ready.emit(path)
+
+    def shutdown(self, wait_ms=2000):
+        self.pool.clear()
+        self.pool.waitForDone(wait_ms)
+
+
+class ReviewModel(QAbstractTableModel):
+    """One row per file of a recorded run, fetched from the results database a page of groups at a time.
+
+    The view asks for more rows through canFetchMore/fetchMore as it
+    scrolls, so opening a run with 100k groups reads only the first page.
+    data() answers from memory; thumbnails come from the ThumbnailLoader.
+    """
+
+    def __init__(self, results, run_id, thumbnails, parent=None):
+        super().__init__(parent)
+        self.results = results
+        self.run_id = run_id
+        self.thumbnails = thumbnails
+        self.rows = []
+        self.loaded = 0  # Groups numbered up to this are in rows
+        self.total = results.group_count(run_id) if run_id is not None else 0
+        self._group_rows = {}  # group_id -> [first row, last row]
+        self._path_rows = {}
+        thumbnails.ready.connect(self._thumbnail_ready)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < self.total
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        page = self.results.member_page(self.run_id, self.loaded, PAGE_GROUPS)
+        self.loaded = min(self.total, self.loaded + PAGE_GROUPS)
+        if not page:
+            return
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+        for k, values in enumerate(page, first):
+            row = dict(zip(REVIEW_COLUMNS, values))
+            self.rows.append(row)
+            self._group_rows.setdefault(row["group_id"], [k, k])[1] = k
+            self._path_rows.setdefault(row["path"], []).append(k)
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        column = index.column()
+        if role == Qt.DecorationRole and column == 0:
+            location = row["moved_to"] if row["move_status"] == "moved" else row["path"]
+            return self.thumbnails.pixmap(row["path"], row["duration"], location)
+        if role == Qt.CheckStateRole and column == KEEP_COLUMN:
+            return Qt.Checked if row["action"] == "keep" else Qt.Unchecked
+        if role == Qt.BackgroundRole:
+            if row["review"] == "skipped":
+                return SKIPPED_COLOR
+            return KEEP_COLOR if row["action"] == "keep" else None
+        if role == Qt.ToolTipRole and column in (3, 7):
+            return row["path"] if column == 3 else row["matched_with"]
+        if role != Qt.DisplayRole:
+            return None
+        if column == 1:
+            return row["number"]
+        if column == 3:
+            return os.path.basename(row["path"])
+        if column == 4:
+            return "" if row["score"] is None else f"{row['score']:.3g}"
+        if column == 5:
+            return f"{row['width']}x{row['height']}" if row["width"] else ""
+        if column == 6:
+            return "" if row["duration"] is None else f"{row['duration']:.1f}s"
+        if column == 7:
+            return os.path.basename(row["matched_with"] or "")
+        if column == 8:
+            return "" if row["similarity"] is None else f"{row['similarity']:.4f}"
+        if column == 9:
+            return row["move_status"] or row["review"]
+        return None
+
+    def flags(self, index):
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() == KEEP_COLUMN and not self.rows[index.row()]["move_status"]:
+            flags |= Qt.ItemIsUserCheckable
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.CheckStateRole or index.column() != KEEP_COLUMN or value != Qt.Checked:
+            return False
+        self.set_keeper(index.row())
+        return True
+
+    def _group_changed(self, group_id):
+        first, last = self._group_rows[group_id]
+        self.dataChanged.emit(self.index(first, 0), self.index(last, len(COLUMNS) - 1))
+
+    def set_keeper(self, row_index):
+        """Keep this row's file instead of the ranked keeper and accept its group"""
+        row = self.rows[row_index]
+        self.results.set_keeper(row["group_id"], row["path"])
+        first, last = self._group_rows[row["group_id"]]
+        for other in self.rows[first:last + 1]:
+            other["action"] = "keep" if other is row else "move"
+            other["review"] = "accepted"
+        self._group_changed(row["group_id"])
+
+    def set_review(self, row_indexes, review):
+        """Accept or skip the groups of the given rows"""
+        for group_id in {self.rows[k]["group_id"] for k in row_indexes}:
+            self.results.set_review(group_id, review)
+            first, last = self._group_rows[group_id]
+            for row in self.rows[first:last + 1]:
+                row["review"] = review
+            self._group_changed(group_id)
+
+    def accept_pending(self):
+        """Accept every group of the run nobody skipped, loaded or not"""
+        self.results.accept_pending(self.run_id)
+        for row in self.rows:
+            if row["review"] == "pending":
+                row["review"] = "accepted"
+        if self.rows:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.rows) - 1, len(COLUMNS) - 1))
+
+    def _thumbnail_ready(self, path):
+        for k in self._path_rows.get(path, ()):
+            index = self.index(k, 0)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class MoveWorker(QObject):
+    status_signal = pyqtSignal(str)
+    done_signal = pyqtSignal(str)
+
+    def __init__(self, db_path, run_id, duplicate_dir):
+        super().__init__()
+        self.db_path = db_path
+        self.run_id = run_id
+        self.duplicate_dir = duplicate_dir
+
+    def run(self):
+        # Own connection: the GUI thread keeps reading pages from its one
+        results = ResultsDB(self.db_path)
+        try:
+            plan = plan_reviewed(results, self.run_id, self.duplicate_dir, accepted_only=True)
+            self.status_signal.emit(f"Moving {len(plan)} duplicates...")
+            result = execute_plan(plan, Metrics(), results=results, run_id=self.run_id)
+            results.finish_run(self.run_id, "applied")
+            failed = f", {len(result['failed'])} failed" if result["failed"] else ""
+            self.done_signal.emit(f"Moved {result['moved']} of {len(plan)} duplicates{failed}")
+        except Exception as e:
+            self.done_signal.emit(f"Error: {e}")
+        finally:
+            results.close()
+
+
+class ReviewWindow(QMainWindow):
+    """Review a recorded run's groups before anything is moved.
+
+    Check "Keep" on another file to keep it instead, skip groups that
+    are not duplicates, then move the accepted groups. Reading pages,
+    decoding thumbnails and moving all stay off the paint path, so the
+    window scrolls smoothly through runs of any size.
+    """
+
+    def __init__(self, db_path=None, run_id=None, duplicate_dir=None, thumb_dir=None):
+        super().__init__()
+        self.setWindowTitle("Review Duplicates")
+        self.setGeometry(120, 120, 1100, 700)
+        self.db_path = db_path or config.results_db_path()
+        self.duplicate_dir = duplicate_dir or config.DUPLICATE_DIR
+        self.results = ResultsDB(self.db_path)
+        self.thumbnails = ThumbnailLoader(thumb_dir or os.path.join(os.path.dirname(self.db_path), "thumbnails"))
+        self.move_thread = None
+
+        self.central_widget = QWidget()
+        self.setCentralWidget(self.central_widget)
+        self.layout = QVBoxLayout()
+        self.central_widget.setLayout(self.layout)
+
+        self.view = QTableView()
+        self.view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.view.setIconSize(QSize(ICON_SIZE, ICON_SIZE))
+        # Fixed row heights: the view never measures rows it does not show
+        self.view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.view.verticalHeader().setDefaultSectionSize(ICON_SIZE + 4)
+        self.view.verticalHeader().hide()
+        self.view.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.view.horizontalHeader().setStretchLastSection(True)
+
+        self.accept_button = QPushButton("Accept Group")
+        self.skip_button = QPushButton("Skip Group")
+        self.keep_button = QPushButton("Keep Selected File")
+        self.accept_all_button = QPushButton("Accept Remaining")
+        self.move_button = QPushButton("Move Accepted Duplicates")
+        self.status_label = QLabel("")
+
+        buttons = QHBoxLayout()
+        for button in (self.accept_button, self.skip_button, self.keep_button, self.accept_all_button,
+                       self.move_button):
+            buttons.addWidget(button)
+        self.layout.addWidget(self.view)
+        self.layout.addLayout(buttons)
+        self.layout.addWidget(self.status_label)
+
+        self.accept_button.clicked.connect(lambda: self.review_selected("accepted"))
+        self.skip_button.clicked.connect(lambda: self.review_selected("skipped"))
+        self.keep_button.clicked.connect(self.keep_selected)
+        self.accept_all_button.clicked.connect(self.accept_remaining)
+        self.move_button.clicked.connect(self.move_accepted)
+
+        self.show_run(run_id if run_id is not None else self.results.latest_run())
+
+    def show_run(self, run_id):
+        self.run_id = run_id
+        self.model = ReviewModel(self.results, run_id, self.thumbnails, self)
+        self.view.setModel(self.model)
+        self.view.setColumnWidth(0, ICON_SIZE + 8)
+        self.view.setColumnWidth(3, 320)
+        self.update_status()
+
+    def update_status(self, message=""):
+        run = f"Run {self.run_id}: " if self.run_id is not None else "No runs recorded yet. "
+        self.status_label.setText(f"{run}{self.model.loaded} of {self.model.total} groups loaded. {message}")
+
+    def selected_rows(self):
+        return sorted({index.row() for index in self.view.selectionModel().selectedRows()})
+
+    def review_selected(self, review):
+        self.model.set_review(self.selected_rows(), review)
+
+    def keep_selected(self):
+        rows = self.selected_rows()
+        if len(rows) != 1:
+            self.update_status("Select the one file to keep.")
+            return
+        self.model.set_keeper(rows[0])
+
+    def accept_remaining(self):
+        self.model.accept_pending()
+        self.update_status("All groups not skipped are accepted.")
+
+    def move_accepted(self):
+        if self.run_id is None or (self.move_thread is not None and self.move_thread.is_alive()):
+            return
+        if not self.duplicate_dir:
+            self.update_status("Duplicate folder not set.")
+            return
+        self.move_button.setEnabled(False)
+        self.worker = MoveWorker(self.db_path, self.run_id, self.duplicate_dir)
+        self.worker.status_signal.connect(self.update_status)
+        self.worker.done_signal.connect(self.moves_done)
+        self.move_thread = threading.Thread(target=self.worker.run)
+        self.move_thread.start()
+
+    def moves_done(self, message):
+        self.move_button.setEnabled(True)
+        # Reload so moved files show their status
+        self.show_run(self.run_id)
+        self.update_status(message)
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        self.thumbnails.shutdown()
+        super().closeEvent(event)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Review duplicate groups before moving them.")
+    parser.add_argument("--config", help="TOML/YAML config file")
+    parser.add_argument("--run", type=int, help="Run to review (default: the latest)")
+    parser.add_argument("--db", help="Results database (default: <frame dir>/results.sqlite)")
+    args = parser.parse_args()
+    config.load_config(args.config)
+    app = QApplication(sys.argv[:1])
+    window = ReviewWindow(args.db, args.run)
+    window.show()
+    sys.exit(app.exec_())
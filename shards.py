@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import socket
+import numpy as np
+
+SHARD_VERSION = 1
+# Header fields that must match for embeddings from different shards to be comparable
+COMPATIBLE_FIELDS = ("model_id", "preprocess", "dim")
+
+
+def describe(model_id, preprocess, roots, node=None):
+    """Header of a shard written by this machine for the files under roots"""
+    return {
+        "version": SHARD_VERSION,
+        "node": node or socket.gethostname(),
+        "model_id": model_id,
+        "preprocess": preprocess,
+        "roots": [os.path.abspath(root) for root in roots],
+        "created": time.time(),
+    }
+
+
+def write(path, header, embeddings, metadata=None):
+    """Write (path, embedding) pairs as a self-describing .npz shard; returns the header written.
+
+    Embeddings of any number of frames are stored as one float32 row
+    matrix with per-file row counts, so no pickled objects are needed to
+    read a shard back. metadata maps path to its ffprobe info.
+    """
+    paths = []
+    rows = []
+    blocks = []
+    for video_path, embedding in embeddings:
+        block = np.asarray(embedding, dtype=np.float32).reshape(-1, np.shape(embedding)[-1])
+        paths.append(video_path)
+        rows.append(len(block) if np.ndim(embedding) > 1 else 0)  # 0: stored as a single vector
+        blocks.append(block)
+    dim = blocks[0].shape[1] if blocks else 0
+    header = dict(header, count=len(paths), dim=dim)
+    info = [(metadata or {}).get(p) for p in paths]
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        header=np.array(json.dumps(header)),
+        paths=np.array(paths, dtype=str),
+        rows=np.array(rows, dtype=np.int32),
+        vectors=np.concatenate(blocks) if blocks else np.zeros((0, 0), dtype=np.float32),
+        metadata=np.array(json.dumps(info)),
+    )
+    os.replace(tmp_path, path)
+    return header
+
+
+def read_header(path):
+    with np.load(path) as data:
+        return json.loads(str(data["header"]))
+
+
+def load(path):
+    """(header, {path: embedding}, {path: metadata}) of a shard"""
+    with np.load(path) as data:
+        header = json.loads(str(data["header"]))
+        if header.get("version") != SHARD_VERSION:
+            raise ValueError(f"{path}: shard version {header.get('version')}, expected {SHARD_VERSION}")
+        paths = [str(p) for p in data["paths"]]
+        rows = data["rows"]
+        vectors = data["vectors"]
+        info = json.loads(str(data["metadata"]))
+    embeddings = {}
+    offset = 0
+    for video_path, count in zip(paths, rows.tolist()):
+        if count:
+            embeddings[video_path] = vectors[offset:offset + count]
+            offset += count
+        else:
+            embeddings[video_path] = vectors[offset]
+            offset += 1
+    metadata = {p: m for p, m in zip(paths, info) if m}
+    return header, embeddings, metadata
+
+
+def check_compatible(headers):
+    """Raise ValueError naming the shards whose model or preprocessing differs from the first non-empty one"""
+    # Empty shards carry no vectors (and no dim), so they neither need nor set the reference
+    names = [name for name in headers if headers[name]["count"]]
+    if not names:
+        return
+    first = headers[names[0]]
+    for name in names[1:]:
+        header = headers[name]
+        diffs = [field for field in COMPATIBLE_FIELDS if header.get(field) != first.get(field)]
+        if diffs:
+            details = ", ".join(f"{field} {header.get(field)!r} vs {first.get(field)!r}" for field in diffs)
+            raise ValueError(f"{name} is not comparable with {names[0]}: {details}")
+
+
+def merge(shard_paths):
+    """Combine shards from several nodes; returns ({path: embedding}, {path: metadata}, {shard: header}).
+
+    Every shard is checked against the first non-empty one before any
+    vectors are loaded. A path reported by two nodes (the same mount
+    point on two machines) is kept apart as "node:path"; from the same
+    node the newer shard wins.
+    """
+    headers = {path: read_header(path) for path in shard_paths}
+    check_compatible(headers)
+    embeddings = {}
+    metadata = {}
+    owner = {}
+    for shard_path in sorted(shard_paths, key=lambda p: headers[p]["created"]):
+        header, shard_embeddings, shard_metadata = load(shard_path)
+        node = header["node"]
+        for video_path, embedding in shard_embeddings.items():
+            key = video_path
+            if owner.get(video_path, node) != node:
+                key = f"{node}:{video_path}"
+            owner.setdefault(video_path, node)
+            embeddings[key] = embedding
+            if video_path in shard_metadata:
+                metadata[key] = shard_metadata[video_path]
+    return embeddings, metadata, headers
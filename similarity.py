@@ -0,0 +1,86 @@
+import numpy as np
+
+DEFAULT_BLOCK_SIZE = 2048  # 2048 x 2048 float32 tile = 16 MB
+
+
+def normalize_rows(matrix):
+    """L2-normalize the last axis so dot products are cosine similarities"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def pool_signature(signature):
+    """Mean-pool a (frames, D) signature into one normalized (D,) vector"""
+    frames = normalize_rows(np.asarray(signature, dtype=np.float32).reshape(-1, np.shape(signature)[-1]))
+    return normalize_rows(frames.mean(axis=0))
+
+
+def stack_embeddings(video_embeddings, mode="mean"):
+    """Stack a {path: embedding} dict into (paths, normalized float32 array).
+
+    Embeddings may be (D,) vectors or (frames, D) signatures. With mode
+    "mean" each signature is mean-pooled into a (V, D) matrix; with mode
+    "max" the frames are kept as a (V, frames, D) array, padding shorter
+    signatures by repeating their last frame (which leaves max-over-pairs
+    unchanged).
+    """
+    paths = list(video_embeddings)
+    if not paths:
+        return paths, np.zeros((0, 0), dtype=np.float32)
+    if mode == "mean":
+        return paths, np.stack([pool_signature(video_embeddings[p]) for p in paths])
+    if mode != "max":
+        raise ValueError(f"Unknown signature mode: {mode}")
+
+    signatures = [np.asarray(video_embeddings[p], dtype=np.float32) for p in paths]
+    signatures = [s.reshape(-1, s.shape[-1]) for s in signatures]
+    frames = max(len(s) for s in signatures)
+    stacked = np.stack([np.concatenate([s, np.repeat(s[-1:], frames - len(s), axis=0)]) for s in signatures])
+    return paths, normalize_rows(stacked)
+
+
+def tile_similarity(block, others):
+    """Similarity tile between two row ranges of a (V, D) or (V, frames, D) array"""
+    if block.ndim == 2:
+        return block @ others.T
+    b, f, d = block.shape
+    c, g, _ = others.shape
+    sims = block.reshape(b * f, d) @ others.reshape(c * g, d).T
+    return sims.reshape(b, f, c, g).max(axis=(1, 3))
+
+
+def similar_pairs(matrix, threshold, block_size=DEFAULT_BLOCK_SIZE):
+    """All pairs i < j with cosine similarity above threshold.
+
+    The upper triangle is computed tile by tile so peak memory stays at
+    block_size x block_size floats regardless of collection size. For
+    (V, frames, D) signatures the similarity of two videos is the best
+    matching frame pair, and the tile shrinks so memory stays bounded.
+    Returns three arrays (i, j, similarity).
+    """
+    n = len(matrix)
+    if matrix.ndim == 3:
+        block_size = max(1, block_size // matrix.shape[1])
+    rows_out, cols_out, sims_out = [], [], []
+    for row_start in range(0, n, block_size):
+        row_stop = min(row_start + block_size, n)
+        block = matrix[row_start:row_stop]
+        for col_start in range(row_start, n, block_size):
+            col_stop = min(col_start + block_size, n)
+            sims = tile_similarity(block, matrix[col_start:col_stop])
+            rows, cols = np.nonzero(sims > threshold)
+            if not len(rows):
+                continue
+            values = sims[rows, cols]
+            rows = rows + row_start
+            cols = cols + col_start
+            keep = rows < cols
+            rows_out.append(rows[keep])
+            cols_out.append(cols[keep])
+            sims_out.append(values[keep])
+    if not rows_out:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float32)
+    return np.concatenate(rows_out), np.concatenate(cols_out), np.concatenate(sims_out)
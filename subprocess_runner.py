@@ -0,0 +1,165 @@
+import os
+import time
+import asyncio
+import subprocess
+import threading
+from collections import namedtuple
+
+# Keep ffmpeg from flashing console windows when frozen with --noconsole
+NO_WINDOW = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+CONGESTION_FACTOR = 2.0  # Latency this far above the baseline means the disk or CPU is saturated
+BACKOFF = 0.7  # Multiplicative decrease of the limit on congestion
+STOP_POLL_SECONDS = 0.1
+
+CommandResult = namedtuple("CommandResult", "returncode stdout stderr timed_out cancelled")
+
+
+def run_command(cmd, timeout):
+    """Blocking subprocess.run equivalent of AsyncRunner.run"""
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                timeout=timeout, creationflags=NO_WINDOW)
+    except subprocess.TimeoutExpired:
+        return CommandResult(None, b"", b"", True, False)
+    except OSError as e:
+        return CommandResult(None, b"", str(e).encode(), False, False)
+    return CommandResult(result.returncode, result.stdout, result.stderr, False, False)
+
+
+class AdaptiveLimit:
+    """AIMD concurrency limit driven by command latency.
+
+    A fast moving average of latency is compared with a slowly rising
+    baseline (the best average seen). While latency stays near the baseline
+    the limit grows by one per `limit` completions; when it climbs past
+    CONGESTION_FACTOR times the baseline, or a command times out, the limit
+    is cut by BACKOFF, at most once per `limit` completions.
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None):
+        self.minimum = minimum
+        self.maximum = maximum or max(initial, 2 * (os.cpu_count() or 2))
+        self.value = max(minimum, min(initial, self.maximum))
+        self.recent = None
+        self.baseline = None
+        self._since_change = 0
+
+    def observe(self, seconds, timed_out=False):
+        self._since_change += 1
+        if not timed_out:
+            self.recent = seconds if self.recent is None else 0.8 * self.recent + 0.2 * seconds
+            if self.baseline is None or self.recent < self.baseline:
+                self.baseline = self.recent
+            else:
+                self.baseline *= 1.01  # Let the baseline follow a permanently slower workload
+        congested = timed_out or (self.baseline and self.recent > CONGESTION_FACTOR * self.baseline)
+        if self._since_change < self.value:
+            return
+        if congested and self.value > self.minimum:
+            self.value = max(self.minimum, int(self.value * BACKOFF))
+            self._since_change = 0
+        elif not congested and self.value < self.maximum:
+            self.value += 1
+            self._since_change = 0
+
+
+class AsyncRunner:
+    """Runs ffmpeg/ffprobe commands on an asyncio loop in a background thread.
+
+    Any thread may call run(), which blocks until its command finishes; the
+    loop keeps at most `limit.value` processes alive at once. cancel() kills
+    everything in flight and fails all further calls, so Stop takes effect
+    within one poll interval instead of after the current timeouts.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=None):
+        self.limit = AdaptiveLimit(initial, minimum, maximum)
+        self.cancelled = False
+        self._watcher = None
+        self._active = 0
+        self._processes = set()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._slot = asyncio.run_coroutine_threadsafe(self._make_condition(), self._loop).result()
+
+    async def _make_condition(self):
+        return asyncio.Condition()
+
+    async def _run(self, cmd, timeout):
+        async with self._slot:
+            await self._slot.wait_for(lambda: self.cancelled or self._active < self.limit.value)
+            if self.cancelled:
+                return CommandResult(None, b"", b"", False, True)
+            self._active += 1
+        start = time.perf_counter()
+        result = None
+        try:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=NO_WINDOW,
+                )
+            except OSError as e:
+                result = CommandResult(None, b"", str(e).encode(), False, False)
+                return result
+            self._processes.add(process)
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+                result = CommandResult(process.returncode, stdout, stderr, False, self.cancelled)
+            except asyncio.TimeoutError:
+                self._kill(process)
+                await process.wait()
+                result = CommandResult(None, b"", b"", True, self.cancelled)
+            finally:
+                self._processes.discard(process)
+            return result
+        finally:
+            async with self._slot:
+                self._active -= 1
+                if result is not None and not result.cancelled:
+                    self.limit.observe(time.perf_counter() - start, result.timed_out)
+                self._slot.notify_all()
+
+    @staticmethod
+    def _kill(process):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+    def run(self, cmd, timeout):
+        """Run cmd to completion (or timeout/cancel); returns a CommandResult"""
+        if self.cancelled:
+            return CommandResult(None, b"", b"", False, True)
+        return asyncio.run_coroutine_threadsafe(self._run(cmd, timeout), self._loop).result()
+
+    async def _cancel(self):
+        self.cancelled = True
+        for process in list(self._processes):
+            self._kill(process)
+        async with self._slot:
+            self._slot.notify_all()
+
+    def cancel(self):
+        """Kill running commands and fail queued and future ones"""
+        if self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._cancel(), self._loop).result()
+
+    def watch(self, should_stop):
+        """Cancel as soon as should_stop() turns true"""
+        async def poll():
+            while not self.cancelled:
+                if should_stop():
+                    await self._cancel()
+                    return
+                await asyncio.sleep(STOP_POLL_SECONDS)
+        self._watcher = asyncio.run_coroutine_threadsafe(poll(), self._loop)
+
+    def close(self):
+        self.cancel()
+        if self._watcher is not None:
+            self._watcher.result()  # Returns within one poll once cancelled
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
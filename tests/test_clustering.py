@@ -0,0 +1,47 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from clustering import cluster
+
+PATHS = ["a.mp4", "b.mp4", "c.mp4", "d.mp4"]
+# a-b and b-c are above the threshold, a-c is not; d matches nothing
+ROWS, COLS, SIMS = [0, 1], [1, 2], [0.99, 0.96]
+
+
+def _groups(groups):
+    return sorted(sorted(members) for members in groups.values())
+
+
+def test_single_linkage_takes_connected_components():
+    groups = cluster(PATHS, ROWS, COLS, SIMS, "single")
+    assert _groups(groups) == [["a.mp4", "b.mp4", "c.mp4"], ["d.mp4"]]
+    # b has the highest summed similarity and its edges explain the group
+    assert groups["b.mp4"][0] == "b.mp4"
+    assert sorted(groups.edges["b.mp4"]) == [("a.mp4", "b.mp4", 0.99), ("b.mp4", "c.mp4", 0.96)]
+    assert groups.best_match("b.mp4", "c.mp4") == ("b.mp4", 0.96)
+
+
+def test_complete_linkage_splits_chains():
+    groups = cluster(PATHS, ROWS, COLS, SIMS, "complete")
+    # The strongest edge merges first; c has no edge to a, so it stays apart
+    assert _groups(groups) == [["a.mp4", "b.mp4"], ["c.mp4"], ["d.mp4"]]
+
+
+def test_centroid_linkage_drops_outliers():
+    matrix = np.array([[1, 0, 0], [1, 0.1, 0], [0.6, 0.8, 0], [0, 0, 1]], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    groups = cluster(PATHS, ROWS, COLS, SIMS, "centroid", matrix=matrix, threshold=0.9)
+    assert _groups(groups) == [["a.mp4", "b.mp4"], ["c.mp4"], ["d.mp4"]]
+
+
+def test_centroid_linkage_keeps_members_without_vectors():
+    # d was linked by the prefilter and sits past the end of the matrix
+    matrix = np.array([[1, 0, 0], [1, 0.1, 0], [0, 1, 0]], dtype=np.float32)
+    groups = cluster(PATHS, [0, 0], [1, 3], [0.99, 1.0], "centroid", matrix=matrix, threshold=0.9)
+    assert _groups(groups) == [["a.mp4", "b.mp4", "d.mp4"], ["c.mp4"]]
+
+
+def test_centroid_linkage_needs_matrix():
+    with pytest.raises(ValueError):
+        cluster(PATHS, ROWS, COLS, SIMS, "centroid")
@@ -0,0 +1,35 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from embedding_store import EmbeddingStore
+
+
+def _store_with(tmp_path, embedding):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"video")
+    store = EmbeddingStore(str(tmp_path / "cache.sqlite"), "test-model")
+    store.put(str(video), embedding)
+    store.commit()
+    return store, str(video)
+
+
+@pytest.mark.parametrize("shape", [(8,), (1, 8), (4, 8)])
+def test_round_trip(tmp_path, shape):
+    embedding = np.arange(np.prod(shape), dtype=np.float32).reshape(shape)
+    store, path = _store_with(tmp_path, embedding)
+    expected = embedding[0] if embedding.ndim == 2 and len(embedding) == 1 else embedding
+
+    for found in (store.get(path), dict(store.iter_under([str(tmp_path)]))[path], store.vectors([path])[path]):
+        assert found.shape == expected.shape
+        np.testing.assert_array_equal(found, expected)
+    store.close()
+
+
+def test_multi_frame_signature_survives_split_cached(tmp_path):
+    embedding = np.ones((4, 8), dtype=np.float32)
+    store, path = _store_with(tmp_path, embedding)
+    cached, pending = store.split_cached([path])
+    assert pending == []
+    assert cached[path].shape == (4, 8)
+    store.close()
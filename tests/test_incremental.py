@@ -0,0 +1,42 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from ann_index import IVFIndex
+from clustering import DuplicateGroups
+from incremental import IncrementalMatcher
+
+
+def _unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_centroid_regroup_keeps_prefilter_only_member():
+    # "b.mp4" was linked to "a.mp4" by the prefilter and was never embedded
+    index = IVFIndex.build(["a.mp4"], _unit(1, 0, 0)[None, :], nlist=1)
+    groups = DuplicateGroups({"a.mp4": ["a.mp4", "b.mp4"]})
+    groups.edges["a.mp4"] = [("a.mp4", "b.mp4", 1.0)]
+    matcher = IncrementalMatcher(index, groups, threshold=0.9, linkage="centroid")
+
+    changed = matcher.add({"c.mp4": _unit(1, 0.05, 0)})
+
+    assert len(changed) == 1
+    assert sorted(matcher.groups[changed[0]]) == ["a.mp4", "b.mp4", "c.mp4"]
+    assert "b.mp4" not in matcher
+
+
+def test_stale_re_embedded_file_is_regrouped():
+    paths = ["a.mp4", "b.mp4"]
+    index = IVFIndex.build(paths, np.stack([_unit(1, 0, 0), _unit(1, 0.05, 0)]), nlist=1)
+    groups = DuplicateGroups({"a.mp4": paths})
+    groups.edges["a.mp4"] = [("a.mp4", "b.mp4", 0.99)]
+    matcher = IncrementalMatcher(index, groups, threshold=0.9)
+    cached = {"a.mp4": _unit(0, 1, 0), "b.mp4": _unit(1, 0.05, 0)}
+
+    stale = matcher.stale(cached)
+    matcher.add({p: cached[p] for p in stale})
+
+    assert stale == ["a.mp4"]
+    assert not matcher.groups
+    assert "a.mp4" in matcher
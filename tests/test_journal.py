@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from embedding_store import EmbeddingStore
+from journal import ScanJournal
+
+
+@pytest.fixture
+def videos(tmp_path):
+    root = tmp_path / "videos"
+    root.mkdir()
+    paths = []
+    for i in range(6):
+        path = root / f"clip{i}.mp4"
+        path.write_bytes(b"x" * (i + 1))
+        paths.append(str(path))
+    return str(root), paths
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "cache.sqlite"), "test-model")
+    yield store
+    store.close()
+
+
+EMBEDDING = np.ones(4, dtype=np.float32)
+
+
+def test_resume_counts_earlier_work_once(store, videos):
+    root, paths = videos
+    store.put(paths[5], EMBEDDING)  # Cached by an earlier, finished scan
+    journal = ScanJournal(store).start([root])
+    assert journal.progress() is None
+    journal.record(paths[0], EMBEDDING)
+    journal.record(paths[1], EMBEDDING)
+    journal.fail(paths[2], "no frame decoded")
+    journal.stop()
+
+    resumed = ScanJournal(store).start([root])
+    assert resumed.resumed and resumed.job_id == journal.job_id
+    assert (resumed.done, resumed.failed) == (2, 1)
+    # A streaming scan learns the total only after embedding has started
+    resumed.record(paths[3], EMBEDDING)
+    resumed.set_total(len(paths), cached=3, skipped=1)
+    assert resumed.completed() == 5
+    assert resumed.progress() == pytest.approx(5 / 6)
+    resumed.finish()
+
+    assert not ScanJournal(store).start([root]).resumed
+
+
+def test_failed_files_are_skipped_until_they_change(store, videos):
+    root, paths = videos
+    journal = ScanJournal(store).start([root])
+    journal.fail(paths[0], "timeout")
+    journal.fail(paths[0], "timeout")
+    journal.finish()
+    assert journal.failures() == [(paths[0], "timeout", 2)]
+
+    journal = ScanJournal(store).start([root])
+    assert journal.skip_failed(paths) == paths[1:]
+    assert journal.skip_failed({path: os.stat(path) for path in paths}).keys() == set(paths[1:])
+    assert ScanJournal(store).start([root], retry_failed=True).skip_failed(paths) == paths
+
+    with open(paths[0], "ab") as f:
+        f.write(b"more")
+    assert journal.skip_failed(paths) == paths
+    journal.record(paths[0], EMBEDDING)
+    assert journal.failures() == []
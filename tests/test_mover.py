@@ -0,0 +1,43 @@
+import os
+
+import mover
+
+
+def _plan(tmp_path):
+    source = tmp_path / "videos" / "clip.mp4"
+    source.parent.mkdir()
+    source.write_bytes(b"duplicate")
+    plan = mover.plan_moves([(str(source), "keeper.mp4", None, None)], str(tmp_path / "duplicates"))
+    # Force the copy path even though both folders are on one volume
+    return str(source), [move._replace(method="copy") for move in plan]
+
+
+def test_copy_moves_and_journals(tmp_path):
+    source, plan = _plan(tmp_path)
+    journal = str(tmp_path / "moves.jsonl")
+    result = mover.execute(plan, journal)
+    assert result["moved"] == 1 and not result["failed"]
+    assert not os.path.exists(source) and os.path.exists(plan[0].dest)
+    assert mover.undo(journal)["restored"] == 1
+    assert os.path.exists(source)
+
+
+def test_failed_source_delete_leaves_no_copy(tmp_path, monkeypatch):
+    source, plan = _plan(tmp_path)
+    real_remove = os.remove
+
+    def remove(path):
+        if path == source:
+            raise PermissionError(f"{path} is locked")
+        real_remove(path)
+
+    monkeypatch.setattr(os, "remove", remove)
+    journal = str(tmp_path / "moves.jsonl")
+    result = mover.execute(plan, journal)
+    assert result["moved"] == 0
+    assert [path for path, _ in result["failed"]] == [source]
+    assert os.path.exists(source)
+    assert not os.path.exists(plan[0].dest)
+    assert not os.path.exists(plan[0].dest + mover.COPY_SUFFIX)
+    with open(journal, encoding="utf-8") as f:
+        assert f.read() == ""
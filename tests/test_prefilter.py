@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+pytest.importorskip("imagehash")
+
+from prefilter import BKTree, Cascade, bucket_key, hamming
+
+
+def test_bucket_key():
+    assert bucket_key({"duration": 61.0, "width": 1920, "height": 1080}) == (1.78, 30)
+    assert bucket_key({"duration": 61.0, "width": 1920}) is None
+    assert bucket_key(None) is None
+
+
+def test_bk_tree_matches_linear_scan():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(300)]
+    # Near copies, so small radii find something
+    values += [v ^ (1 << rng.randrange(64)) for v in values[:50]]
+    tree = BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, i)
+    for query in values[:20] + [rng.getrandbits(64)]:
+        for radius in (0, 4, 20):
+            expected = sorted((hamming(query, v), i) for i, v in enumerate(values) if hamming(query, v) <= radius)
+            assert sorted(tree.query(query, radius)) == expected
+
+
+def _video(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_cascade_sends_only_undecided_files_to_clip(tmp_path):
+    base = 0x0123456789ABCDEF
+    files = {
+        "a.mp4": (b"same bytes", 700, None),
+        "a_copy.mp4": (b"same bytes", 700, None),
+        "b.mp4": (b"b" * 11, 100, base),
+        "c.mp4": (b"c" * 12, 100, base ^ 0b1),  # 1 bit from b: same picture
+        "e.mp4": (b"e" * 13, 300, base),
+        "f.mp4": (b"f" * 14, 300, base ^ 0x3FF),  # 10 bits from e: neither same nor clearly different
+        "g.mp4": (b"g" * 15, 500, base),  # Nothing else is that long
+        "h.mp4": (b"h" * 16, None, None),  # No metadata
+    }
+    paths = {name: _video(tmp_path, name, content) for name, (content, _, _) in files.items()}
+    metadata = {
+        paths[name]: {"duration": duration, "width": 1280, "height": 720, "phash": phash}
+        for name, (_, duration, phash) in files.items()
+        if duration is not None
+    }
+    sizes = {paths[name]: len(content) for name, (content, _, _) in files.items()}
+
+    def load_image(path):
+        raise AssertionError(f"{path} already has a pHash")
+
+    cascade = Cascade().run(list(paths.values()), sizes, metadata, load_image, pending=paths.values())
+
+    assert sorted(cascade.edges) == [
+        (paths["a.mp4"], paths["a_copy.mp4"], 1.0),
+        (paths["b.mp4"], paths["c.mp4"], 1.0 - 1 / 64.0),
+    ]
+    assert cascade.needs_embedding == {paths["e.mp4"], paths["f.mp4"], paths["h.mp4"]}
+    assert dict(cascade.stats) == {
+        "exact_copies": 1, "isolated": 2, "phash_matches": 1, "clip": 3, "skipped": 5,
+    }
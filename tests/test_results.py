@@ -0,0 +1,96 @@
+import csv
+import json
+
+import pytest
+
+from clustering import DuplicateGroups
+from mover import Move
+from results import MEMBER_COLUMNS, ResultsDB
+
+
+def _groups():
+    groups = DuplicateGroups({
+        "a.mp4": ["a.mp4", "a2.mp4", "a3.mp4"],
+        "b.mp4": ["b.mp4", "b2.mp4"],
+        "single.mp4": ["single.mp4"],
+    })
+    groups.edges["a.mp4"] = [("a.mp4", "a2.mp4", 0.99), ("a.mp4", "a3.mp4", 0.97)]
+    groups.edges["b.mp4"] = [("b.mp4", "b2.mp4", 0.98)]
+    return groups
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = ResultsDB(str(tmp_path / "results.sqlite"))
+    yield db
+    db.close()
+
+
+def _ranked(group):
+    # Reverse path order ranks the copies above the representative
+    return [(float(len(group) - k), path) for k, path in enumerate(sorted(group, reverse=True))]
+
+
+def _record(db):
+    groups = _groups()
+    metadata = {"a2.mp4": {"width": 1920, "height": 1080, "duration": 60.0, "bit_rate": 5000000}}
+    run_id = db.start_run(0.95, {"SIMILARITY_THRESHOLD": 0.95})
+    count = db.record_groups(run_id, groups, _ranked, metadata, lambda rep, path: groups.best_match(rep, path))
+    return run_id, count
+
+
+def test_round_trip(db):
+    run_id, count = _record(db)
+    assert count == 2
+    assert db.latest_run() == run_id
+    assert [(run["id"], run["threshold"], run["groups"]) for run in db.runs()] == [(run_id, 0.95, 2)]
+
+    members = list(db.iter_members(run_id))
+    assert [(m["number"], m["path"], m["action"]) for m in members] == [
+        (1, "a3.mp4", "keep"), (1, "a2.mp4", "move"), (1, "a.mp4", "move"),
+        (2, "b2.mp4", "keep"), (2, "b.mp4", "move"),
+    ]
+    a2 = members[1]
+    assert (a2["width"], a2["height"], a2["duration"], a2["matched_with"], a2["similarity"]) == (
+        1920, 1080, 60.0, "a.mp4", 0.99)
+
+    found = db.group_of("a2.mp4")
+    assert (found["run_id"], found["group"], found["keeper"]) == (run_id, 1, "a3.mp4")
+    assert sorted(found["edges"]) == [("a.mp4", "a2.mp4", 0.99), ("a.mp4", "a3.mp4", 0.97)]
+    assert db.group_of("single.mp4") is None
+
+
+def test_review_and_moves(db, tmp_path):
+    run_id, _ = _record(db)
+    group_ids = {number: group_id for group_id, number, *_ in db.member_page(run_id, 0, 10)}
+    first, second = group_ids[1], group_ids[2]
+    db.set_keeper(first, "a.mp4")
+    db.set_review(second, "skipped")
+    assert db.planned_duplicates(run_id) == [("a3.mp4", "a.mp4", "a.mp4", 0.97), ("a2.mp4", "a.mp4", "a.mp4", 0.99)]
+    assert db.planned_duplicates(run_id, accepted_only=True) == db.planned_duplicates(run_id)
+
+    plan = [Move("a3.mp4", "dup/a3.mp4", "rename", "a.mp4", None, None),
+            Move("a2.mp4", "dup/a2.mp4", "rename", "a.mp4", None, None)]
+    db.record_moves(run_id, plan, [], [("a3.mp4", "locked")])
+    # A second apply of the same run moves both; reports show only the latest attempt
+    db.record_moves(run_id, plan, [("a3.mp4", "dup/a3.mp4", "rename"), ("a2.mp4", "dup/a2.mp4", "rename")], [])
+    assert db.planned_duplicates(run_id) == []
+
+    members = list(db.iter_members(run_id))
+    assert len(members) == 5
+    moved = {m["path"]: (m["moved_to"], m["move_status"]) for m in members if m["move_status"]}
+    assert moved == {"a3.mp4": ("dup/a3.mp4", "moved"), "a2.mp4": ("dup/a2.mp4", "moved")}
+    assert len(db.member_page(run_id, 0, 10)) == 5
+    assert db.group_of("dup/a3.mp4")["keeper"] == "a.mp4"
+
+    reports = pytest.importorskip("reports")
+    rows = list(db.iter_members(run_id))
+    with open(reports.write(rows, str(tmp_path / "report.csv")), newline="", encoding="utf-8") as f:
+        written = list(csv.reader(f))
+    assert written[0] == MEMBER_COLUMNS
+    assert [row[2] for row in written[1:]] == [m["path"] for m in rows]
+    with open(reports.write(iter(rows), str(tmp_path / "report.json")), encoding="utf-8") as f:
+        groups = json.load(f)
+    assert [(g["group"], g["representative"], len(g["members"])) for g in groups] == [(1, "a.mp4", 3), (2, "b.mp4", 2)]
+    with pytest.raises(ValueError):
+        reports.write(rows, str(tmp_path / "report.txt"))
@@ -0,0 +1,60 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import shards
+
+
+def _shard(tmp_path, name, embeddings, model_id="model-a", node=None, created=None, metadata=None):
+    header = shards.describe(model_id, {"version": 1}, [str(tmp_path)], node=node or name)
+    if created is not None:
+        header["created"] = created
+    path = str(tmp_path / f"{name}.npz")
+    shards.write(path, header, embeddings.items(), metadata)
+    return path
+
+
+def test_round_trip_keeps_shapes(tmp_path):
+    embeddings = {"a.mp4": np.arange(4, dtype=np.float32), "b.mp4": np.ones((3, 4), dtype=np.float32)}
+    path = _shard(tmp_path, "node1", embeddings, metadata={"a.mp4": {"duration": 12.0}})
+
+    header, loaded, metadata = shards.load(path)
+
+    assert (header["count"], header["dim"], header["model_id"]) == (2, 4, "model-a")
+    assert loaded.keys() == embeddings.keys()
+    for video_path, embedding in embeddings.items():
+        assert loaded[video_path].shape == embedding.shape
+        np.testing.assert_array_equal(loaded[video_path], embedding)
+    assert metadata == {"a.mp4": {"duration": 12.0}}
+
+
+def test_merge_keeps_paths_from_different_nodes_apart(tmp_path):
+    old = _shard(tmp_path, "old", {"a.mp4": np.zeros(4, dtype=np.float32)}, node="n1", created=1.0)
+    new = _shard(tmp_path, "new", {"a.mp4": np.ones(4, dtype=np.float32)}, node="n1", created=2.0)
+    other = _shard(tmp_path, "other", {"a.mp4": np.full(4, 2, dtype=np.float32)}, node="n2", created=3.0)
+
+    embeddings, _, headers = shards.merge([other, new, old])
+
+    assert set(headers) == {old, new, other}
+    assert sorted(embeddings) == ["a.mp4", "n2:a.mp4"]
+    np.testing.assert_array_equal(embeddings["a.mp4"], np.ones(4))  # Newer shard of the same node wins
+
+
+def test_incompatible_shards_are_refused(tmp_path):
+    a = _shard(tmp_path, "a", {"a.mp4": np.zeros(4, dtype=np.float32)})
+    b = _shard(tmp_path, "b", {"b.mp4": np.zeros(4, dtype=np.float32)}, model_id="model-b")
+    wide = _shard(tmp_path, "wide", {"c.mp4": np.zeros(8, dtype=np.float32)})
+    with pytest.raises(ValueError, match="model_id"):
+        shards.merge([a, b])
+    with pytest.raises(ValueError, match="dim"):
+        shards.merge([a, wide])
+
+
+def test_empty_first_shard_does_not_hide_a_mismatch(tmp_path):
+    empty = _shard(tmp_path, "empty", {}, model_id="model-c")
+    a = _shard(tmp_path, "a", {"a.mp4": np.zeros(4, dtype=np.float32)})
+    b = _shard(tmp_path, "b", {"b.mp4": np.zeros(4, dtype=np.float32)}, model_id="model-b")
+    with pytest.raises(ValueError, match="model_id"):
+        shards.merge([empty, a, b])
+    embeddings, _, _ = shards.merge([empty, a])
+    assert list(embeddings) == ["a.mp4"]
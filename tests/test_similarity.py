@@ -0,0 +1,45 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from similarity import normalize_rows, similar_pairs
+
+
+def _brute_force(matrix, threshold):
+    sims = matrix @ matrix.T
+    return {(i, j) for i in range(len(matrix)) for j in range(i + 1, len(matrix)) if sims[i, j] > threshold}
+
+
+def _pairs(found):
+    rows, cols, sims = found
+    assert (rows < cols).all()
+    return {(int(i), int(j)) for i, j in zip(rows, cols)}
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 16, 2048])
+def test_blocked_pairs_match_brute_force(block_size):
+    rng = np.random.default_rng(0)
+    # Noisy copies of a few bases, so there are pairs on both sides of the threshold
+    bases = rng.normal(size=(10, 16))
+    matrix = normalize_rows(bases[rng.integers(0, 10, size=60)] + 0.3 * rng.normal(size=(60, 16)))
+
+    found = similar_pairs(matrix, 0.9, block_size)
+
+    assert _pairs(found) == _brute_force(matrix, 0.9)
+    np.testing.assert_allclose(found[2], np.sum(matrix[found[0]] * matrix[found[1]], axis=1), rtol=1e-5)
+
+
+def test_multi_frame_pairs_use_best_frame_pair():
+    rng = np.random.default_rng(1)
+    signatures = normalize_rows(rng.normal(size=(12, 3, 16)))
+    signatures[5, 2] = signatures[9, 0]  # One shared frame is enough
+    best = np.einsum("afd,bgd->abfg", signatures, signatures).max(axis=(2, 3))
+    expected = {(i, j) for i in range(12) for j in range(i + 1, 12) if best[i, j] > 0.99}
+
+    assert _pairs(similar_pairs(signatures, 0.99, block_size=6)) == expected
+    assert (5, 9) in expected
+
+
+def test_no_pairs():
+    rows, cols, sims = similar_pairs(np.eye(4, dtype=np.float32), 0.5)
+    assert len(rows) == len(cols) == len(sims) == 0
@@ -1,33 +1,24 @@
 import sys
 import os
 import threading
-import glob
-import csv
 from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QPushButton, QLabel, QProgressBar, QFileDialog, QWidget, QListWidget, QLineEdit
 from PyQt5.QtCore import pyqtSignal, QObject
 from PyQt5.QtGui import QDragEnterEvent, QDropEvent
-from PIL import Image
-import torch
-from main import process_videos, find_duplicates, process_duplicates, extract_frame, preprocess, model, device
-import subprocess
-
-def process_video(video_path):
-    filename = os.path.basename(video_path)
-    frame_path = os.path.join("temp_data", os.path.splitext(filename)[0] + ".jpg")
-    if extract_frame(video_path, frame_path):
-        try:
-            image = preprocess(Image.open(frame_path)).unsqueeze(0).to(device)
-            with torch.no_grad():
-                embedding = model.encode_image(image).cpu().numpy()
-            return video_path, embedding[0]
-        except:
-            return None, None
-    return None, None
+import multiprocessing
+from main import find_duplicates, process_duplicates, find_videos, open_store, embedding_dim, audio_check
+from probe import probe_videos
+from process_pool import embed_in_processes
+from journal import ScanJournal
+from results import ResultsDB
+from reports import write as write_report
+from metrics import Metrics, format_progress
+import config
 
 class ProcessingWorker(QObject):
     progress_signal = pyqtSignal(int)
     stop_signal = pyqtSignal()
     error_signal = pyqtSignal(str)
+    status_signal = pyqtSignal(str)
 
     def __init__(self, source_dirs, duplicate_folder_path):
         super().__init__()
@@ -35,36 +26,70 @@ class ProcessingWorker(QObject):
         self.duplicate_folder_path = duplicate_folder_path
         self.similarity_threshold = 0.95
         self._stop_requested = False
+        self.metrics = Metrics(listener=lambda progress: self.status_signal.emit(format_progress(progress)))
+
+    def stop(self):
+        self._stop_requested = True
 
     def run(self):
         try:
-            # Step 1: Process videos with multiprocessing
-            from multiprocessing import Pool
-
-            video_files = []
-            for dir_path in self.source_dirs:
-                video_files.extend(glob.glob(os.path.join(dir_path, "**", "*.mp4"), recursive=True))
-                video_files.extend(glob.glob(os.path.join(dir_path, "**", "*.ts"), recursive=True))
-
-            with Pool() as pool:
-                results = pool.map(process_video, video_files)
-
-            video_embeddings = {path: emb for path, emb in results if path and emb}
+            # Step 1: Process videos in worker processes that each load the model once
+            os.makedirs(config.FRAME_DIR, exist_ok=True)
+            store = open_store()
+            journal = ScanJournal(store).start(self.source_dirs)
+            video_files = find_videos(self.source_dirs, stats=self.metrics)
+            candidates = journal.skip_failed(video_files)
+            video_embeddings, pending = store.split_cached(candidates)
+            journal.set_total(len(video_files), len(candidates) - len(pending), len(video_files) - len(candidates))
+
+            if pending:
+                self.metrics.set_total("files", len(pending))
+                metadata = probe_videos(pending, store, stats=self.metrics)
+                failures = {}
+                results = embed_in_processes(
+                    pending, embedding_dim(), config.SIGNATURE_FRAMES, workers=config.EMBED_PROCESSES or None,
+                    metadata=metadata, should_stop=lambda: self._stop_requested, failures=failures,
+                )
+                try:
+                    for path, emb in results:
+                        if emb is not None:
+                            video_embeddings[path] = emb
+                            journal.record(path, emb, video_files[path])
+                        else:
+                            journal.fail(path, failures.get(path, "no frame decoded"), video_files[path])
+                        self.metrics.count("files")
+                        # Resumed and cached files count as done
+                        self.progress_signal.emit(int(33 * journal.progress()))
+                except BaseException:
+                    journal.stop()
+                    raise
+            if self._stop_requested:
+                journal.stop()
+                store.close()
+                self.stop_signal.emit()
+                return
+            store.prune(video_files, self.source_dirs)
+            journal.finish()
             self.progress_signal.emit(33)
+            self.status_signal.emit(f"Matching {len(video_embeddings)} videos...")
 
             # Step 2: Find duplicates
-            groups = find_duplicates(video_embeddings, similarity_threshold=self.similarity_threshold)
+            groups = find_duplicates(video_embeddings, similarity_threshold=self.similarity_threshold,
+                                     stats=self.metrics, audio=audio_check(store, self.metrics))
             self.progress_signal.emit(66)
+            self.status_signal.emit("Moving duplicates...")
 
             # Step 3: Process duplicates and generate report
-            process_duplicates(groups, keep_best=True, duplicate_dir=self.duplicate_folder_path)
+            results = ResultsDB(config.results_db_path())
+            process_duplicates(groups, keep_best=True, duplicate_dir=self.duplicate_folder_path, store=store,
+                               stats=self.metrics, results=results, threshold=self.similarity_threshold)
+            store.close()
+            # One row per file of every group, with its keeper/move action and where it was moved
             report_path = os.path.join(self.duplicate_folder_path, "duplicate_report.csv")
-            with open(report_path, "w", newline="") as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(["Duplicate Group", "Files"])
-                for i, group in enumerate(groups):
-                    writer.writerow([f"Group {i+1}", ", ".join(group)])
+            write_report(results.iter_members(results.latest_run()), report_path)
+            results.close()
             self.progress_signal.emit(100)
+            self.status_signal.emit(f"Done: {self.metrics.summary()}")
         except Exception as e:
             self.error_signal.emit(str(e))
 
@@ -99,7 +124,7 @@ class VideoDuplicateManagerUI(QMainWindow):
         self.status_label = QLabel("Status: Ready")
 
         # Temporary data location
-        self.temp_data_label = QLabel(f"Temporary Data Location: {os.path.abspath('temp_data')}")
+        self.temp_data_label = QLabel(f"Temporary Data Location: {os.path.abspath(config.FRAME_DIR)}")
 
         # Similarity threshold input
         self.similarity_threshold_input = QLineEdit()
@@ -182,6 +207,7 @@ class VideoDuplicateManagerUI(QMainWindow):
         self.worker.progress_signal.connect(self.update_progress)
         self.worker.stop_signal.connect(self.processing_stopped)
         self.worker.error_signal.connect(self.display_error)
+        self.worker.status_signal.connect(self.status_label.setText)
 
         self.processing_thread = threading.Thread(target=self.worker.run)
         self.processing_thread.start()
@@ -201,47 +227,9 @@ class VideoDuplicateManagerUI(QMainWindow):
     def display_error(self, error_message):
         self.status_label.setText(f"Error: {error_message}")
 
-def extract_frame(video_path, output_path):
-    """Robust frame extraction with multiple fallback methods"""
-    for seek_time in ["00:05:00", "00:02:00", "00:10:00"]:
-        try:
-            cmd = [
-                "ffmpeg",
-                "-ss", seek_time,
-                "-i", video_path,
-                "-vframes", "1",
-                "-q:v", "2",
-                "-f", "image2",
-                "-y",
-                output_path
-            ]
-            subprocess.run(cmd, check=True, stderr=subprocess.PIPE, stdout=subprocess.PIPE, timeout=10, creationflags=subprocess.CREATE_NO_WINDOW)
-            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                return True
-        except:
-            continue
-    
-    try:
-        cmd = [
-            "ffmpeg",
-            "-ss", "00:05:00",
-            "-i", video_path,
-            "-vframes", "1",
-            "-f", "rawvideo",
-            "-pix_fmt", "rgb24",
-            "-s", "1920x1080",
-            "-y",
-            "-"
-        ]
-        result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10, creationflags=subprocess.CREATE_NO_WINDOW)
-        if result.stdout:
-            img = Image.frombytes('RGB', (1920, 1080), result.stdout)
-            img.save(output_path, "JPEG", quality=90)
-            return True
-    except:
-        return False
-
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    config.load_config()
     app = QApplication(sys.argv)
     window = VideoDuplicateManagerUI()
     window.show()
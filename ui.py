@@ -1,92 +1,93 @@
 import sys
 import os
 import threading
-import glob
-import csv
-from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QPushButton, QLabel, QProgressBar, QFileDialog, QWidget, QListWidget, QLineEdit
+import multiprocessing
+from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QPushButton, QLabel, QProgressBar, QFileDialog, QWidget, QListWidget, QLineEdit, QCheckBox
 from PyQt5.QtCore import pyqtSignal, QObject
 from PyQt5.QtGui import QDragEnterEvent, QDropEvent
-from PIL import Image
-import torch
-from main import process_videos, find_duplicates, process_duplicates, extract_frame, preprocess, model, device
-import subprocess
-
-# Ensure GPU utilization
-if torch.cuda.is_available():
-    device = torch.device("cuda")
-else:
-    device = torch.device("cpu")
-
-def process_video(video_path):
-    filename = os.path.basename(video_path)
-    frame_path = os.path.join("temp_data", os.path.splitext(filename)[0] + ".jpg")
-    if extract_frame(video_path, frame_path):
-        try:
-            image = preprocess(Image.open(frame_path)).unsqueeze(0).to(device)
-            with torch.no_grad():
-                embedding = model.encode_image(image).cpu().numpy()
-            return video_path, embedding[0]
-        except:
-            return None, None
-    return None, None
-
-def process_video_with_progress(video_path, progress_callback, total_videos):
-    result = process_video(video_path)
-    progress_callback()
-    return result
-
-def update_progress(processed_count, total_videos, progress_signal):
-    progress = int((processed_count / total_videos) * 100)
-    progress_signal.emit(progress)
+from main import find_duplicates, process_duplicates, process_videos, open_store, record_run, group_members, audio_check
+from probe import probe_videos
+from review import ReviewWindow
+from prefilter import Cascade
+from journal import ScanJournal
+from results import ResultsDB
+from metrics import Metrics, format_progress
+import config
 
 class ProcessingWorker(QObject):
     progress_signal = pyqtSignal(int)
     stop_signal = pyqtSignal()
     error_signal = pyqtSignal(str)
+    status_signal = pyqtSignal(str)
+    review_signal = pyqtSignal(int)
 
     def __init__(self, source_dirs, duplicate_folder_path):
         super().__init__()
         self.source_dirs = source_dirs
         self.duplicate_folder_path = duplicate_folder_path
         self.similarity_threshold = 0.95
+        self.review = True  # Record the groups for the review window instead of moving right away
         self._stop_requested = False
+        # Throughput, ETA and queue depth for the status label, at most four times a second
+        self.metrics = Metrics(listener=lambda progress: self.status_signal.emit(format_progress(progress)))
+
+    def stop(self):
+        self._stop_requested = True
+
+    def report_progress(self, journal):
+        # Embedding is the first third of the bar; resumed and cached files count as done
+        fraction = journal.progress()
+        if fraction is not None:
+            self.progress_signal.emit(int(33 * fraction))
 
     def run(self):
         try:
-            # Step 1: Process videos
-            video_embeddings = {}
-            video_files = []
-            for dir_path in self.source_dirs:
-                if self._stop_requested:
-                    self.stop_signal.emit()
-                    return
-                video_files.extend(glob.glob(os.path.join(dir_path, "**", "*.mp4"), recursive=True))
-                video_files.extend(glob.glob(os.path.join(dir_path, "**", "*.ts"), recursive=True))
-
-            for i, video_path in enumerate(video_files):
-                if self._stop_requested:
-                    self.stop_signal.emit()
-                    return
-                filename = os.path.basename(video_path)
-                frame_path = os.path.join("temp_data", os.path.splitext(filename)[0] + ".jpg")
-                if extract_frame(video_path, frame_path):
-                    try:
-                        image = preprocess(Image.open(frame_path)).unsqueeze(0).to(device)
-                        with torch.no_grad():
-                            embedding = model.encode_image(image).cpu().numpy()
-                        video_embeddings[video_path] = embedding[0]
-                    except:
-                        continue
+            # Step 1: Process videos, skipping ones already in the embedding cache
+            os.makedirs(config.FRAME_DIR, exist_ok=True)
+            store = open_store()
+            journal = ScanJournal(store).start(self.source_dirs)
+            cascade = Cascade() if config.PREFILTER else None
+            video_embeddings = process_videos(self.source_dirs, store, cascade, journal,
+                                              should_stop=lambda: self._stop_requested,
+                                              on_progress=self.report_progress, stats=self.metrics)
+            if self._stop_requested:
+                store.close()
+                self.stop_signal.emit()
+                return
+            self.progress_signal.emit(33)
+            self.status_signal.emit(f"Matching {len(video_embeddings)} videos...")
 
             # Step 2: Find duplicates
-            groups = find_duplicates(video_embeddings, similarity_threshold=self.similarity_threshold)
+            groups = find_duplicates(video_embeddings, similarity_threshold=self.similarity_threshold,
+                                     extra_edges=cascade.edges if cascade else None, stats=self.metrics,
+                                     audio=audio_check(store, self.metrics))
 
             if self._stop_requested:
+                store.close()
                 self.stop_signal.emit()
                 return
+            self.progress_signal.emit(66)
+            results = ResultsDB(config.results_db_path())
+            if self.review:
+                # Step 3: Record the groups; files are moved from the review window
+                self.status_signal.emit("Recording duplicates for review...")
+                metadata = probe_videos(group_members(groups), store, stats=self.metrics)
+                run_id = record_run(results, groups, metadata, "matched", self.similarity_threshold)
+                results.close()
+                store.close()
+                self.progress_signal.emit(100)
+                self.review_signal.emit(run_id)
+                self.status_signal.emit(f"Ready for review: {self.metrics.summary()}")
+                return
 
             # Step 3: Process duplicates
-            process_duplicates(groups, keep_best=True, duplicate_dir=self.duplicate_folder_path)
+            self.status_signal.emit("Moving duplicates...")
+            process_duplicates(groups, keep_best=True, duplicate_dir=self.duplicate_folder_path, store=store,
+                               stats=self.metrics, results=results, threshold=self.similarity_threshold)
+            results.close()
+            store.close()
+            self.progress_signal.emit(100)
+            self.status_signal.emit(f"Done: {self.metrics.summary()}")
         except Exception as e:
             self.error_signal.emit(str(e))
 
@@ -112,6 +113,9 @@ class VideoDuplicateManagerUI(QMainWindow):
         self.set_duplicate_folder_button = QPushButton("Set Duplicate Folder")
         self.start_button = QPushButton("Start Processing")
         self.stop_button = QPushButton("Stop")
+        self.review_button = QPushButton("Review Duplicates")
+        self.review_checkbox = QCheckBox("Review duplicates before moving")
+        self.review_checkbox.setChecked(True)
 
         # Progress bar
         self.progress_bar = QProgressBar()
@@ -121,7 +125,7 @@ class VideoDuplicateManagerUI(QMainWindow):
         self.status_label = QLabel("Status: Ready")
 
         # Temporary data location
-        self.temp_data_label = QLabel(f"Temporary Data Location: {os.path.abspath('temp_data')}")
+        self.temp_data_label = QLabel(f"Temporary Data Location: {os.path.abspath(config.FRAME_DIR)}")
 
         # Similarity threshold input
         self.similarity_threshold_input = QLineEdit()
@@ -134,6 +138,8 @@ class VideoDuplicateManagerUI(QMainWindow):
         self.layout.addWidget(self.set_duplicate_folder_button)
         self.layout.addWidget(self.start_button)
         self.layout.addWidget(self.stop_button)
+        self.layout.addWidget(self.review_checkbox)
+        self.layout.addWidget(self.review_button)
         self.layout.addWidget(self.progress_bar)
         self.layout.addWidget(self.status_label)
         self.layout.addWidget(self.temp_data_label)
@@ -145,9 +151,11 @@ class VideoDuplicateManagerUI(QMainWindow):
         self.set_duplicate_folder_button.clicked.connect(self.set_duplicate_folder)
         self.start_button.clicked.connect(self.start_processing)
         self.stop_button.clicked.connect(self.stop_processing)
+        self.review_button.clicked.connect(lambda: self.open_review(None))
 
         # Duplicate folder path
         self.duplicate_folder_path = ""
+        self.review_window = None
 
         # Enable drag-and-drop
         self.setAcceptDrops(True)
@@ -201,13 +209,29 @@ class VideoDuplicateManagerUI(QMainWindow):
 
         self.worker = ProcessingWorker(source_dirs, self.duplicate_folder_path)
         self.worker.similarity_threshold = self.similarity_threshold
+        self.worker.review = self.review_checkbox.isChecked()
+        self.worker.review_signal.connect(self.open_review)
         self.worker.progress_signal.connect(self.update_progress)
         self.worker.stop_signal.connect(self.processing_stopped)
         self.worker.error_signal.connect(self.display_error)
+        self.worker.status_signal.connect(self.status_label.setText)
 
         self.processing_thread = threading.Thread(target=self.worker.run)
         self.processing_thread.start()
 
+    def open_review(self, run_id):
+        # Opens on the latest run when run_id is None
+        if self.review_window is None or not self.review_window.isVisible():
+            self.review_window = ReviewWindow(config.results_db_path(), run_id,
+                                              duplicate_dir=self.duplicate_folder_path or None)
+        else:
+            if self.duplicate_folder_path:
+                self.review_window.duplicate_dir = self.duplicate_folder_path
+            if run_id is not None:
+                self.review_window.show_run(run_id)
+        self.review_window.show()
+        self.review_window.raise_()
+
     def stop_processing(self):
         if hasattr(self, 'worker') and self.worker:
             self.worker.stop()
@@ -223,47 +247,9 @@ class VideoDuplicateManagerUI(QMainWindow):
     def display_error(self, error_message):
         self.status_label.setText(f"Error: {error_message}")
 
-def extract_frame(video_path, output_path):
-    """Robust frame extraction with multiple fallback methods"""
-    for seek_time in ["00:05:00", "00:02:00", "00:10:00"]:
-        try:
-            cmd = [
-                "ffmpeg",
-                "-ss", seek_time,
-                "-i", video_path,
-                "-vframes", "1",
-                "-q:v", "2",
-                "-f", "image2",
-                "-y",
-                output_path
-            ]
-            subprocess.run(cmd, check=True, stderr=subprocess.PIPE, stdout=subprocess.PIPE, timeout=10, creationflags=subprocess.CREATE_NO_WINDOW)
-            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                return True
-        except:
-            continue
-    
-    try:
-        cmd = [
-            "ffmpeg",
-            "-ss", "00:05:00",
-            "-i", video_path,
-            "-vframes", "1",
-            "-f", "rawvideo",
-            "-pix_fmt", "rgb24",
-            "-s", "1920x1080",
-            "-y",
-            "-"
-        ]
-        result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10, creationflags=subprocess.CREATE_NO_WINDOW)
-        if result.stdout:
-            img = Image.frombytes('RGB', (1920, 1080), result.stdout)
-            img.save(output_path, "JPEG", quality=90)
-            return True
-    except:
-        return False
-
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    config.load_config()
     app = QApplication(sys.argv)
     window = VideoDuplicateManagerUI()
     window.show()